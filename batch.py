@@ -0,0 +1,219 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from game import Board, PackedBoard, other_player
+
+# == Batched board engine =====================================================
+
+# Many boards held as rows of an (N, 14) array, in the same layout as
+# Board.board. Players are numbered so they can live in arrays too.
+PLAYER_B = 0
+PLAYER_A = 1
+PLAYER_NAMES = ('B', 'A')
+
+STORES = np.array([6, 13])
+OPPONENT_STORES = (13, 6)
+
+# sowing visits every index except the opponent's store, so it repeats every 13
+CYCLE_LEN = 13
+OFFSETS = np.arange(1, CYCLE_LEN + 1)
+
+
+# CYCLES[player, pit] lists the 13 indices seeds from pit are sown into, in
+# order; the pit itself comes last (reached on a full lap)
+def build_cycles():
+    cycles = np.zeros((2, 14, CYCLE_LEN), dtype=np.intp)
+    for player in (PLAYER_B, PLAYER_A):
+        for pit_num in range(14):
+            i = pit_num
+            k = 0
+            while k < CYCLE_LEN:
+                i = (i + 1) % 14
+                # skip opponent's store (home)
+                if i == OPPONENT_STORES[player]:
+                    continue
+                cycles[player, pit_num, k] = i
+                k += 1
+    return cycles
+
+
+CYCLES = build_cycles()
+
+
+class BatchBoards:
+    def __init__(self, num_boards):
+        start = np.array(Board().board, dtype=np.int16)
+        self.boards = np.tile(start, (num_boards, 1))
+
+    def __len__(self):
+        return len(self.boards)
+
+    # Sows from pits[j] for players[j] on board rows[j] (all boards if rows is
+    # None), then performs any resulting capture, like Board.move_seeds followed
+    # by Board.perform_capture. Returns boolean arrays (extra_move, capture,
+    # terminal) aligned with rows.
+    def move_seeds(self, pits, players, rows=None):
+        if rows is None:
+            rows = np.arange(len(self.boards))
+        pits = np.asarray(pits, dtype=np.intp)
+        players = np.asarray(players, dtype=np.intp)
+        boards = self.boards
+
+        seeds = boards[rows, pits].astype(np.intp)
+        boards[rows, pits] = 0
+
+        # the k-th index of the cycle gets one seed per lap that reaches it
+        targets = CYCLES[players, pits]
+        boards[rows[:, None], targets] += np.maximum(0, (seeds[:, None] - OFFSETS + CYCLE_LEN) // CYCLE_LEN)
+
+        # where the last seed landed (an empty pit sows nothing and stays put)
+        last = targets[np.arange(len(rows)), (seeds - 1) % CYCLE_LEN]
+        last = np.where(seeds > 0, last, pits)
+
+        # if last seed lands in store, active player gets an extra turn
+        extra_move = (seeds > 0) & (last == STORES[players])
+
+        # capture: last seed alone in one of the player's own pits, opposite a
+        # non-empty pit
+        own_pit = (last // 7 == players) & (last != STORES[players])
+        opposite = np.where(own_pit, 12 - last, 0)
+        capture = (own_pit & (boards[rows, last] == 1) & (boards[rows, opposite] > 0))
+
+        if capture.any():
+            capture_rows = rows[capture]
+            capturing_pits = last[capture]
+            captured_pits = opposite[capture]
+            stores = STORES[players[capture]]
+            boards[capture_rows, stores] += boards[capture_rows, capturing_pits] + boards[capture_rows, captured_pits]
+            boards[capture_rows, capturing_pits] = 0
+            boards[capture_rows, captured_pits] = 0
+
+        return extra_move, capture, self.players_done(rows).any(axis=1)
+
+    # (user done, computer done) per row, like Board.players_done
+    def players_done(self, rows=None):
+        if rows is None:
+            rows = np.arange(len(self.boards))
+        boards = self.boards[rows]
+        return np.stack([boards[:, 0:6].sum(axis=1) == 0, boards[:, 7:13].sum(axis=1) == 0], axis=1)
+
+    # a uniformly random non-empty pit of players[j] on each board rows[j]
+    def random_actions(self, players, rows, rng):
+        first_pits = np.asarray(players, dtype=np.intp) * 7
+        pits = first_pits[:, None] + np.arange(6)
+        weights = rng.random(pits.shape) * (self.boards[rows[:, None], pits] > 0)
+        return first_pits + weights.argmax(axis=1)
+
+    # (B score, A score) per board, like Board.tally_up
+    def tally_up(self):
+        return np.stack([self.boards[:, 0:7].sum(axis=1), self.boards[:, 7:14].sum(axis=1)], axis=1)
+
+
+# Plays num_boards random games to the end at once. Returns the finished
+# boards and the total number of moves made.
+def play_random_games(num_boards, seed=0):
+    rng = np.random.default_rng(seed)
+    batch = BatchBoards(num_boards)
+    players = np.full(num_boards, PLAYER_B, dtype=np.intp)
+    rows = np.arange(num_boards)
+    num_moves = 0
+
+    while len(rows):
+        pits = batch.random_actions(players[rows], rows, rng)
+        extra_move, capture, terminal = batch.move_seeds(pits, players[rows], rows)
+        num_moves += len(rows)
+
+        # the mover goes again on an extra move, otherwise the other player
+        players[rows] = np.where(extra_move, players[rows], 1 - players[rows])
+        rows = rows[~terminal]
+
+    return batch, num_moves
+
+
+# The same random games one Board at a time, for comparison
+def play_random_games_scalar(num_boards, seed=0, board_class=Board):
+    rng = random.Random(seed)
+    num_moves = 0
+    for _ in range(num_boards):
+        board = board_class()
+        player = 'B'
+        while not board.at_terminal_state():
+            board.move_seeds(rng.choice(board.get_legal_actions(player)), player)
+            if board.get_capture():
+                board.perform_capture()
+            if board.gets_extra_move() != player:
+                player = other_player(player)
+            num_moves += 1
+    return num_moves
+
+
+# Plays random games on both engines with the same moves and checks that
+# every position, extra move, capture and terminal flag agrees (and that
+# Board's running totals stay correct along the way).
+# Returns the number of moves compared.
+def verify_against_board(num_boards, seed=0):
+    rng = np.random.default_rng(seed)
+    batch = BatchBoards(num_boards)
+    scalar = [Board() for _ in range(num_boards)]
+    players = np.full(num_boards, PLAYER_B, dtype=np.intp)
+    rows = np.arange(num_boards)
+    num_moves = 0
+
+    while len(rows):
+        pits = batch.random_actions(players[rows], rows, rng)
+        movers = players[rows]
+        extra_move, capture, terminal = batch.move_seeds(pits, movers, rows)
+
+        for j, row in enumerate(rows):
+            board = scalar[row]
+            player = PLAYER_NAMES[movers[j]]
+            board.move_seeds(int(pits[j]), player)
+            captured = board.get_capture() is not None
+            if captured:
+                board.perform_capture()
+            board.check_invariants()
+            if (board.board != batch.boards[row].tolist()
+                    or (board.gets_extra_move() == player) != extra_move[j]
+                    or captured != capture[j]
+                    or board.at_terminal_state() != terminal[j]):
+                raise AssertionError(f"Batch engine disagrees with Board on board {row} after pit {pits[j]}")
+
+        num_moves += len(rows)
+        players[rows] = np.where(extra_move, movers, 1 - movers)
+        rows = rows[~terminal]
+
+    return num_moves
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the batched board engine against Board.")
+    parser.add_argument("--boards", type=int, default=100000, help="games played at once by the batch engine")
+    parser.add_argument("--scalar-boards", type=int, default=2000, help="games played one at a time for comparison")
+    parser.add_argument("--verify", type=int, default=1000, help="games checked move by move against Board")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        num_moves = verify_against_board(args.verify, args.seed)
+        print(f"verified {num_moves} moves across {args.verify} games against Board")
+
+    tic = time.perf_counter()
+    batch, num_moves = play_random_games(args.boards, args.seed)
+    toc = time.perf_counter()
+    batch_rate = num_moves / (toc - tic)
+    print(f"batch:  {num_moves} moves in {toc - tic:.2f} s ({batch_rate:,.0f} moves/s)")
+
+    for name, board_class in (("Board", Board), ("PackedBoard", PackedBoard)):
+        tic = time.perf_counter()
+        num_moves = play_random_games_scalar(args.scalar_boards, args.seed, board_class)
+        toc = time.perf_counter()
+        rate = num_moves / (toc - tic)
+        print(f"{name}: {num_moves} moves in {toc - tic:.2f} s ({rate:,.0f} moves/s, "
+              f"batch is {batch_rate / rate:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
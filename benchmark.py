@@ -0,0 +1,253 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from game import MAX_SEARCH_DEPTH, Agent, Board, PackedBoard, other_player
+
+# == Benchmarks ===============================================================
+
+# Fixed positions: (name, category, board, player to move). In none of them
+# does the mover have an extra move or a capture, so every decision is a real
+# search rather than a shortcut; the openings are kept to ones a depth-8
+# search finishes in a minute or two
+CORPUS = [
+    ("opening-1", "opening", [1, 6, 6, 5, 0, 5, 3, 0, 0, 6, 0, 7, 7, 2], 'B'),
+    ("opening-2", "opening", [1, 6, 1, 2, 7, 6, 2, 2, 6, 0, 0, 7, 6, 2], 'B'),
+    ("opening-3", "opening", [7, 1, 8, 1, 3, 3, 4, 2, 8, 0, 7, 1, 0, 3], 'B'),
+    ("opening-4", "opening", [0, 6, 2, 1, 7, 7, 2, 5, 0, 5, 5, 0, 6, 2], 'A'),
+
+    # the opponent threatens both an extra move and a capture
+    ("tactical-1", "tactical", [1, 1, 1, 4, 4, 7, 15, 1, 0, 4, 0, 0, 0, 10], 'B'),
+    ("tactical-2", "tactical", [0, 3, 3, 7, 9, 1, 11, 0, 0, 0, 0, 1, 0, 13], 'A'),
+    ("tactical-3", "tactical", [0, 2, 2, 1, 2, 8, 15, 1, 1, 3, 0, 0, 7, 6], 'A'),
+    ("tactical-4", "tactical", [1, 0, 4, 6, 0, 2, 11, 7, 0, 2, 0, 3, 0, 12], 'A'),
+
+    # quieter positions: the opponent threatens one of the two at most
+    ("middlegame-1", "middlegame", [0, 0, 0, 3, 3, 7, 12, 0, 2, 0, 7, 0, 0, 14], 'A'),
+    ("middlegame-2", "middlegame", [0, 7, 0, 0, 0, 0, 12, 1, 1, 0, 0, 8, 8, 11], 'B'),
+    ("middlegame-3", "middlegame", [10, 0, 0, 0, 1, 1, 18, 1, 1, 0, 0, 4, 5, 7], 'A'),
+    ("middlegame-4", "middlegame", [2, 0, 0, 2, 5, 5, 13, 0, 1, 2, 0, 4, 2, 12], 'B'),
+
+    ("endgame-1", "endgame", [1, 3, 0, 0, 0, 3, 25, 0, 0, 0, 1, 0, 0, 15], 'B'),
+    ("endgame-2", "endgame", [0, 2, 0, 0, 0, 2, 15, 0, 1, 0, 0, 3, 2, 23], 'A'),
+    ("endgame-3", "endgame", [1, 0, 0, 4, 0, 2, 20, 0, 0, 0, 5, 0, 0, 16], 'A'),
+    ("endgame-4", "endgame", [1, 0, 0, 0, 3, 2, 24, 0, 0, 0, 0, 3, 3, 12], 'A'),
+]
+
+# metrics where a higher value is better; for all others lower is better
+HIGHER_IS_BETTER = ("nodes_per_sec", "mean_depth_reached")
+
+
+def make_board(board_class, board_list):
+    board = board_class()
+    board.board = list(board_list)
+    return board
+
+
+# nearest-rank percentile of a non-empty list
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# Average nanoseconds per call of move_seeds, get_legal_actions,
+# legal_actions and at_terminal_state over the corpus, for each board class
+def time_primitives(repeat):
+    results = {}
+    for board_class in (Board, PackedBoard):
+        name = board_class.__name__
+        boards = [(make_board(board_class, board_list), player) for _, _, board_list, player in CORPUS]
+
+        # move_seeds changes the board, so each call is preceded by a restore;
+        # the cost of restoring alone is measured and taken off
+        calls = 0
+        moves_time = 0.0
+        for board, player in boards:
+            saved = board.position_key()
+            actions = board.get_legal_actions(player)
+            for action in actions:
+                tic = time.perf_counter()
+                for _ in range(repeat):
+                    restore_board(board, saved)
+                    board.move_seeds(action, player)
+                toc = time.perf_counter()
+                for _ in range(repeat):
+                    restore_board(board, saved)
+                moves_time += (toc - tic) - (time.perf_counter() - toc)
+                calls += repeat
+            restore_board(board, saved)
+        results[f"{name}.move_seeds"] = {"ns_per_call": max(moves_time, 0.0) / calls * 1e9}
+
+        for method in ("get_legal_actions", "legal_actions", "at_terminal_state"):
+            tic = time.perf_counter()
+            for board, player in boards:
+                if method == "get_legal_actions":
+                    for _ in range(repeat):
+                        board.get_legal_actions(player)
+                elif method == "legal_actions":
+                    for _ in range(repeat):
+                        board.legal_actions(player)
+                else:
+                    for _ in range(repeat):
+                        board.at_terminal_state()
+            toc = time.perf_counter()
+            results[f"{name}.{method}"] = {"ns_per_call": (toc - tic) / (repeat * len(boards)) * 1e9}
+    return results
+
+
+def restore_board(board, saved):
+    if isinstance(board, PackedBoard):
+        board.state = saved
+    else:
+        board.board = list(saved)
+
+
+# Decision latency and search speed of a fresh agent on every corpus
+# position, per depth; agent_options are passed to every Agent (e.g. the
+# search refinements pvs, aspiration and lmr). With time_budget_ms, every
+# decision deepens iteratively until the budget runs out instead (which
+# aspiration windows need), and the depth it reaches is reported under the
+# budget. Peak memory comes from a separate traced pass so the tracing doesn't
+# slow the timed one.
+def time_decisions(depths, repeat, agent_options=None, time_budget_ms=None):
+    agent_options = agent_options or {}
+    if time_budget_ms is not None:
+        depths = [MAX_SEARCH_DEPTH]
+    results = {}
+    for depth in depths:
+        latencies = []
+        search_nodes = 0
+        search_seconds = 0.0
+        depths_reached = []
+        for _, _, board_list, player in CORPUS:
+            board = make_board(Board, board_list)
+            for _ in range(repeat):
+                agent = Agent(depth, player, other_player(player), **agent_options)
+                agent.get_next_action(board, time_budget_ms)
+                latencies.append(agent.stats.seconds)
+                if agent.stats.source == "search":
+                    search_nodes += agent.stats.nodes
+                    search_seconds += agent.stats.seconds
+                    depths_reached.append(agent.depth_reached)
+
+        tracemalloc.start()
+        peak = 0
+        for _, _, board_list, player in CORPUS:
+            tracemalloc.reset_peak()
+            agent = Agent(depth, player, other_player(player), **agent_options)
+            agent.get_next_action(make_board(Board, board_list), time_budget_ms)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        result = {
+            "decisions": len(latencies),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "mean_ms": sum(latencies) / len(latencies) * 1000,
+            "search_nodes": search_nodes,
+            "nodes_per_sec": search_nodes / search_seconds if search_seconds else 0.0,
+            "peak_memory_bytes": peak,
+        }
+        if time_budget_ms is None:
+            results[f"depth_{depth}"] = result
+        else:
+            result["mean_depth_reached"] = sum(depths_reached) / len(depths_reached) if depths_reached else 0.0
+            results[f"budget_{time_budget_ms:g}ms"] = result
+    return results
+
+
+def run_benchmarks(depths, primitive_repeat=2000, decision_repeat=1, agent_options=None, time_budget_ms=None):
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.time(),
+        "corpus": [name for name, _, _, _ in CORPUS],
+        "agent_options": agent_options or {},
+        "time_budget_ms": time_budget_ms,
+        "primitives": time_primitives(primitive_repeat),
+        "decisions": time_decisions(depths, decision_repeat, agent_options, time_budget_ms),
+    }
+
+    # one flat name -> value table, which is what baselines are compared on
+    metrics = {}
+    for section in ("primitives", "decisions"):
+        for group, values in report[section].items():
+            for key, value in values.items():
+                if key not in ("decisions", "search_nodes"):
+                    metrics[f"{group}.{key}"] = value
+    report["metrics"] = metrics
+    return report
+
+
+# Metrics that got worse than the baseline by more than threshold (a
+# fraction), as (name, baseline, current) tuples
+def find_regressions(report, baseline, threshold):
+    regressions = []
+    for name, old in baseline["metrics"].items():
+        new = report["metrics"].get(name)
+        if new is None or not old:
+            continue
+        if name.endswith(HIGHER_IS_BETTER):
+            worse = new < old * (1 - threshold)
+        else:
+            worse = new > old * (1 + threshold)
+        if worse:
+            regressions.append((name, old, new))
+    return regressions
+
+
+# "2-6" -> [2, 3, 4, 5, 6]; "2,4,8" -> [2, 4, 8]
+def parse_depths(text):
+    depths = []
+    for part in text.split(","):
+        low, _, high = part.partition("-")
+        depths.extend(range(int(low), int(high or low) + 1))
+    return depths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the board engine and agent on a fixed position corpus.")
+    parser.add_argument("--depths", default="2-8", help='agent depths, e.g. "2-6" for a quick run or "2,4"')
+    parser.add_argument("--repeat", type=int, default=1, help="decisions timed per position and depth")
+    parser.add_argument("--primitive-repeat", type=int, default=2000, help="calls timed per primitive and position")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed slowdown against the baseline (0.10 = 10%%)")
+    parser.add_argument("--pvs", action="store_true", help="agents use principal variation search")
+    parser.add_argument("--aspiration", action="store_true",
+                        help="agents use aspiration windows (needs --time-budget-ms)")
+    parser.add_argument("--lmr", action="store_true", help="agents use late-move reductions")
+    parser.add_argument("--time-budget-ms", type=float,
+                        help="time each decision by iterative deepening with this budget instead of per depth")
+    args = parser.parse_args(argv)
+    if args.aspiration and args.time_budget_ms is None:
+        parser.error("aspiration windows only apply to iterative deepening: add --time-budget-ms")
+
+    agent_options = {name: True for name in ("pvs", "aspiration", "lmr") if getattr(args, name)}
+    report = run_benchmarks(parse_depths(args.depths), args.primitive_repeat, args.repeat, agent_options,
+                            args.time_budget_ms)
+
+    for name, value in report["metrics"].items():
+        print(f"{name:45} {value:16,.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.threshold)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:,.1f} -> {new:,.1f}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from game import Agent, Board, apply_move, other_player
+
+# == Opening book =============================================================
+
+# Best moves for the positions reachable in the first few plies, found offline
+# by deep searches. Positions are keyed by Board.canonical_hash, the hash of
+# the board as seen by the player to move (their pits and store first, then
+# the opponent's) that the search caches use too, so one entry serves both
+# seats; moves are stored as 0-5 on the mover's side.
+#
+# File layout: a 16-byte header (magic, slot count, entry count) followed by
+# an open-addressing hash table of 9-byte slots (64-bit key, move). Key 0
+# marks an empty slot. Lookups probe linearly from key % slot count.
+
+MAGIC = b'KALAHBK1'
+HEADER = struct.Struct('<8sII')
+SLOT = struct.Struct('<QB')
+
+
+# the book key of board with player to move; never 0, which marks empty slots
+def canonical_key(board: Board, player):
+    return board.canonical_hash(player) or 1
+
+
+# Every distinct (board, player to move) reachable from the start in at most
+# plies moves, excluding finished games
+def opening_positions(plies):
+    positions = {}
+    frontier = [(Board().board, 'B')]
+    for ply in range(plies + 1):
+        next_frontier = []
+        for board_list, player in frontier:
+            board = Board()
+            board.board = board_list
+            key = canonical_key(board, player)
+            if key in positions:
+                continue
+            positions[key] = (board_list, player)
+            if ply == plies:
+                continue
+
+            for pit_num in board.legal_actions(player):
+                board.board = list(board_list)
+                next_player = apply_move(board, pit_num, player)
+                if not board.at_terminal_state():
+                    next_frontier.append((board.board, next_player))
+        frontier = next_frontier
+    return positions
+
+
+# Runs in a worker process: the move a deep-searching agent picks, on the
+# mover's side (0-5)
+def search_position(board_list, player, depth, time_budget_ms):
+    board = Board()
+    board.board = board_list
+    agent = Agent(depth, player, other_player(player))
+    action = agent.get_next_action(board, time_budget_ms)
+    return action - board.first_pit(player)
+
+
+# Searches every opening position and writes the book to path.
+# Returns the number of positions stored.
+def build_book(path, plies, depth, time_budget_ms=None, workers=None, progress=None):
+    positions = opening_positions(plies)
+    keys = list(positions)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(search_position, positions[key][0], positions[key][1], depth, time_budget_ms)
+                   for key in keys]
+        moves = {}
+        for key, future in zip(keys, futures):
+            moves[key] = future.result()
+            if progress:
+                progress(len(moves), len(keys))
+
+    write_book(path, moves)
+    return len(moves)
+
+
+def write_book(path, moves):
+    # keep the table at most half full so probes stay short
+    num_slots = 1
+    while num_slots < 2 * len(moves):
+        num_slots *= 2
+
+    slots = [None] * num_slots
+    for key, move in moves.items():
+        slot = key % num_slots
+        while slots[slot] is not None:
+            slot = (slot + 1) % num_slots
+        slots[slot] = (key, move)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, num_slots, len(moves)))
+        for entry in slots:
+            f.write(SLOT.pack(*(entry or (0, 0))))
+
+
+# Read-only view of a book file; the file is only mapped on the first lookup
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.num_slots = 0
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        with open(self.path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_slots, num_entries = HEADER.unpack_from(self.data)
+        if magic != MAGIC or len(self.data) != HEADER.size + self.num_slots * SLOT.size:
+            raise ValueError(f"{self.path} is not an opening book")
+
+    # the book move for player (a board index), or None if the position isn't in the book
+    def lookup(self, board: Board, player):
+        if self.data is None:
+            self.open()
+
+        key = canonical_key(board, player)
+        slot = key % self.num_slots
+        while True:
+            slot_key, move = SLOT.unpack_from(self.data, HEADER.size + slot * SLOT.size)
+            if slot_key == key:
+                self.hits += 1
+                return move + board.first_pit(player)
+            if slot_key == 0:
+                self.misses += 1
+                return None
+            slot = (slot + 1) % self.num_slots
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an opening book from deep agent searches.")
+    parser.add_argument("--plies", type=int, default=4, help="book covers positions up to this many moves in")
+    parser.add_argument("--depth", type=int, default=6, help="search depth for each book position")
+    parser.add_argument("--time-budget-ms", type=float, help="search each position by iterative deepening instead")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--output", default="book.bin", help="book file to write")
+    args = parser.parse_args(argv)
+
+    tic = time.perf_counter()
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            print(f"{done}/{total} positions searched ({time.perf_counter() - tic:.1f} s)")
+
+    count = build_book(args.output, args.plies, args.depth, args.time_budget_ms, args.workers, progress)
+    print(f"wrote {count} positions to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
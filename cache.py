@@ -0,0 +1,250 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from collections import OrderedDict
+
+from game import Agent, Board, other_player
+
+# == Persistent search cache ==================================================
+
+# Results of root searches (value, best action relative to the mover's first
+# pit, and whether the depth limit was reached), kept across games and
+# processes. Entries are keyed by (position hash, depth, variant), where the
+# position hash is Board.canonical_hash for the player to move, so both seats
+# share entries, and the variant tells apart agent settings that change
+# results (see Agent.cache_variant).
+#
+# Recently used entries live in memory under an LRU cap. They are snapshotted
+# to a file that the next process maps at startup and reads through on a
+# memory miss. File layout: a 16-byte header (magic, slot count, entry count)
+# followed by an open-addressing hash table of 20-byte slots (position hash,
+# depth, variant, action, flags, value). Position hash 0 marks an empty
+# slot; lookups probe linearly from position hash % slot count.
+
+MAGIC = b'KALAHSC2'
+HEADER = struct.Struct('<8sII')
+SLOT = struct.Struct('<QBBBBd')
+
+# rough memory cost of one in-memory entry, for sizing the LRU cap
+CACHE_ENTRY_BYTES = 256
+
+FLAG_HIT_HORIZON = 1
+
+# one cache per path and process, shared by every agent that uses it
+open_caches = {}
+
+
+def shared_cache(path, size_mb=64, snapshot_interval=60.0):
+    cache = open_caches.get(path)
+    if cache is None:
+        cache = SearchCache(path, size_mb, snapshot_interval)
+        open_caches[path] = cache
+    return cache
+
+
+class SearchCache:
+    def __init__(self, path=None, size_mb=64, snapshot_interval=60.0):
+        self.path = path
+        self.max_entries = max(1, size_mb * 2 ** 20 // CACHE_ENTRY_BYTES)
+
+        # key -> (value, action, hit_horizon), least recently used first
+        self.entries = OrderedDict()
+
+        # the last snapshot, mapped read-only
+        self.data = None
+        self.num_slots = 0
+        if path and os.path.exists(path):
+            self.open()
+
+        # seconds between snapshots written by put(); None only writes them
+        # on flush()
+        self.snapshot_interval = snapshot_interval
+        self.last_snapshot = time.monotonic()
+        self.dirty = False
+
+        self.hits = 0
+        self.file_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def open(self):
+        with open(self.path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_slots, num_entries = HEADER.unpack_from(self.data)
+        if magic != MAGIC or len(self.data) != HEADER.size + self.num_slots * SLOT.size:
+            self.data.close()
+            self.data = None
+            raise ValueError(f"{self.path} is not a search cache")
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+        if self.data is not None:
+            result = self.lookup_file(key)
+            if result is not None:
+                self.file_hits += 1
+                self.remember(key, result)
+                return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        self.stores += 1
+        self.remember(key, result)
+        self.dirty = True
+        if (self.path and self.snapshot_interval is not None
+                and time.monotonic() - self.last_snapshot >= self.snapshot_interval):
+            self.snapshot()
+
+    def remember(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def lookup_file(self, key):
+        position_hash, depth, variant = key
+        slot = position_hash % self.num_slots
+        while True:
+            (slot_hash, slot_depth, slot_variant, action, flags,
+             value) = SLOT.unpack_from(self.data, HEADER.size + slot * SLOT.size)
+            if slot_hash == 0:
+                return None
+            if (slot_hash, slot_depth, slot_variant) == key:
+                return value, action, bool(flags & FLAG_HIT_HORIZON)
+            slot = (slot + 1) % self.num_slots
+
+    # every entry of the snapshot file at path, or nothing if there isn't one
+    def read_file(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, num_slots, num_entries = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            return
+        for slot_hash, depth, variant, action, flags, value in SLOT.iter_unpack(data[HEADER.size:]):
+            if slot_hash:
+                yield (slot_hash, depth, variant), (value, action, bool(flags & FLAG_HIT_HORIZON))
+
+    # Writes the in-memory entries, topped up with the ones already on disk
+    # (which another process may have written since this one started), to the
+    # snapshot file, then maps the new file
+    def snapshot(self):
+        entries = dict(reversed(self.entries.items()))
+        for key, result in self.read_file(self.path):
+            if len(entries) >= self.max_entries:
+                break
+            entries.setdefault(key, result)
+
+        # keep the table at most half full so probes stay short
+        num_slots = 1
+        while num_slots < 2 * len(entries):
+            num_slots *= 2
+
+        slots = [None] * num_slots
+        for key in entries:
+            slot = key[0] % num_slots
+            while slots[slot] is not None:
+                slot = (slot + 1) % num_slots
+            slots[slot] = key
+
+        # write to the side and swap it in, so readers never see half a file
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, num_slots, len(entries)))
+            empty = SLOT.pack(0, 0, 0, 0, 0, 0.0)
+            for key in slots:
+                if key is None:
+                    f.write(empty)
+                    continue
+                position_hash, depth, variant = key
+                value, action, hit_horizon = entries[key]
+                f.write(SLOT.pack(position_hash, depth, variant, action,
+                                  FLAG_HIT_HORIZON if hit_horizon else 0, value))
+        os.replace(tmp_path, self.path)
+
+        if self.data is not None:
+            self.data.close()
+        self.open()
+        self.last_snapshot = time.monotonic()
+        self.dirty = False
+
+    # writes a snapshot if anything was stored since the last one
+    def flush(self):
+        if self.path and self.dirty:
+            self.snapshot()
+
+    def stats(self):
+        lookups = self.hits + self.file_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "file_hits": self.file_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.file_hits) / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        self.flush()
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        if open_caches.get(self.path) is self:
+            del open_caches[self.path]
+
+
+# Decision latencies (seconds) of agents at depth on every corpus position,
+# and the cache they shared (None without cache_path)
+def time_decisions(depth, cache_path=None):
+    from benchmark import CORPUS
+
+    latencies = []
+    for _, _, board_list, player in CORPUS:
+        board = Board()
+        board.board = list(board_list)
+        agent = Agent(depth, player, other_player(player), cache_path=cache_path)
+        agent.get_next_action(board)
+        latencies.append(agent.stats.seconds)
+        agent.close()
+    return latencies, agent.cache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold vs warm decision latency with a search cache.")
+    parser.add_argument("--path", default="cache.bin", help="cache file (created if missing)")
+    parser.add_argument("--depth", type=int, default=6, help="agent search depth")
+    args = parser.parse_args(argv)
+
+    def report(name, latencies):
+        latencies = sorted(latencies)
+        print(f"{name:6} mean {sum(latencies) / len(latencies) * 1000:9.1f} ms, "
+              f"p50 {latencies[len(latencies) // 2] * 1000:9.1f} ms, max {latencies[-1] * 1000:9.1f} ms")
+
+    report("cold", time_decisions(args.depth)[0])
+
+    # fill the cache, then start over from the file alone, like a new process
+    latencies, cache = time_decisions(args.depth, args.path)
+    cache.close()
+    latencies, cache = time_decisions(args.depth, args.path)
+    report("warm", latencies)
+
+    stats = cache.stats()
+    print(f"warm run: {stats['hits'] + stats['file_hits']} hits, {stats['misses']} misses "
+          f"(hit rate {stats['hit_rate']:.2f})")
+    cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,499 @@
+import argparse
+import ipaddress
+import json
+import os
+import secrets
+import socket
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from multiprocessing import Process
+from multiprocessing.managers import BaseManager
+
+from book import opening_positions, search_position, write_book
+from records import analyze_batch, open_archive, position_batches, read_records, report_skipped, write_record
+from tournament import game_specs, parse_agent_spec, play_game, summarize
+
+# == Distributed work ==========================================================
+
+# A coordinator serves a work queue over a socket (multiprocessing.managers),
+# and workers on any number of hosts connect to it, take tasks, run them and
+# send the results back. A task is a batch of positions to analyze (as in
+# records.py), a batch of opening positions to search (book.py) or a game to
+# play (tournament.py), so those jobs can use every core of several machines.
+#
+# A task handed to a worker is leased to it for lease_seconds, and the worker
+# renews the lease while it works. When a lease runs out (the worker died,
+# hung or lost its connection) the task goes back to the front of the queue.
+# If the first worker answers after all, whichever result comes first is
+# kept.
+#
+# The queue server unpickles what its clients send, so anyone who knows the
+# authkey can run code on the coordinator. There is no default key: a
+# coordinator on a loopback address makes up a random one, and any other
+# address needs one given explicitly (--authkey or $KALAH_AUTHKEY).
+
+DEFAULT_PORT = 50007
+AUTHKEY_ENV = "KALAH_AUTHKEY"
+LEASE_SECONDS = 30.0
+
+# how often idle workers ask for work, and waiting coordinators check leases
+POLL_SECONDS = 0.2
+
+# tasks in flight at most, so big jobs are read no faster than they're done
+MAX_PENDING_TASKS = 64
+
+# opening positions searched per book task
+BOOK_BATCH = 16
+
+# the WorkQueue methods workers may call
+WORKER_METHODS = ("get_task", "renew", "put_result")
+
+
+# "host:port" -> (host, port)
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Expected host:port, got {text!r}")
+    return host or "127.0.0.1", int(port)
+
+
+# whether host (a name or an address) only reaches this machine
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+# Runs in a worker: one task's result
+def run_task(kind, args):
+    if kind == "analyze":
+        return analyze_batch(*args)
+    if kind == "book":
+        depth, time_budget_ms, positions = args
+        return [search_position(board_list, player, depth, time_budget_ms) for board_list, player in positions]
+    if kind == "game":
+        return play_game(*args)
+    raise ValueError(f"Unknown task kind: {kind}")
+
+
+class WorkQueue:
+    def __init__(self, lease_seconds=LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        self.condition = threading.Condition()
+        self.next_id = 0
+        # task id -> (kind, args, items) until it's done; items is what the
+        # task counts for in throughput (positions, games)
+        self.tasks = {}
+        # ids of tasks waiting for a worker
+        self.waiting = deque()
+        # task id -> (worker, expiry)
+        self.leases = {}
+        # task id -> (ok, result) until the coordinator collects it
+        self.results = {}
+        # worker name -> totals
+        self.workers = {}
+        self.requeued = 0
+        self.tasks_done = 0
+        self.items_done = 0
+        self.started = None
+        self.closed = False
+
+    def submit(self, kind, args, items=1):
+        with self.condition:
+            if self.started is None:
+                self.started = time.perf_counter()
+            task_id = self.next_id
+            self.next_id += 1
+            self.tasks[task_id] = (kind, args, items)
+            self.waiting.append(task_id)
+            return task_id
+
+    # Called by workers: the next task as (task id, kind, args, lease
+    # seconds), None if there's nothing to do yet, or "stop" once the
+    # coordinator is done
+    def get_task(self, worker):
+        with self.condition:
+            self.worker_totals(worker)
+            if self.closed:
+                return "stop"
+            self.expire_leases()
+            while self.waiting:
+                task_id = self.waiting.popleft()
+                # finished by a worker whose lease had run out
+                if task_id not in self.tasks:
+                    continue
+                self.leases[task_id] = (worker, time.perf_counter() + self.lease_seconds)
+                kind, args, _ = self.tasks[task_id]
+                return task_id, kind, args, self.lease_seconds
+            return None
+
+    def renew(self, worker, task_id):
+        with self.condition:
+            lease = self.leases.get(task_id)
+            if lease is not None and lease[0] == worker:
+                self.leases[task_id] = (worker, time.perf_counter() + self.lease_seconds)
+
+    # ok: whether the task ran; if not, result is the error
+    def put_result(self, worker, task_id, ok, result, seconds):
+        with self.condition:
+            totals = self.worker_totals(worker)
+            totals["busy_seconds"] += seconds
+            if task_id not in self.tasks:
+                totals["duplicates"] += 1
+                return
+            _, _, items = self.tasks.pop(task_id)
+            self.leases.pop(task_id, None)
+            self.results[task_id] = (ok, result)
+            if ok:
+                totals["tasks"] += 1
+                totals["items"] += items
+                self.tasks_done += 1
+                self.items_done += items
+            self.condition.notify_all()
+
+    # Coordinator side: blocks until task_id is done, and returns (ok, result)
+    def wait_result(self, task_id):
+        with self.condition:
+            while task_id not in self.results:
+                self.condition.wait(POLL_SECONDS)
+                self.expire_leases()
+            return self.results.pop(task_id)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+
+    # call with the condition held
+    def expire_leases(self):
+        now = time.perf_counter()
+        for task_id, (worker, expiry) in list(self.leases.items()):
+            if expiry < now:
+                del self.leases[task_id]
+                self.waiting.appendleft(task_id)
+                self.requeued += 1
+                self.workers[worker]["expired"] += 1
+
+    # call with the condition held
+    def worker_totals(self, worker):
+        totals = self.workers.get(worker)
+        if totals is None:
+            totals = self.workers[worker] = {"tasks": 0, "items": 0, "busy_seconds": 0.0,
+                                             "expired": 0, "duplicates": 0}
+        return totals
+
+    def stats(self):
+        with self.condition:
+            seconds = time.perf_counter() - self.started if self.started is not None else 0.0
+            workers = {}
+            for worker, totals in self.workers.items():
+                workers[worker] = dict(totals)
+                workers[worker]["items_per_sec"] = (totals["items"] / totals["busy_seconds"]
+                                                    if totals["busy_seconds"] else 0.0)
+            return {
+                "seconds": seconds,
+                "tasks": self.tasks_done,
+                "items": self.items_done,
+                "items_per_sec": self.items_done / seconds if seconds else 0.0,
+                "requeued": self.requeued,
+                "workers": workers,
+            }
+
+
+class Coordinator:
+    # Serves a WorkQueue at address (port 0 picks a free one; see
+    # self.address) from a background thread until the process exits.
+    # Without an authkey, address must be a loopback one and a random key is
+    # made up (see self.authkey); raises ValueError otherwise.
+    def __init__(self, address=("127.0.0.1", DEFAULT_PORT), authkey=None, lease_seconds=LEASE_SECONDS):
+        if authkey is None:
+            if not is_loopback(address[0]):
+                raise ValueError(f"Serving on {address[0]} needs an explicit authkey: anyone who knows "
+                                 f"the key can run code on this machine")
+            authkey = secrets.token_hex(16)
+        self.authkey = authkey
+        self.queue = WorkQueue(lease_seconds)
+        queue = self.queue
+
+        class Manager(BaseManager):
+            pass
+        Manager.register("work_queue", callable=lambda: queue, exposed=WORKER_METHODS)
+
+        self.server = Manager(address, authkey.encode()).get_server()
+        self.address = self.server.address
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # Submits tasks, an iterable of (kind, args, items), and yields their
+    # results in order. At most max_pending tasks are queued at a time.
+    # Raises RuntimeError if a task fails in its worker.
+    def imap(self, tasks, max_pending=MAX_PENDING_TASKS):
+        pending = deque()
+        tasks = iter(tasks)
+        while True:
+            while len(pending) < max_pending:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending.append(self.queue.submit(*task))
+            if not pending:
+                return
+            ok, result = self.queue.wait_result(pending.popleft())
+            if not ok:
+                raise RuntimeError(result)
+            yield result
+
+    # Tells the workers to stop after their current task
+    def close(self):
+        self.queue.close()
+
+
+def renew_lease(queue, worker, task_id, interval, done):
+    while not done.wait(interval):
+        try:
+            queue.renew(worker, task_id)
+        except (EOFError, OSError):
+            return
+
+
+# Takes and runs tasks from the coordinator at address until it says stop or
+# goes away. Waits up to connect_timeout seconds for the coordinator to come
+# up. Returns the number of tasks run.
+def run_worker(address, authkey, name=None, connect_timeout=30.0):
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+
+    class Manager(BaseManager):
+        pass
+    Manager.register("work_queue")
+
+    manager = Manager(tuple(address), authkey.encode())
+    deadline = time.perf_counter() + connect_timeout
+    while True:
+        try:
+            manager.connect()
+            break
+        except ConnectionRefusedError:
+            if time.perf_counter() >= deadline:
+                raise
+            time.sleep(POLL_SECONDS)
+
+    queue = manager.work_queue()
+    tasks_run = 0
+    try:
+        while True:
+            task = queue.get_task(name)
+            if task == "stop":
+                break
+            if task is None:
+                time.sleep(POLL_SECONDS)
+                continue
+
+            task_id, kind, args, lease_seconds = task
+            done = threading.Event()
+            renewer = threading.Thread(target=renew_lease, args=(queue, name, task_id, lease_seconds / 3, done),
+                                       daemon=True)
+            renewer.start()
+            tic = time.perf_counter()
+            try:
+                result = run_task(kind, args)
+                ok = True
+            except Exception:
+                result = f"{kind} task failed on {name}:\n{traceback.format_exc()}"
+                ok = False
+            finally:
+                done.set()
+                renewer.join()
+            queue.put_result(name, task_id, ok, result, time.perf_counter() - tic)
+            tasks_run += 1
+    except (EOFError, OSError):
+        # the coordinator has gone
+        pass
+    return tasks_run
+
+
+def start_local_workers(address, authkey, count):
+    workers = []
+    for _ in range(count):
+        worker = Process(target=run_worker, args=(address, authkey), daemon=True)
+        worker.start()
+        workers.append(worker)
+    return workers
+
+
+# == Jobs ======================================================================
+
+# Same results as records.analyze, searched by the coordinator's workers
+def analyze(coordinator: Coordinator, records, depth, evaluation='research', skipped=None):
+    tasks = (("analyze", (depth, evaluation, batch), len(batch))
+             for batch in position_batches(records, skipped=skipped))
+    for results in coordinator.imap(tasks):
+        yield from results
+
+
+# Same as book.build_book, searched by the coordinator's workers
+def build_book(coordinator: Coordinator, path, plies, depth, time_budget_ms=None, progress=None):
+    positions = opening_positions(plies)
+    keys = list(positions)
+    batches = [keys[start:start + BOOK_BATCH] for start in range(0, len(keys), BOOK_BATCH)]
+    tasks = (("book", (depth, time_budget_ms, [positions[key] for key in batch]), len(batch)) for batch in batches)
+
+    moves = {}
+    for batch, actions in zip(batches, coordinator.imap(tasks)):
+        moves.update(zip(batch, actions))
+        if progress:
+            progress(len(moves), len(keys))
+    write_book(path, moves)
+    return len(moves)
+
+
+# Same as tournament.run_tournament, played by the coordinator's workers
+def run_tournament(coordinator: Coordinator, agent1, agent2, games, opening_plies=4, seed=0, output=None,
+                   records=None):
+    specs = game_specs(agent1, agent2, games, opening_plies, seed, records is not None)
+    results = []
+    for result in coordinator.imap(("game", spec, 1) for spec in specs):
+        if records is not None:
+            write_record(records, result.pop("record"))
+        results.append(result)
+        if output is not None:
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    return summarize(results)
+
+
+def print_report(stats):
+    print(f"{stats['items']} items in {stats['tasks']} tasks, {stats['seconds']:.1f} s "
+          f"({stats['items_per_sec']:.1f}/s); {stats['requeued']} tasks requeued", file=sys.stderr)
+    for worker, totals in sorted(stats["workers"].items()):
+        print(f"  {worker:30} {totals['tasks']:6} tasks {totals['items']:8} items "
+              f"{totals['items_per_sec']:8.1f}/s busy, {totals['expired']} leases expired", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run analysis, book and tournament jobs on workers across hosts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    worker_parser = subparsers.add_parser("worker", help="take and run tasks from a coordinator")
+    worker_parser.add_argument("--connect", default=f"127.0.0.1:{DEFAULT_PORT}", help="coordinator host:port")
+    worker_parser.add_argument("--authkey", help=f"the coordinator's authkey (default: ${AUTHKEY_ENV})")
+    worker_parser.add_argument("--processes", type=int, default=os.cpu_count(), help="worker processes to run")
+
+    coordinator_options = argparse.ArgumentParser(add_help=False)
+    coordinator_options.add_argument("--listen", default=f"127.0.0.1:{DEFAULT_PORT}",
+                                     help="host:port to serve the work queue on (0.0.0.0 for other hosts)")
+    coordinator_options.add_argument("--authkey",
+                                     help=f"key workers must present (default: ${AUTHKEY_ENV}; random if unset, "
+                                          f"which only a loopback --listen allows)")
+    coordinator_options.add_argument("--local-workers", type=int, default=0,
+                                     help="worker processes to start on this host as well")
+    coordinator_options.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS,
+                                     help="a task is requeued if its worker is silent this long")
+
+    analyze_parser = subparsers.add_parser("analyze", parents=[coordinator_options],
+                                           help="search every position of game record archives")
+    analyze_parser.add_argument("paths", nargs="+", help="record archives (.jsonl or .jsonl.gz)")
+    analyze_parser.add_argument("--depth", type=int, default=4, help="agent search depth")
+    analyze_parser.add_argument("--evaluation", default="research", help="agent evaluation")
+    analyze_parser.add_argument("--output", help="JSON lines file for per-position results")
+
+    book_parser = subparsers.add_parser("book", parents=[coordinator_options], help="build an opening book")
+    book_parser.add_argument("--plies", type=int, default=4, help="book covers positions up to this many moves in")
+    book_parser.add_argument("--depth", type=int, default=6, help="search depth for each book position")
+    book_parser.add_argument("--time-budget-ms", type=float, help="search each position by iterative deepening instead")
+    book_parser.add_argument("--output", default="book.bin", help="book file to write")
+
+    tournament_parser = subparsers.add_parser("tournament", parents=[coordinator_options],
+                                              help="play agent-vs-agent games")
+    tournament_parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    tournament_parser.add_argument("--agent1", default="", help="agent spec, as in tournament.py")
+    tournament_parser.add_argument("--agent2", default="", help="agent spec, as in tournament.py")
+    tournament_parser.add_argument("--opening-plies", type=int, default=4, help="random moves before the agents take over")
+    tournament_parser.add_argument("--seed", type=int, default=0, help="seed for the random openings")
+    tournament_parser.add_argument("--output", help="JSON lines file for per-game results")
+    tournament_parser.add_argument("--record", help="game record archive to write every game to")
+    args = parser.parse_args(argv)
+    authkey = args.authkey or os.environ.get(AUTHKEY_ENV)
+
+    if args.command == "worker":
+        if authkey is None:
+            parser.error(f"workers need the coordinator's authkey: pass --authkey or set ${AUTHKEY_ENV}")
+        address = parse_address(args.connect)
+        workers = start_local_workers(address, authkey, args.processes)
+        for worker in workers:
+            worker.join()
+        return
+
+    try:
+        coordinator = Coordinator(parse_address(args.listen), authkey, args.lease_seconds)
+    except ValueError as e:
+        parser.error(str(e))
+    host, port = coordinator.address
+    local_host = "127.0.0.1" if host in ("", "0.0.0.0", "::") else host
+    workers = start_local_workers((local_host, port), coordinator.authkey, args.local_workers)
+    # only a key made up here is printed; a given one is already known
+    key_hint = f"{AUTHKEY_ENV}={coordinator.authkey} " if authkey is None else f"the same ${AUTHKEY_ENV} "
+    print(f"serving work on {host}:{port}; start workers with: "
+          f"{key_hint}python3 distributed.py worker --connect {local_host}:{port}", file=sys.stderr)
+
+    try:
+        if args.command == "analyze":
+            skipped = []
+
+            def all_records():
+                for path in args.paths:
+                    yield from read_records(path, skipped)
+
+            output = open_archive(args.output, 'w') if args.output else None
+            positions = 0
+            agreements = 0
+            try:
+                for result in analyze(coordinator, all_records(), args.depth, args.evaluation, skipped):
+                    positions += 1
+                    agreements += result["agrees"]
+                    if output is not None:
+                        output.write(json.dumps(result) + "\n")
+            finally:
+                if output is not None:
+                    output.close()
+            print(f"the moves played match the depth-{args.depth} agent in {agreements / max(positions, 1):.1%} "
+                  f"of {positions} positions", file=sys.stderr)
+            report_skipped(skipped)
+
+        elif args.command == "book":
+            def progress(done, total):
+                if done % 100 < BOOK_BATCH or done == total:
+                    print(f"{done}/{total} positions searched", file=sys.stderr)
+
+            count = build_book(coordinator, args.output, args.plies, args.depth, args.time_budget_ms, progress)
+            print(f"wrote {count} positions to {args.output}", file=sys.stderr)
+
+        else:
+            agent1 = parse_agent_spec(args.agent1)
+            agent2 = parse_agent_spec(args.agent2)
+            output = open(args.output, "w") if args.output else sys.stdout
+            records = open_archive(args.record, "w") if args.record else None
+            try:
+                summary = run_tournament(coordinator, agent1, agent2, args.games, args.opening_plies, args.seed,
+                                         output, records)
+            finally:
+                if args.output:
+                    output.close()
+                if records is not None:
+                    records.close()
+            low, high = summary["score_ci"]
+            print(f"agent1 score: {summary['score']:.3f} (95% CI {low:.3f}-{high:.3f}) over {summary['games']} games; "
+                  f"{summary['win']} wins, {summary['draw']} draws, {summary['loss']} losses", file=sys.stderr)
+    finally:
+        coordinator.close()
+        for worker in workers:
+            worker.join()
+
+    print_report(coordinator.queue.stats())
+
+
+if __name__ == '__main__':
+    main()
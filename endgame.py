@@ -0,0 +1,238 @@
+import argparse
+import mmap
+import struct
+import time
+from math import comb
+
+from game import Board
+
+# == Endgame database =========================================================
+
+# Perfect-play values for every position with at most max_seeds seeds left in
+# the pits. Seeds already in the stores can never move again, so a position's
+# value only depends on the 12 pits and who is to move. Positions are stored
+# relative to the player to move: their six pits first, then the opponent's.
+# The value is the final store difference (mover minus opponent) that the
+# remaining pit seeds add up to under perfect play by both sides.
+#
+# Works for any number of pits a side (see Board's pits_per_side); the game
+# itself has six, so 12 pits in all.
+#
+# File layout: a 16-byte header (magic, max_seeds, pits per side, entry count)
+# followed by one signed byte per position, at the position's perfect index
+# (see rank()). Files from before pits per side was stored have 0 there and
+# are for six pits.
+
+NUM_PITS = 12
+MAGIC = b'KALAHEGT'
+HEADER = struct.Struct('<8sBB2xI')
+
+
+# ways[k][r]: number of ways to spread r seeds over k pits
+def build_ways(max_seeds, num_pits=NUM_PITS):
+    return [[comb(r + k - 1, k - 1) if k else int(r == 0) for r in range(max_seeds + 1)]
+            for k in range(num_pits + 1)]
+
+
+# Perfect index: positions are numbered by total seed count first, then in
+# lexicographic order of the pits. below[k][r][v] counts the positions of k
+# pits holding r seeds whose first pit has fewer than v seeds.
+class PositionIndex:
+    def __init__(self, max_seeds, num_pits=NUM_PITS):
+        self.max_seeds = max_seeds
+        self.num_pits = num_pits
+        ways = build_ways(max_seeds, num_pits)
+        self.below = [[[sum(ways[k - 1][r - x] for x in range(v)) if k else 0
+                        for v in range(r + 1)]
+                       for r in range(max_seeds + 1)]
+                      for k in range(num_pits + 1)]
+
+        # offsets[n]: number of positions with fewer than n seeds in total
+        self.offsets = [0]
+        for total in range(max_seeds + 1):
+            self.offsets.append(self.offsets[-1] + ways[num_pits][total])
+        self.size = self.offsets[-1]
+
+    def rank(self, pits, total):
+        index = self.offsets[total]
+        remaining = total
+        below = self.below
+        num_pits = self.num_pits
+        for i in range(num_pits - 1):
+            num_seeds = pits[i]
+            index += below[num_pits - i][remaining][num_seeds]
+            remaining -= num_seeds
+        return index
+
+
+# every way of spreading total seeds over num_pits pits, in rank order
+def compositions(total, num_pits):
+    if num_pits == 1:
+        yield (total,)
+        return
+    for first in range(total + 1):
+        for rest in compositions(total - first, num_pits - 1):
+            yield (first,) + rest
+
+
+# the mover's pits followed by the opponent's, as seen by player
+def relative_pits(board_list, player):
+    n = len(board_list) // 2 - 1
+    if player == 'A':
+        return board_list[n + 1:2 * n + 1] + board_list[0:n]
+    return board_list[0:n] + board_list[n + 1:2 * n + 1]
+
+
+# Plays pit_num (0 to pits per side - 1) for the mover of a relative
+# position, with the game's sowing and capture rules. Returns (seeds gained,
+# resulting relative position, extra move).
+def play_relative(pits, pit_num):
+    n = len(pits) // 2
+    store = n
+    skip = 2 * n + 1
+    board = list(pits[0:n]) + [0] + list(pits[n:2 * n]) + [0]
+    num_seeds = board[pit_num]
+    board[pit_num] = 0
+    i = pit_num
+    while num_seeds > 0:
+        i = (i + 1) % (2 * n + 2)
+        # skip opponent's store (home)
+        if i == skip:
+            continue
+        board[i] += 1
+        num_seeds -= 1
+
+    if 0 <= i < n and board[i] == 1 and board[2 * n - i] > 0:
+        board[store] += board[i] + board[2 * n - i]
+        board[i] = 0
+        board[2 * n - i] = 0
+
+    extra_move = i == store
+    if extra_move:
+        return board[store], tuple(board[0:n] + board[n + 1:skip]), True
+    return board[store], tuple(board[n + 1:skip] + board[0:n]), False
+
+
+# Seeds only move forward unless they reach a store, so among positions with
+# the same seed total every move leads to a higher potential. Solving each
+# total in order of falling potential means every successor is already known.
+def potential(pits):
+    n = len(pits) // 2
+    return sum(num_seeds * (i % n) for i, num_seeds in enumerate(pits))
+
+
+# Solves every position with up to max_seeds pit seeds, smallest totals
+# first. Returns a bytearray of signed values in perfect-index order.
+def generate(max_seeds, progress=None, pits_per_side=6):
+    num_pits = 2 * pits_per_side
+    index = PositionIndex(max_seeds, num_pits)
+    values = bytearray(index.size)
+
+    def lookup(pits):
+        value = values[index.rank(pits, sum(pits))]
+        return value - 256 if value > 127 else value
+
+    for total in range(max_seeds + 1):
+        for pits in sorted(compositions(total, num_pits), key=potential, reverse=True):
+            own = sum(pits[0:pits_per_side])
+            if own == 0 or own == total:
+                # game over: everyone keeps the seeds on their side
+                best = 2 * own - total
+            else:
+                best = -num_pits * max_seeds
+                for pit_num in range(pits_per_side):
+                    if pits[pit_num] == 0:
+                        continue
+                    gain, next_pits, extra_move = play_relative(pits, pit_num)
+                    if extra_move:
+                        value = gain + lookup(next_pits)
+                    else:
+                        value = gain - lookup(next_pits)
+                    best = max(best, value)
+            values[index.rank(pits, total)] = best & 0xFF
+
+        if progress:
+            progress(total, index.offsets[total + 1])
+
+    return values
+
+
+def write_database(path, max_seeds, values, pits_per_side=6):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, max_seeds, pits_per_side, len(values)))
+        f.write(values)
+
+
+# Read-only, memory-mapped view of a database file written by write_database
+class EndgameDatabase:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.max_seeds, self.pits_per_side, count = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an endgame database")
+        self.pits_per_side = self.pits_per_side or 6
+        self.index = PositionIndex(self.max_seeds, 2 * self.pits_per_side)
+        if count != self.index.size or len(self.data) != HEADER.size + count:
+            raise ValueError(f"{path} is truncated or corrupt")
+
+    # Perfect-play final store difference (player minus opponent) still to be
+    # won from the pits, or None if too many seeds are left
+    def value(self, board: Board, player):
+        return self.lookup(relative_pits(board.board, player))
+
+    # the same for a relative position (the mover's pits first)
+    def lookup(self, pits):
+        total = sum(pits)
+        if total > self.max_seeds:
+            return None
+        value = self.data[HEADER.size + self.index.rank(pits, total)]
+        return value - 256 if value > 127 else value
+
+    # Best action for player and its value, or (None, None) if the position
+    # is not covered. Ties go to the lowest pit.
+    def best_action(self, board: Board, player):
+        pits = relative_pits(board.board, player)
+        if sum(pits) > self.max_seeds:
+            return None, None
+
+        first_pit = board.first_pit(player)
+        best_value = None
+        best_action = None
+        for pit_num in range(self.pits_per_side):
+            if pits[pit_num] == 0:
+                continue
+            gain, next_pits, extra_move = play_relative(pits, pit_num)
+            value = self.data[HEADER.size + self.index.rank(next_pits, sum(next_pits))]
+            value = value - 256 if value > 127 else value
+            value = gain + value if extra_move else gain - value
+            if best_value is None or value > best_value:
+                best_value = value
+                best_action = first_pit + pit_num
+        return best_action, best_value
+
+    def close(self):
+        self.data.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a perfect-play endgame database.")
+    parser.add_argument("--seeds", type=int, default=10, help="largest number of seeds left in the pits")
+    parser.add_argument("--pits", type=int, default=6, help="pits per side")
+    parser.add_argument("--output", default="endgame.db", help="database file to write")
+    args = parser.parse_args(argv)
+
+    tic = time.perf_counter()
+
+    def progress(total, done):
+        print(f"{total} seeds: {done} positions solved ({time.perf_counter() - tic:.1f} s)")
+
+    values = generate(args.seeds, progress, args.pits)
+    write_database(args.output, args.seeds, values, args.pits)
+    print(f"wrote {len(values)} positions to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
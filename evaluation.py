@@ -0,0 +1,81 @@
+import json
+from operator import mul
+
+from game import FEATURE_NAMES
+
+# == Feature evaluation ========================================================
+
+# A leaf evaluation made of weighted board features (see FEATURE_NAMES in
+# game.py). Every feature is the player's amount minus the opponent's, so a
+# position is worth exactly the negative to the other side. The board computes
+# the whole feature vector in one call (on a PackedBoard, a few additions on
+# the packed state), so the evaluation stays cheap whichever weights are set.
+#
+# Weights come from a JSON object of feature name -> weight; features left out
+# are weighted 0. tune.py fits them to self-play results, which puts the
+# evaluation in logistic units: sigmoid(value) estimates the player's expected
+# score (1 for a win, 0.5 for a draw).
+
+# fitted by tune.py to 2,000 self-play games between depth-3 agents
+DEFAULT_WEIGHTS = {
+    'store_diff': 0.155,
+    'pit_seeds': 0.086,
+    'mobility': 0.234,
+    'capture_threats': 0.001,
+    'store_reach': -0.549,
+    'extra_moves': 0.291,
+}
+
+
+# weights as a dict of feature name -> float; accepts any mapping or
+# sequence of (name, weight) pairs
+def check_weights(weights):
+    try:
+        weights = dict(weights)
+    except (TypeError, ValueError):
+        raise ValueError("Weights must be an object of feature name -> weight")
+    for name, weight in weights.items():
+        if name not in FEATURE_NAMES:
+            raise ValueError(f"Unknown feature: {name}")
+        if not isinstance(weight, (int, float)):
+            raise ValueError(f"Weight for {name} must be a number")
+    return {name: float(weight) for name, weight in weights.items()}
+
+
+# the weights in a JSON file
+def load_weights(path):
+    with open(path) as f:
+        return check_weights(json.load(f))
+
+
+def save_weights(path, weights):
+    with open(path, "w") as f:
+        json.dump(weights, f, indent=2)
+        f.write("\n")
+
+
+class FeatureEvaluation:
+    # weights: a dict of feature name -> weight, a path to a JSON file of
+    # them, or None for DEFAULT_WEIGHTS
+    def __init__(self, weights=None):
+        if weights is None:
+            weights = DEFAULT_WEIGHTS
+        elif isinstance(weights, str):
+            weights = load_weights(weights)
+        self.weights = check_weights(weights)
+
+        # boards give B's feature values; A's are the same with the sign flipped
+        vector = tuple(self.weights.get(name, 0.0) for name in FEATURE_NAMES)
+        self.vectors = {'B': vector, 'A': tuple(-weight for weight in vector)}
+
+    def evaluate(self, board, player):
+        return sum(map(mul, self.vectors[player], board.feature_values('B')))
+
+    # evaluate for a fixed player, as a plain function of the board (one call
+    # less per leaf for the search)
+    def evaluator(self, player):
+        vector = self.vectors[player]
+
+        def evaluate(board):
+            return sum(map(mul, vector, board.feature_values('B')))
+        return evaluate
@@ -1,21 +1,194 @@
+import argparse
 import termcolor
-from termcolor import colored, cprint
+from termcolor import colored
+import cProfile
+import hashlib
+import json
 import random
-import copy
+import sys
 import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 
 # == Mancala ==================================================================
 
+def other_player(player):
+    return 'A' if player == 'B' else 'B'
+
+
+# The board list holds B's pits, B's store, A's pits, then A's store. For
+# pits_per_side pits a side, returns which player each index belongs to (None
+# for the stores), the seeds each pit needs for its last seed to land in its
+# owner's store, and the index of each player's store.
+def board_layout(pits_per_side):
+    distances = [pits_per_side - i for i in range(pits_per_side)]
+    owners = ['B'] * pits_per_side + [None] + ['A'] * pits_per_side + [None]
+    return owners, distances + [None] + distances + [None], {'B': pits_per_side, 'A': 2 * pits_per_side + 1}
+
+
+# the standard board: six pits a side
+PIT_OWNERS, PERFECT_DISTANCES, STORES = board_layout(6)
+
+
+# For each player, every combination of their non-empty pits, keyed by a
+# bitmask with bits[i] set for each non-empty pit i, mapped to the tuple of
+# those pits. Finding the legal actions is then one dict lookup, and the
+# tuples are shared, so callers must not change them.
+def build_action_tables(owners, bits):
+    tables = {}
+    for player in ('B', 'A'):
+        pits = [i for i, owner in enumerate(owners) if owner == player]
+        table = {}
+        for subset in range(1 << len(pits)):
+            actions = tuple(pit for k, pit in enumerate(pits) if subset >> k & 1)
+            table[sum(bits[pit] for pit in actions)] = actions
+        tables[player] = table
+    return tables
+
+
+# For each (player, pit, count), the bitmask of pits that sowing count seeds
+# from pit puts at least one seed in. Counts of a full lap (every index but
+# the opponent's store) or more reach every pit, so the tables stop there.
+def build_sow_masks(pits_per_side):
+    owners, _, stores = board_layout(pits_per_side)
+    lap = 2 * pits_per_side + 1
+    masks = {}
+    for player in ('B', 'A'):
+        skip = stores[other_player(player)]
+        per_pit = []
+        for pit_num in range(len(owners)):
+            per_count = [0]
+            i = pit_num
+            mask = 0
+            while len(per_count) <= lap:
+                i = (i + 1) % len(owners)
+                if i == skip:
+                    continue
+                if owners[i]:
+                    mask |= 1 << i
+                per_count.append(mask)
+            per_pit.append(per_count)
+        masks[player] = per_pit
+    return masks
+
+
+# Board features for evaluation.py's weighted evaluation, in the order
+# Board.feature_values gives them. Each is the player's amount minus the
+# opponent's:
+#   store_diff       seeds already banked
+#   pit_seeds        seeds on each side, which their owner keeps if the game ends now
+#   mobility         legal moves
+#   capture_threats  seeds lying opposite empty pits, ready to be captured
+#   store_reach      pits whose seeds reach the store when played
+#   extra_moves      pits whose last seed lands in the store, earning an extra move
+FEATURE_NAMES = ('store_diff', 'pit_seeds', 'mobility', 'capture_threats', 'store_reach', 'extra_moves')
+
+
+# (bitmask of each player's pits, action tables, sow masks) for Board, built
+# once per board size
+board_tables = {}
+
+
+def get_board_tables(pits_per_side):
+    tables = board_tables.get(pits_per_side)
+    if tables is None:
+        owners = board_layout(pits_per_side)[0]
+        pit_masks = {player: sum(1 << i for i, owner in enumerate(owners) if owner == player)
+                     for player in ('B', 'A')}
+        tables = (pit_masks, build_action_tables(owners, [1 << i for i in range(len(owners))]),
+                  build_sow_masks(pits_per_side))
+        board_tables[pits_per_side] = tables
+    return tables
+
+
 class Board:
     player_to_background = {"A": "on_red", "B": "on_blue"}
 
-    def __init__(self):
+    # Kalah(pits_per_side, seeds_per_pit); the game is played on Kalah(6, 4)
+    def __init__(self, pits_per_side=6, seeds_per_pit=4):
+        self.pits_per_side = pits_per_side
+        self.seeds_per_pit = seeds_per_pit
+        self.owners, self.distances, self.stores = board_layout(pits_per_side)
+        self.pit_masks, self.action_tables, self.sow_masks = get_board_tables(pits_per_side)
+
         # start with B (user), then A (computer)
         # stores initially have 0 seeds
-        self.board = [4, 4, 4, 4, 4, 4, 0, 4, 4, 4, 4, 4, 4, 0]
+        self.board = ([seeds_per_pit] * pits_per_side + [0]) * 2
         self.extra_move = None
         self.current_capture = None
 
+    # The pits and stores. Assigning a new list recounts the running totals;
+    # after that they are kept up to date by move_seeds, perform_capture and
+    # unmake_move, so don't change the list in place from outside.
+    @property
+    def board(self):
+        return self.pits
+
+    @board.setter
+    def board(self, board_list):
+        self.pits = board_list
+        self.recount()
+
+    # Running totals per player, so evaluation doesn't have to loop over the
+    # pits: seeds in their pits, and how many of their pits hold exactly
+    # enough seeds to reach the store. Also a bitmask of the non-empty pits
+    # (bit i for pit i), for finding legal actions without a loop.
+    def recount(self):
+        self.pit_seeds = {'B': 0, 'A': 0}
+        self.perf_dists = {'B': 0, 'A': 0}
+        self.occupied = 0
+        for i, num_seeds in enumerate(self.pits):
+            owner = self.owners[i]
+            if owner:
+                self.pit_seeds[owner] += num_seeds
+                if num_seeds == self.distances[i]:
+                    self.perf_dists[owner] += 1
+                if num_seeds:
+                    self.occupied |= 1 << i
+
+    # adds amount seeds (negative to take them away) to index i, keeping the
+    # running totals in step
+    def add_seeds(self, i, amount):
+        num_seeds = self.pits[i]
+        self.pits[i] = num_seeds + amount
+        owner = self.owners[i]
+        if owner:
+            self.pit_seeds[owner] += amount
+            dist = self.distances[i]
+            if num_seeds == dist:
+                self.perf_dists[owner] -= 1
+            elif num_seeds + amount == dist:
+                self.perf_dists[owner] += 1
+            if num_seeds + amount:
+                self.occupied |= 1 << i
+            else:
+                self.occupied &= ~(1 << i)
+
+    # Recomputes every running total from the pits and raises AssertionError
+    # if one has drifted. Meant for tests and debugging; it loops over the board.
+    def check_invariants(self):
+        board_list = self.board
+        if min(board_list) < 0:
+            raise AssertionError(f"Negative seed count on board {board_list}")
+        for player, start in (('B', 0), ('A', self.pits_per_side + 1)):
+            pits = range(start, start + self.pits_per_side)
+            expected = {
+                "store count": board_list[self.stores[player]],
+                "pit seeds": sum(board_list[i] for i in pits),
+                "perfect distance pits": sum(1 for i in pits if board_list[i] == self.distances[i]),
+                "legal actions": tuple(i for i in pits if board_list[i]),
+            }
+            actual = {
+                "store count": self.get_store_count(player),
+                "pit seeds": self.get_player_seeds(player),
+                "perfect distance pits": self.perf_dist_count(player),
+                "legal actions": self.legal_actions(player),
+            }
+            for name, value in expected.items():
+                if actual[name] != value:
+                    raise AssertionError(f"{player} {name} is {actual[name]}, expected {value} "
+                                         f"on board {board_list}")
+
     def gets_extra_move(self):
         return self.extra_move
     
@@ -26,84 +199,139 @@ class Board:
 
         return {'B': b_score, 'A': a_score}
 
+    # player's non-empty pits, as a new list the caller may change
     def get_legal_actions(self, player):
-        start = 0
-        end = 6
-        if player == 'A':
-            start = 7
-            end = 13
-
-        legal_actions = []
+        return list(self.legal_actions(player))
 
-        # consider all of player's available pits (excluding store)
-        for i in range(start, end):
-            # skip empty pits
-            if self.get_pit_seeds(i) == 0:
-                continue 
-            legal_actions.append(i)
-
-        return legal_actions
+    # The same as a shared tuple, looked up from the non-empty pit bitmask
+    # without a loop or an allocation. Don't change it.
+    def legal_actions(self, player):
+        return self.action_tables[player][self.occupied & self.pit_masks[player]]
 
     # get the seed count in a single specified pit
     def get_pit_seeds(self, pit_num):
-        if not (0 <= pit_num <= 5) and not (7 <= pit_num <= 12):
+        if not (0 <= pit_num < len(self.owners)) or self.owners[pit_num] is None:
             return -1
-        return self.board[pit_num]
+        return self.pits[pit_num]
     
     # only does this for player's own pits
     def perf_dist_from_store(self, player):
-        # default to player B (user)
-        start = 0
-        end = 6 
-        if player == 'A':
-            start = 7
-            end = 13
-
-        # calculate distances from player's pits to store (excluding store)
-        for i in range(start, end):
-            dist = self.get_dist_from_store(i, player)
-            if (self.get_pit_seeds(i) == dist):
-                return True
-            
-        return False
+        return self.perf_dist_count(player) > 0
+
+    # number of player's pits holding exactly their distance from the store
+    def perf_dist_count(self, player):
+        return self.perf_dists[player]
+
+    # number of player's pits holding enough seeds to reach their store
+    def store_reach_count(self, player):
+        first = self.stores[player] - self.pits_per_side
+        return sum(1 for i in range(first, first + self.pits_per_side) if self.pits[i] >= self.distances[i])
+
+    # seeds in the opponent's pits opposite player's empty pits, which player
+    # would capture by ending a move in one of those pits
+    def capture_targets(self, player):
+        first = self.stores[player] - self.pits_per_side
+        return sum(self.pits[2 * self.pits_per_side - i]
+                   for i in range(first, first + self.pits_per_side) if not self.pits[i])
+
+    # FEATURE_NAMES for player, as a tuple
+    def feature_values(self, player):
+        opponent = other_player(player)
+        return (self.get_store_count(player) - self.get_store_count(opponent),
+                self.get_player_seeds(player) - self.get_player_seeds(opponent),
+                len(self.legal_actions(player)) - len(self.legal_actions(opponent)),
+                self.capture_targets(player) - self.capture_targets(opponent),
+                self.store_reach_count(player) - self.store_reach_count(opponent),
+                self.perf_dist_count(player) - self.perf_dist_count(opponent))
 
     # does not consider pits from opponent's side
     def get_dist_from_store(self, pit_num, player):
-        if player == 'A':
-            return 13 - pit_num
-        if player == 'B':
-            return 6 - pit_num
+        return self.stores[player] - pit_num
     
     def get_store_counts(self):
-        return {"A": self.board[13], "B": self.board[6]}
+        return {"A": self.pits[self.stores['A']], "B": self.pits[self.stores['B']]}
+
+    def get_store_count(self, player):
+        return self.pits[self.stores[player]]
+
+    # exact, hashable description of the pits and stores
+    def position_key(self):
+        return tuple(self.pits)
+
+    # Zobrist hash of the pits, stores and side to move
+    def zobrist_hash(self, player):
+        key = ZOBRIST_SIDE[player]
+        for i, num_seeds in enumerate(self.pits):
+            key ^= ZOBRIST_KEYS[i][num_seeds]
+        return key
+
+    # The position as seen by player, the side to move: their pits and store
+    # first, then the opponent's. A position and its mirror image with the
+    # other player to move share a canonical key and hash, so results cached
+    # under them (with actions stored relative to first_pit) serve both seats.
+    def canonical_key(self, player):
+        if player == 'A':
+            first = self.pits_per_side + 1
+            return tuple(self.pits[first:] + self.pits[:first])
+        return tuple(self.pits)
+
+    # Zobrist hash of canonical_key(player); the side to move isn't hashed
+    def canonical_hash(self, player):
+        key = 0
+        for i, num_seeds in enumerate(self.canonical_key(player)):
+            key ^= ZOBRIST_KEYS[i][num_seeds]
+        return key
+
+    # index of player's leftmost pit; pit_num - first_pit(player) is the pit
+    # relative to its owner's side
+    def first_pit(self, player):
+        return self.pits_per_side + 1 if player == 'A' else 0
+
+    # a copy with the two sides swapped: B's pits and store become A's and
+    # vice versa (no pending extra move or capture)
+    def rotated(self):
+        rotated = type(self)(self.pits_per_side, self.seeds_per_pit)
+        rotated.board = list(self.canonical_key('A'))
+        return rotated
         
     def move_seeds(self, pit_num, player):
         i = pit_num
 
         # get number of seeds in pit
-        num_seeds = self.board[i]
+        num_seeds = self.pits[i]
+        sown = num_seeds
 
         # empty specified pit
-        self.board[i] = 0
+        self.add_seeds(i, -num_seeds)
 
         # distribute seeds counter-clockwise
+        pits = self.pits
+        opponent_store = self.stores[other_player(player)]
         while num_seeds > 0:
-            i = (i + 1) % len(self.board)
+            i = (i + 1) % len(pits)
 
             # skip opponent's store (home)
-            if player == 'B' and i == 13:
-                continue
-            elif player == 'A' and i == 6:
+            if i == opponent_store:
                 continue
 
-            self.board[i] += 1
+            # same bookkeeping as add_seeds, inlined since this is the hot loop
+            owner = self.owners[i]
+            if owner:
+                self.pit_seeds[owner] += 1
+                if pits[i] == self.distances[i]:
+                    self.perf_dists[owner] -= 1
+                elif pits[i] + 1 == self.distances[i]:
+                    self.perf_dists[owner] += 1
+            pits[i] += 1
             num_seeds -= 1
 
+        # the sown pits now hold seeds (add_seeds above cleared the origin pit)
+        sow_masks = self.sow_masks[player][pit_num]
+        self.occupied |= sow_masks[min(sown, len(sow_masks) - 1)]
+
         # if last seed lands in pit, active player gets an extra turn
-        if (player == 'B' and i == 6):
-            self.extra_move = 'B'
-        elif (player == 'A' and i == 13):
-            self.extra_move = 'A'
+        if i == self.stores[player]:
+            self.extra_move = player
         else:
             self.extra_move = None
 
@@ -111,10 +339,11 @@ class Board:
         capture_occurred = False
         if self.get_pit_seeds(i) == 1:
             # check if seed landed on own side
-            if (player == 'B' and 0 <= i <= 5) or (player == 'A' and 7 <= i <= 12):
+            if self.owners[i] == player:
                 # check if opposite pit has seeds
-                if self.get_pit_seeds(12 - i) > 0:
-                    self.current_capture = (player, i, 12 - i)
+                opposite = 2 * self.pits_per_side - i
+                if self.get_pit_seeds(opposite) > 0:
+                    self.current_capture = (player, i, opposite)
                     capture_occurred = True
         if not capture_occurred:
             self.current_capture = None
@@ -128,119 +357,953 @@ class Board:
         capturing_player, capturing_pit, captured_pit = self.current_capture
 
         # determine store index based on player
-        store = 6
-        if capturing_player == 'A':
-            store = 13
+        store = self.stores[capturing_player]
         
         # move pit seeds to store
-        self.board[store] = self.board[store] + self.board[capturing_pit] + self.board[captured_pit]
+        self.add_seeds(store, self.pits[capturing_pit] + self.pits[captured_pit])
 
         # empty relevant pits
-        self.board[capturing_pit] = 0
-        self.board[captured_pit] = 0
+        self.add_seeds(capturing_pit, -self.pits[capturing_pit])
+        self.add_seeds(captured_pit, -self.pits[captured_pit])
         return
+
+    # Applies a move in place (like move_seeds) and returns a compact undo record
+    # that unmake_move uses to restore the exact prior state. This lets the search
+    # walk the tree on one board instead of deep-copying it at every node.
+    # If apply_capture is set, a resulting capture is performed right away and
+    # is undone as well.
+    def make_move(self, pit_num, player, apply_capture=False):
+        num_seeds = self.pits[pit_num]
+        prev_extra_move = self.extra_move
+        prev_capture = self.current_capture
+        prev_occupied = self.occupied
+
+        self.move_seeds(pit_num, player)
+
+        # remember what the capture took so it can be put back
+        captured = None
+        if apply_capture and self.current_capture:
+            capturing_player, capturing_pit, captured_pit = self.current_capture
+            captured = (capturing_pit, captured_pit, self.pits[captured_pit])
+            self.perform_capture()
+
+        return (pit_num, player, num_seeds, prev_extra_move, prev_capture, captured, prev_occupied)
+
+    # (extra move, capture) that playing pit_num would give player, without
+    # changing the board
+    def move_outcome(self, pit_num, player):
+        undo = self.make_move(pit_num, player)
+        outcome = (self.extra_move == player, self.current_capture is not None)
+        self.unmake_move(undo)
+        return outcome
+
+    # undo records must be unmade in reverse order of the moves that made them
+    def unmake_move(self, undo):
+        pit_num, player, num_seeds, prev_extra_move, prev_capture, captured, prev_occupied = undo
+
+        # give back captured seeds
+        if captured:
+            capturing_pit, captured_pit, captured_seeds = captured
+            store = self.stores[player]
+            self.add_seeds(store, -1 - captured_seeds)
+            self.add_seeds(capturing_pit, 1)
+            self.add_seeds(captured_pit, captured_seeds)
+
+        # retrace the counter-clockwise distribution, taking one seed back each time
+        pits = self.pits
+        opponent_store = self.stores[other_player(player)]
+        i = pit_num
+        remaining = num_seeds
+        while remaining > 0:
+            i = (i + 1) % len(pits)
+
+            # opponent's store (home) was skipped when sowing
+            if i == opponent_store:
+                continue
+
+            # same bookkeeping as add_seeds, inlined like in move_seeds
+            owner = self.owners[i]
+            if owner:
+                self.pit_seeds[owner] -= 1
+                if pits[i] == self.distances[i]:
+                    self.perf_dists[owner] -= 1
+                elif pits[i] - 1 == self.distances[i]:
+                    self.perf_dists[owner] += 1
+            pits[i] -= 1
+            remaining -= 1
+
+        # the origin pit may have been passed on a full lap, so set it outright
+        self.add_seeds(pit_num, num_seeds - self.pits[pit_num])
+        self.occupied = prev_occupied
+
+        self.extra_move = prev_extra_move
+        self.current_capture = prev_capture
             
     # excluding store seeds, get the sum of seeds in all pits associated with
     # one player
     def get_player_seeds(self, player):
-        score = 0
+        return self.pit_seeds[player]
+    
+    # Returns true when either player has no seeds on their side; the running
+    # pit totals make this O(1)
+    def at_terminal_state(self):
+        return not (self.pit_seeds['B'] and self.pit_seeds['A'])
 
-        # for user
-        start = 0
-        end = 6
+    # (user done, computer done)
+    def players_done(self):
+        return (self.pit_seeds['B'] == 0, self.pit_seeds['A'] == 0)
+
+    def print_board(self):
+        Renderer().show(self)
+
+
+# Same rules as Game.move_seeds + Game.display_capture + Game.get_next_player,
+# without any output: sow, capture, then find who moves next. Returns the
+# player to move next.
+def apply_move(board: Board, pit_num, player):
+    board.move_seeds(pit_num, player)
+    if board.get_capture():
+        board.perform_capture()
+    if board.gets_extra_move() == player:
+        return player
+    return other_player(player)
+
+# == Packed board ==============================================================
+
+# Each pit/store gets an 8-bit field of one Python int, index 0 in the lowest
+# byte. 8 bits leave plenty of headroom over the 48 seeds in play. Two more
+# bytes above the board hold each player's running pit total (B's, then A's),
+# which the sowing deltas keep up to date for free.
+PIT_BITS = 8
+PIT_MASK = (1 << PIT_BITS) - 1
+TOTAL_SEEDS = 48
+STATE_BYTES = 16
+PIT_TOTAL_SHIFTS = {'B': 14 * PIT_BITS, 'A': 15 * PIT_BITS}
+STORE_SHIFTS = {'B': 6 * PIT_BITS, 'A': 13 * PIT_BITS}
+
+# masks over each player's six pits (stores excluded)
+B_PITS_MASK = sum(PIT_MASK << (i * PIT_BITS) for i in range(0, 6))
+A_PITS_MASK = sum(PIT_MASK << (i * PIT_BITS) for i in range(7, 13))
+PITS_MASKS = {'B': B_PITS_MASK, 'A': A_PITS_MASK}
+
+# each of a player's pits holding its perfect distance, and the low seven /
+# top bit of each of their pit bytes (see PackedBoard.perf_dist_count)
+PERFECT_PATTERNS = {player: sum(PERFECT_DISTANCES[i] << (i * PIT_BITS) for i in range(start, start + 6))
+                    for player, start in (('B', 0), ('A', 7))}
+PITS_LOW_BITS = {player: mask // PIT_MASK * 0x7F for player, mask in PITS_MASKS.items()}
+PITS_TOP_BITS = {player: mask // PIT_MASK * 0x80 for player, mask in PITS_MASKS.items()}
+
+# legal actions keyed by the top bits that adding PITS_LOW_BITS sets in the
+# bytes of non-empty pits (see PackedBoard.legal_actions), bundled with the
+# masks per player so a lookup is one dict access
+PACKED_ACTION_TABLES = build_action_tables(PIT_OWNERS, [0x80 << (i * PIT_BITS) for i in range(14)])
+PACKED_LEGAL_ACTIONS = {player: (PITS_MASKS[player], PITS_LOW_BITS[player], PITS_TOP_BITS[player],
+                                 PACKED_ACTION_TABLES[player])
+                        for player in ('B', 'A')}
+
+# 0x80 minus each pit's distance from the store: adding it sets the top bit
+# of the pits holding at least that many seeds
+REACH_OFFSETS = {player: sum((0x80 - PERFECT_DISTANCES[i]) << (i * PIT_BITS) for i in range(start, start + 6))
+                 for player, start in (('B', 0), ('A', 7))}
+
+# keyed like PACKED_ACTION_TABLES, but by the top bits of player's empty
+# pits: a mask over the opponent pits opposite them
+CAPTURE_TARGET_MASKS = {player: {top_bits: sum(PIT_MASK << ((12 - i) * PIT_BITS) for i in pits)
+                                 for top_bits, pits in tables.items()}
+                        for player, tables in PACKED_ACTION_TABLES.items()}
+
+# multiplying by this adds up bytes 0-12 into byte 12 (sums stay below 256,
+# so nothing carries into the next byte)
+BYTE_SUM_MULTIPLIER = sum(1 << (i * PIT_BITS) for i in range(13))
+BYTE_SUM_SHIFT = 12 * PIT_BITS
+
+# both players' masks at once, for computing the features of both sides in
+# the same additions (see PackedBoard.feature_values)
+ALL_PITS_MASK = B_PITS_MASK | A_PITS_MASK
+ALL_LOW_BITS = PITS_LOW_BITS['B'] | PITS_LOW_BITS['A']
+ALL_REACH_OFFSETS = REACH_OFFSETS['B'] | REACH_OFFSETS['A']
+ALL_PERFECT_PATTERNS = PERFECT_PATTERNS['B'] | PERFECT_PATTERNS['A']
+B_TOP_BITS = PITS_TOP_BITS['B']
+A_TOP_BITS = PITS_TOP_BITS['A']
+B_CAPTURE_TARGET_MASKS = CAPTURE_TARGET_MASKS['B']
+A_CAPTURE_TARGET_MASKS = CAPTURE_TARGET_MASKS['A']
+B_STORE_SHIFT = STORE_SHIFTS['B']
+A_STORE_SHIFT = STORE_SHIFTS['A']
+B_PIT_TOTAL_SHIFT = PIT_TOTAL_SHIFTS['B']
+A_PIT_TOTAL_SHIFT = PIT_TOTAL_SHIFTS['A']
+# A's capture targets (in B's pit bytes) are moved this far up, past byte 12,
+# so one multiplication by BYTE_SUM_MULTIPLIER sums both players' targets:
+# B's into byte 12 and A's into byte 25
+A_TARGETS_SHIFT = 13 * PIT_BITS
+A_TARGETS_SUM_SHIFT = 25 * PIT_BITS
+
+
+def pack_board(board_list):
+    state = 0
+    for i, num_seeds in enumerate(board_list):
+        state |= num_seeds << (i * PIT_BITS)
+    state |= sum(board_list[0:6]) << PIT_TOTAL_SHIFTS['B']
+    state |= sum(board_list[7:13]) << PIT_TOTAL_SHIFTS['A']
+    return state
+
+
+def unpack_board(state):
+    return list(state.to_bytes(STATE_BYTES, 'little')[:14])
+
+
+SIDE_MASK = (1 << (7 * PIT_BITS)) - 1
+B_PIT_TOTAL_MASK = PIT_MASK << PIT_TOTAL_SHIFTS['B']
+
+
+# the state with the sides swapped: bytes 0-6 (B's pits and store) trade
+# places with bytes 7-13 (A's), and byte 14 (B's pit total) with byte 15
+def rotate_state(state):
+    return (((state & SIDE_MASK) << (7 * PIT_BITS)) | ((state >> (7 * PIT_BITS)) & SIDE_MASK)
+            | ((state & B_PIT_TOTAL_MASK) << PIT_BITS) | ((state >> PIT_BITS) & B_PIT_TOTAL_MASK))
+
+
+# Precomputes, for every (player, pit, count), the single integer that sowing
+# count seeds from pit adds to the packed state (emptying the pit and the pit
+# totals included), and the index the last seed lands on.
+def build_sow_tables(max_seeds=TOTAL_SEEDS):
+    tables = {}
+    for player, skip in (('B', 13), ('A', 6)):
+        per_pit = []
+        for pit_num in range(14):
+            per_count = []
+            for num_seeds in range(max_seeds + 1):
+                delta = -(num_seeds << (pit_num * PIT_BITS))
+                if PIT_OWNERS[pit_num]:
+                    delta -= num_seeds << PIT_TOTAL_SHIFTS[PIT_OWNERS[pit_num]]
+                i = pit_num
+                remaining = num_seeds
+                while remaining > 0:
+                    i = (i + 1) % 14
+                    # skip opponent's store (home)
+                    if i == skip:
+                        continue
+                    delta += 1 << (i * PIT_BITS)
+                    if PIT_OWNERS[i]:
+                        delta += 1 << PIT_TOTAL_SHIFTS[PIT_OWNERS[i]]
+                    remaining -= 1
+                per_count.append((delta, i))
+            per_pit.append(per_count)
+        tables[player] = per_pit
+    return tables
+
+
+SOW_TABLES = build_sow_tables()
+
+
+# Board whose 14 pits/stores live in one packed integer (self.state). Sowing is
+# a table lookup and one addition instead of a seed-by-seed loop, and an undo
+# record is just the previous state. The rest of the Board API is unchanged;
+# self.board is still available as a list, but it is a fresh copy on every
+# access, so assign to it rather than mutating it in place.
+class PackedBoard(Board):
+    @property
+    def board(self):
+        return unpack_board(self.state)
+
+    @board.setter
+    def board(self, board_list):
+        self.state = pack_board(board_list)
+
+    # only the standard six pits a side fit the sowing tables
+    def __init__(self, pits_per_side=6, seeds_per_pit=4):
+        if pits_per_side != 6 or 12 * seeds_per_pit > TOTAL_SEEDS:
+            raise ValueError(f"PackedBoard holds Kalah(6, n) for n <= {TOTAL_SEEDS // 12}, "
+                             f"not Kalah({pits_per_side}, {seeds_per_pit})")
+        super().__init__(pits_per_side, seeds_per_pit)
+
+    @classmethod
+    def from_board(cls, board: Board):
+        packed = cls(board.pits_per_side, board.seeds_per_pit)
+        packed.board = board.board
+        packed.extra_move = board.extra_move
+        packed.current_capture = board.current_capture
+        return packed
 
-        # for computer
+    def get_pit_seeds(self, pit_num):
+        if not (0 <= pit_num <= 5) and not (7 <= pit_num <= 12):
+            return -1
+        return (self.state >> (pit_num * PIT_BITS)) & PIT_MASK
+
+    def get_store_counts(self):
+        return {"A": (self.state >> (13 * PIT_BITS)) & PIT_MASK,
+                "B": (self.state >> (6 * PIT_BITS)) & PIT_MASK}
+
+    def get_store_count(self, player):
+        return (self.state >> STORE_SHIFTS[player]) & PIT_MASK
+
+    # no running count needed: XOR with the perfect pattern zeroes exactly the
+    # perfect pits' bytes, and adding 0x7F to every byte (counts stay below
+    # 0x80, so nothing carries) sets the top bit of all the others
+    def perf_dist_count(self, player):
+        x = (self.state & PITS_MASKS[player]) ^ PERFECT_PATTERNS[player]
+        return 6 - ((x + PITS_LOW_BITS[player]) & PITS_TOP_BITS[player]).bit_count()
+
+    def position_key(self):
+        return self.state
+
+    def zobrist_hash(self, player):
+        key = ZOBRIST_SIDE[player]
+        for i, num_seeds in enumerate(self.state.to_bytes(STATE_BYTES, 'little')[:14]):
+            key ^= ZOBRIST_KEYS[i][num_seeds]
+        return key
+
+    def canonical_key(self, player):
         if player == 'A':
-            start = 7
-            end = 13
+            return rotate_state(self.state)
+        return self.state
 
-        for i in range(start, end):
-            score += self.board[i]
+    # A's keys are B's rotated by a side, so the state needn't be rotated first
+    def canonical_hash(self, player):
+        key = 0
+        for keys, num_seeds in zip(CANONICAL_ZOBRIST_KEYS[player], self.state.to_bytes(STATE_BYTES, 'little')[:14]):
+            key ^= keys[num_seeds]
+        return key
+
+    def rotated(self):
+        rotated = PackedBoard(self.pits_per_side, self.seeds_per_pit)
+        rotated.state = rotate_state(self.state)
+        return rotated
+
+    def get_player_seeds(self, player):
+        return (self.state >> PIT_TOTAL_SHIFTS[player]) & PIT_MASK
+
+    # adding 0x7F to each of player's pit bytes sets the top bit of exactly
+    # the non-empty ones, which together key the action table
+    def legal_actions(self, player):
+        pits_mask, low_bits, top_bits, table = PACKED_LEGAL_ACTIONS[player]
+        return table[((self.state & pits_mask) + low_bits) & top_bits]
 
-        return score
-    
-    # Returns true when either player has no seeds on their side
     def at_terminal_state(self):
-        status = self.players_done()
-        return status[0] or status[1]
-    
+        return not (self.state & B_PITS_MASK and self.state & A_PITS_MASK)
+
+    def store_reach_count(self, player):
+        pits_mask, _, top_bits, _ = PACKED_LEGAL_ACTIONS[player]
+        return (((self.state & pits_mask) + REACH_OFFSETS[player]) & top_bits).bit_count()
+
+    def capture_targets(self, player):
+        pits_mask, low_bits, top_bits, _ = PACKED_LEGAL_ACTIONS[player]
+        empty = ~((self.state & pits_mask) + low_bits) & top_bits
+        targets = self.state & CAPTURE_TARGET_MASKS[player][empty]
+        return ((targets * BYTE_SUM_MULTIPLIER) >> BYTE_SUM_SHIFT) & PIT_MASK
+
+    # the same tricks as the methods above, each applied to both sides in one
+    # addition, so the whole vector costs little more than two features did
+    def feature_values(self, player):
+        state = self.state
+        pits = state & ALL_PITS_MASK
+        occupied = pits + ALL_LOW_BITS
+        reach = pits + ALL_REACH_OFFSETS
+        # top bits set for the pits not at their perfect distance
+        imperfect = (pits ^ ALL_PERFECT_PATTERNS) + ALL_LOW_BITS
+        targets = ((state & B_CAPTURE_TARGET_MASKS[~occupied & B_TOP_BITS])
+                   | (state & A_CAPTURE_TARGET_MASKS[~occupied & A_TOP_BITS]) << A_TARGETS_SHIFT)
+        targets *= BYTE_SUM_MULTIPLIER
+        values = (((state >> B_STORE_SHIFT) & PIT_MASK) - ((state >> A_STORE_SHIFT) & PIT_MASK),
+                  ((state >> B_PIT_TOTAL_SHIFT) & PIT_MASK) - ((state >> A_PIT_TOTAL_SHIFT) & PIT_MASK),
+                  (occupied & B_TOP_BITS).bit_count() - (occupied & A_TOP_BITS).bit_count(),
+                  ((targets >> BYTE_SUM_SHIFT) & PIT_MASK) - ((targets >> A_TARGETS_SUM_SHIFT) & PIT_MASK),
+                  (reach & B_TOP_BITS).bit_count() - (reach & A_TOP_BITS).bit_count(),
+                  (imperfect & A_TOP_BITS).bit_count() - (imperfect & B_TOP_BITS).bit_count())
+        if player == 'A':
+            return tuple(-value for value in values)
+        return values
+
     def players_done(self):
-        userDone = True
-
-        # up to user's store
-        for i in range(6):
-            if self.board[i] != 0:
-                userDone = False
-                break
-
-        # up to computer's store
-        computerDone = True
-        for i in range(7, 13):
-            # TESTING
-            # print(f"at {i}: {self.board[i]}")
-            if self.board[i] != 0:
-                computerDone = False
-                break
+        return (self.state & B_PITS_MASK == 0, self.state & A_PITS_MASK == 0)
 
-        # TESTING
-        # print(f"userDone: {userDone}, computerDone: {computerDone}")
+    def move_seeds(self, pit_num, player):
+        shift = pit_num * PIT_BITS
+        delta, i = SOW_TABLES[player][pit_num][(self.state >> shift) & PIT_MASK]
+        self.state += delta
 
-        return (userDone, computerDone)
+        # if last seed lands in pit, active player gets an extra turn
+        if (player == 'B' and i == 6) or (player == 'A' and i == 13):
+            self.extra_move = player
+        else:
+            self.extra_move = None
 
-    def print_pit(self, num_seeds, player):
-        # padding: should add up to exactly 4 spaces when printed with num_seeds
-        padding = "".join((4 - len(str(num_seeds))) * [" "])
+        # ACCOUNT FOR CAPTURES
+        self.current_capture = None
+        if (player == 'B' and 0 <= i <= 5) or (player == 'A' and 7 <= i <= 12):
+            if (self.state >> (i * PIT_BITS)) & PIT_MASK == 1:
+                if (self.state >> ((12 - i) * PIT_BITS)) & PIT_MASK > 0:
+                    self.current_capture = (player, i, 12 - i)
 
-        cprint(f'{num_seeds}{padding}',
-            "white",
-            self.player_to_background[player],
-            end="")
-        
-        # add white space between each pit, and prevent newline
-        print(" ", end="") 
-
-    # so we can align A and B's pits with each other on different lines
-    def print_empty_home(self, player):
-        cprint('    ',
-            "white",
-            self.player_to_background[player],
-            attrs=['bold'],
-            end="")
-        print(" ", end="")
-
-
-    def print_home(self, num_seeds, player):
-        # again, total space alloted to printing should be 4 spaces
-        padding = "".join((4 - len(str(num_seeds))) * [" "])
-        cprint(f'{num_seeds}{padding}',
-            "white",
-            self.player_to_background[player],
-            attrs=['bold'],
-            end="")
-        print(" ", end="")
+    def perform_capture(self):
+        capturing_player, capturing_pit, captured_pit = self.current_capture
 
+        store = 6
+        if capturing_player == 'A':
+            store = 13
+
+        capturing_shift = capturing_pit * PIT_BITS
+        captured_shift = captured_pit * PIT_BITS
+        capturing_seeds = (self.state >> capturing_shift) & PIT_MASK
+        captured_seeds = (self.state >> captured_shift) & PIT_MASK
+        self.state &= ~((PIT_MASK << capturing_shift) | (PIT_MASK << captured_shift))
+        self.state += (capturing_seeds + captured_seeds) << (store * PIT_BITS)
+
+        # the captured pit is on the other player's side
+        self.state -= capturing_seeds << PIT_TOTAL_SHIFTS[capturing_player]
+        self.state -= captured_seeds << PIT_TOTAL_SHIFTS[PIT_OWNERS[captured_pit]]
+
+    def move_outcome(self, pit_num, player):
+        shift = pit_num * PIT_BITS
+        delta, i = SOW_TABLES[player][pit_num][(self.state >> shift) & PIT_MASK]
+        if (player == 'B' and i == 6) or (player == 'A' and i == 13):
+            return True, False
+        if (player == 'B' and 0 <= i <= 5) or (player == 'A' and 7 <= i <= 12):
+            after = self.state + delta
+            return False, ((after >> (i * PIT_BITS)) & PIT_MASK == 1
+                           and (after >> ((12 - i) * PIT_BITS)) & PIT_MASK > 0)
+        return False, False
+
+    def make_move(self, pit_num, player, apply_capture=False):
+        undo = (self.state, self.extra_move, self.current_capture)
+        self.move_seeds(pit_num, player)
+        if apply_capture and self.current_capture:
+            self.perform_capture()
+        return undo
+
+    def unmake_move(self, undo):
+        self.state, self.extra_move, self.current_capture = undo
+
+
+# == Transposition table =======================================================
+
+# Zobrist keys: one random 64-bit number per (pit/store index, seed count),
+# plus one per side to move. Seeded so every process hashes the same way.
+_zobrist_random = random.Random(0x6B616C6168)
+ZOBRIST_KEYS = [[_zobrist_random.getrandbits(64) for _ in range(TOTAL_SEEDS + 1)]
+                for _ in range(14)]
+ZOBRIST_SIDE = {'B': 0, 'A': _zobrist_random.getrandbits(64)}
+
+# Zobrist keys by board index for hashing the position as player sees it (see
+# Board.canonical_hash): A's pits take the keys of the matching B pits
+CANONICAL_ZOBRIST_KEYS = {'B': ZOBRIST_KEYS, 'A': ZOBRIST_KEYS[7:] + ZOBRIST_KEYS[:7]}
+
+# hashed in when the agent's opponent is to move, since the agent's own
+# evaluation makes those positions worth something different
+ZOBRIST_OPPONENT_TO_MOVE = _zobrist_random.getrandbits(64)
+
+# rough size of one stored entry (tuple plus its contents), used to turn a
+# memory budget into a slot count
+TT_ENTRY_BYTES = 128
+
+# nodes with fewer plies left than this are cheaper to search than to look up
+TT_MIN_DEPTH = 2
+
+# depth stored for results that no depth limit cut short
+TT_SOLVED_DEPTH = 1000
+
+# bound types
+TT_EXACT = 0
+TT_LOWER = 1
+TT_UPPER = 2
+
+
+# Fixed-size table of search results, indexed by Zobrist hash. Each entry is
+# (position, player, depth, bound, value, action, owner); the exact position is
+# kept so that two positions sharing a slot are told apart. Agents store
+# canonical positions (see Board.canonical_key), whether they themselves are
+# to move as the player, actions relative to the mover's first pit and their
+# own side as the owner, so the agents on both seats can share one table;
+# shared_hits counts the hits on entries the other seat stored.
+#
+# Replacement policies:
+#   'depth'    - one slot per index, kept unless the new result is at least as deep
+#   'two-tier' - two slots per index: a depth-preferred one and an always-replace one
+class TranspositionTable:
+    def __init__(self, size_mb=16, policy='two-tier'):
+        if policy == 'depth':
+            self.ways = 1
+        elif policy == 'two-tier':
+            self.ways = 2
+        else:
+            raise ValueError(f"Unknown replacement policy: {policy}")
+        self.policy = policy
+
+        # settings of the agents using the table (see Agent.__init__); agents
+        # with other settings would misread its values
+        self.variant = None
+
+        # round the number of indices down to a power of two so we can mask
+        num_slots = max(self.ways, int(size_mb * 2**20) // TT_ENTRY_BYTES)
+        self.num_indices = 1 << ((num_slots // self.ways).bit_length() - 1)
+        self.slots = [None] * (self.num_indices * self.ways)
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def probe(self, zobrist_key, position, player, owner=None):
+        start = (zobrist_key & (self.num_indices - 1)) * self.ways
+        occupied = False
+        for slot in range(start, start + self.ways):
+            entry = self.slots[slot]
+            if entry is None:
+                continue
+            if entry[0] == position and entry[1] == player:
+                self.hits += 1
+                if entry[6] != owner:
+                    self.shared_hits += 1
+                return entry
+            occupied = True
+
+        # a different position owns the index
+        if occupied:
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def store(self, zobrist_key, position, player, depth, bound, value, action, owner=None):
+        start = (zobrist_key & (self.num_indices - 1)) * self.ways
+        entry = (position, player, depth, bound, value, action, owner)
+        self.stores += 1
+
+        old = self.slots[start]
+        if old is None or (old[0] == position and old[1] == player) or depth >= old[2]:
+            self.slots[start] = entry
+        elif self.ways == 2:
+            self.slots[start + 1] = entry
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            "policy": self.policy,
+            "slots": len(self.slots),
+            "used": sum(1 for entry in self.slots if entry is not None),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "hit_rate": self.hits / probes if probes else 0.0,
+        }
+
+
+# == Move ordering =============================================================
+
+# Orders the actions at each node of standard_minimax so that alpha-beta cuts
+# off sooner: the transposition-table / previous-iteration action first, then
+# this ply's killer actions (recent cutoffs at the same tree level), then
+# actions giving an extra move, then captures, each group by history score
+# (cutoffs anywhere, weighted by depth) and then pit order. Killers go ahead
+# of the tactical actions because they cut off more often with the research
+# evaluation, which only counts the agent's own seeds. Killers and history are kept
+# for a whole decision; history is halved, not cleared, between decisions.
+#
+# Also counts how well the ordering works: the effective branching factor
+# (children searched per expanded node) and how often a cutoff came from
+# the first child.
+class MoveOrderer:
+    def __init__(self, killers_per_ply=2):
+        self.killers_per_ply = killers_per_ply
+        self.killers = {}
+        self.history = {'A': [0] * 14, 'B': [0] * 14}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.nodes_expanded = 0
+        self.children_searched = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        self.killers.clear()
+        for scores in self.history.values():
+            for i in range(len(scores)):
+                scores[i] //= 2
+        self.reset_stats()
+
+    def order(self, board: Board, player, actions, tree_level, first_action=None):
+        killers = self.killers.get((tree_level, player), ())
+        history = self.history[player]
+
+        ranked = []
+        for action in actions:
+            if action == first_action:
+                rank = 0
+            elif action in killers:
+                rank = 1
+            else:
+                extra_move, capture = board.move_outcome(action, player)
+                if extra_move:
+                    rank = 2
+                elif capture:
+                    rank = 3
+                else:
+                    rank = 4
+            ranked.append((rank, -history[action], action))
+        ranked.sort()
+        return [action for rank, score, action in ranked]
+
+    # first_action, then extra moves, then captures, then pit order
+    def order_root(self, board: Board, player, actions, first_action=None):
+        ranked = []
+        for action in actions:
+            if action == first_action:
+                rank = 0
+            else:
+                extra_move, capture = board.move_outcome(action, player)
+                if extra_move:
+                    rank = 1
+                elif capture:
+                    rank = 2
+                else:
+                    rank = 3
+            ranked.append((rank, action))
+        ranked.sort()
+        return [action for rank, action in ranked]
+
+    # called when the child at position index (0 = first) caused a cutoff
+    def record_cutoff(self, player, action, tree_level, depth_left, index):
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+
+        self.history[player][action] += depth_left * depth_left
+
+        killers = self.killers.setdefault((tree_level, player), [])
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[self.killers_per_ply:]
+
+    def record_node(self, children_searched):
+        self.nodes_expanded += 1
+        self.children_searched += children_searched
+
+    def stats(self):
+        return {
+            "nodes_expanded": self.nodes_expanded,
+            "effective_branching_factor":
+                self.children_searched / self.nodes_expanded if self.nodes_expanded else 0.0,
+            "cutoffs": self.cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+        }
+
+
+# nodes with fewer plies left than this keep pit order; their children are
+# leaves, which cost about as much to evaluate as to sort
+ORDERING_MIN_DEPTH = 2
+
+# deepest iteration tried when searching against a time budget
+MAX_SEARCH_DEPTH = 30
+
+# how many nodes are searched between clock checks
+NODES_PER_CLOCK_CHECK = 1024
+
+# Principal variation search: every action after a node's first is searched
+# with a window this narrow around the bound it has to beat, and searched
+# again with the node's full window only if it beats it
+NULL_WINDOW = 1e-9
+
+# Late-move reductions: from a node's LMR_MIN_ACTIONS-th action on, actions
+# with neither an extra move nor a capture are searched LMR_REDUCTION levels
+# shallower, and again at full depth if they turn out better than the
+# window's bound. Only nodes with at least LMR_MIN_DEPTH levels left reduce,
+# so a reduced search never skips past the depth limit.
+LMR_MIN_ACTIONS = 3
+LMR_MIN_DEPTH = 3
+LMR_REDUCTION = 1
+
+# Aspiration windows: under iterative deepening, each iteration after the
+# first searches the root with a window this wide either side of the last
+# iteration's value, widening it on a fail up to ASPIRATION_RETRIES times
+# before falling back to a full window
+ASPIRATION_WINDOW = 1.0
+ASPIRATION_RETRIES = 2
+
+
+# == Search statistics =========================================================
+
+# What one call to Agent.get_next_action did. source says how the action was
+# found: 'book', 'endgame', 'extra_move' / 'capture' (the research shortcuts)
+# or 'search'. Per-depth entries are one per iterative deepening iteration
+# (the last one may have been cut short by the time budget). max_ply counts
+# every move from the root, including extra moves that don't advance
+# tree_level. extra holds move-ordering stats and whatever hooks add.
+class SearchStats:
+    def __init__(self, side):
+        self.side = side
+        self.source = None
+        self.action = None
+        self.seconds = 0.0
+        self.depth_reached = 0
+        self.nodes = 0
+        self.nodes_per_depth = {}
+        self.seconds_per_depth = {}
+        self.cutoffs = 0
+        self.eval_calls = 0
+        self.max_ply = 0
+        self.extra = {}
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+
+# Decision hooks are objects with before_decision(agent) and
+# after_decision(agent, stats), called around every get_next_action.
+
+# Profiles every n-th decision with cProfile and dumps it to a pstats file
+class CProfileHook:
+    def __init__(self, every=1, path_template="decision-{decision}.prof"):
+        self.every = every
+        self.path_template = path_template
+        self.decisions = 0
+        self.profiler = None
+
+    def before_decision(self, agent):
+        self.decisions += 1
+        if self.decisions % self.every == 0:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def after_decision(self, agent, stats):
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        path = self.path_template.format(decision=self.decisions)
+        self.profiler.dump_stats(path)
+        stats.extra["profile_path"] = path
+        self.profiler = None
+
+
+# Records peak Python memory allocated during every n-th decision
+class TracemallocHook:
+    def __init__(self, every=1):
+        self.every = every
+        self.decisions = 0
+        self.sampling = False
+        self.started = False
+
+    def before_decision(self, agent):
+        self.decisions += 1
+        self.sampling = self.decisions % self.every == 0
+        if not self.sampling:
+            return
+        # leave tracing running if someone else started it
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    def after_decision(self, agent, stats):
+        if not self.sampling:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        if self.started:
+            tracemalloc.stop()
+        stats.extra["peak_memory_bytes"] = peak
+
+
+# leaf evaluations an Agent can be configured with, by name
+EVALUATIONS = {'research': 'eval_func_research', 'basic': 'eval_func', 'features': 'eval_func_features'}
+
+# raised inside the search when the time budget runs out or the search is
+# cancelled
+class SearchTimeout(Exception):
+    pass
 
-    def print_board(self):
-        self.print_home(self.board[len(self.board) - 1], 'A')
-        for pit in reversed(self.board[7:len(self.board) - 1]):
-            self.print_pit(pit, 'A')
-        self.print_home(self.board[6], 'B')
-        print()
-        self.print_empty_home('A')
-        for pit in (self.board[0:6]):
-            self.print_pit(pit, 'B')
-        self.print_empty_home('B')
-        print()    
 
 class Agent:
-    def __init__(self, depth, side, opponent_side):
+    def __init__(self, depth, side, opponent_side, tt_size_mb=16, tt_policy='two-tier',
+                 workers=None, evaluation='research', endgame_path=None, book_path=None,
+                 move_ordering=True, hooks=(), stats_log=None, cache_path=None, cache_mb=64, weights=None,
+                 tt=None, pvs=False, aspiration=False, lmr=False):
         # cutoff depth for minimaxing
         self.depth = depth
         self.side = side
         self.opponent_side = opponent_side
-        
 
-    def get_next_action(self, board: Board):
+        # heuristic used at the leaves of standard_minimax
+        if evaluation not in EVALUATIONS:
+            raise ValueError(f"Unknown evaluation: {evaluation}")
+        # database values are final scores, on the research evaluation's
+        # scale; mixed into another evaluation's tree they would swamp it
+        if endgame_path and evaluation != 'research':
+            raise ValueError(f"The endgame database only works with the research evaluation, not {evaluation}")
+        self.evaluate = getattr(self, EVALUATIONS[evaluation])
+
+        # weighted features for the 'features' evaluation: a dict of feature
+        # name -> weight, a JSON file of them, or None for the defaults (see
+        # evaluation.py)
+        self.features = None
+        if evaluation == 'features':
+            from evaluation import FeatureEvaluation
+            self.features = FeatureEvaluation(weights)
+            self.evaluate = self.features.evaluator(side)
+            weights = tuple(self.features.weights.items())
+        else:
+            weights = None
+
+        # number of processes for parallel root search; the pool is started on
+        # first use and kept for the agent's lifetime (see close())
+        self.workers = workers
+        self.pool = None
+
+        # search refinements, each switchable so it can be benchmarked alone:
+        # principal variation search, aspiration windows (time-budgeted
+        # searches only) and late-move reductions. PVS and aspiration windows
+        # never change a search's result; LMR trades some accuracy for depth.
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self.lmr = lmr
+        self.pvs_researches = 0
+        self.lmr_reductions = 0
+        self.lmr_researches = 0
+        self.aspiration_researches = 0
+
+        # keyword arguments for the single-process copies of this agent in the
+        # pool; they search without a pool, book, cache, hooks or stats log
+        # of their own
+        self.worker_config = {"depth": depth, "side": side, "opponent_side": opponent_side,
+                              "tt_size_mb": tt_size_mb, "tt_policy": tt_policy, "evaluation": evaluation,
+                              "endgame_path": endgame_path, "move_ordering": move_ordering,
+                              "weights": weights, "pvs": pvs, "aspiration": aspiration, "lmr": lmr}
+
+        # orders actions in standard_minimax; None searches in pit order
+        self.orderer = None
+        if move_ordering:
+            self.orderer = MoveOrderer()
+
+        # opening moves found offline (see book.py); mapped on first use
+        self.book = None
+        if book_path:
+            from book import OpeningBook
+            self.book = OpeningBook(book_path)
+
+        # perfect-play values for positions with few seeds left (see endgame.py)
+        self.endgame = None
+        if endgame_path:
+            from endgame import EndgameDatabase
+            self.endgame = EndgameDatabase(endgame_path)
+            # the agent plays Kalah(6, 4); another size's values would be wrong
+            if self.endgame.pits_per_side != 6:
+                pits_per_side = self.endgame.pits_per_side
+                self.endgame.close()
+                raise ValueError(f"{endgame_path} is for {pits_per_side} pits a side, not 6")
+
+        # root search results shared with other agents and later processes
+        # (see cache.py); the variant keeps apart settings that change them
+        self.cache = None
+        self.cache_variant = (list(EVALUATIONS).index(evaluation) | (bool(move_ordering) << 4)
+                              | (bool(endgame_path) << 5) | (bool(lmr) << 6))
+        # the variant can't tell weight sets apart, so they salt the position hash
+        self.cache_salt = 0
+        if self.features is not None:
+            digest = hashlib.blake2b(json.dumps(sorted(weights)).encode(), digest_size=8).digest()
+            self.cache_salt = int.from_bytes(digest, 'little')
+        if cache_path:
+            from cache import shared_cache
+            self.cache = shared_cache(cache_path, cache_mb)
+
+        # cutoff depth of the search in progress; differs from self.depth
+        # only while iterative deepening
+        self.search_depth = depth
+
+        # set while a time-budgeted search may be interrupted
+        self.deadline = None
+        self.hit_horizon = False
+
+        # set from another thread to stop the search in progress at its next
+        # clock check, which needs a deadline (see ponder.py)
+        self.cancelled = False
+
+        # results of standard_minimax are kept across decisions; a size of 0
+        # turns the table off. tt, if given, is a table to share instead, e.g.
+        # with the agent on the other seat, which must have the same settings.
+        self.tt = None
+        if tt is not None:
+            if tt.variant is None:
+                tt.variant = (self.cache_variant, self.cache_salt)
+            elif tt.variant != (self.cache_variant, self.cache_salt):
+                raise ValueError("The transposition table is shared with an agent with different settings")
+            self.tt = tt
+        elif tt_size_mb:
+            self.tt = TranspositionTable(tt_size_mb, tt_policy)
+
+        # nodes visited and depth completed during the last decision
+        self.nodes = 0
+        self.depth_reached = 0
+
+        # statistics of the last decision, optionally appended to stats_log
+        # (a path) as JSON lines
+        self.stats = SearchStats(side)
+        self.ply = 0
+        self.hooks = list(hooks)
+        self.stats_log = stats_log
+        self.stats_file = None
+
+    # With a time budget (in milliseconds), searches by iterative deepening and
+    # returns the best action of the deepest search that finished in time.
+    # Otherwise searches to the fixed cutoff depth.
+    def get_next_action(self, board: Board, time_budget_ms=None):
+        self.nodes = 0
+        self.depth_reached = 0
+        self.time_budget_ms = time_budget_ms
+        self.stats = SearchStats(self.side)
+        self.ply = 0
+        if self.orderer is not None:
+            self.orderer.new_search()
+        self.pvs_researches = 0
+        self.lmr_reductions = 0
+        self.lmr_researches = 0
+        self.aspiration_researches = 0
+
+        for hook in self.hooks:
+            hook.before_decision(self)
+        tic = time.perf_counter()
+        action = self.choose_action(board)
+        toc = time.perf_counter()
+
+        stats = self.stats
+        stats.action = action
+        stats.seconds = toc - tic
+        stats.nodes = self.nodes
+        stats.depth_reached = self.depth_reached
+        if self.orderer is not None:
+            stats.extra["ordering"] = self.orderer.stats()
+        if self.pvs or self.aspiration or self.lmr:
+            stats.extra["refinements"] = {"pvs_researches": self.pvs_researches,
+                                          "lmr_reductions": self.lmr_reductions,
+                                          "lmr_researches": self.lmr_researches,
+                                          "aspiration_researches": self.aspiration_researches}
+        for hook in self.hooks:
+            hook.after_decision(self, stats)
+
+        if self.stats_log:
+            if self.stats_file is None:
+                self.stats_file = open(self.stats_log, "a")
+            self.stats_file.write(stats.to_json() + "\n")
+            self.stats_file.flush()
+
+        return action
+
+    def choose_action(self, board: Board):
+        # opening positions are looked up, not searched
+        if self.book is not None:
+            action = self.book.lookup(board, self.side)
+            if action is not None and board.get_pit_seeds(action) > 0:
+                self.stats.source = "book"
+                return action
+
+        # search on a packed copy; the caller's board is never touched
+        board = PackedBoard.from_board(board)
+
         # TESTING
         return self.get_next_action_research(board)
     
@@ -260,7 +1323,7 @@ class Agent:
 
         # good: put seed in store
         # store_count = board.get_store_counts()['A']
-        store_count = board.get_store_counts()[self.side]
+        store_count = board.get_store_count(self.side)
 
         # TODO: if no seed can make it to the store, then what?
 
@@ -277,125 +1340,477 @@ class Agent:
 
         return 0.5 * store_count + 0.25 * perf_dist + 0.25 * pit_count
     
+    # Exact value of a position from the endgame database, on the scale
+    # eval_func_research gives finished games (half of the agent's final score),
+    # or None if the position has too many seeds left
+    def endgame_value(self, player, board: Board):
+        difference = self.endgame.value(board, player)
+        if difference is None:
+            return None
+        if player != self.side:
+            difference = -difference
+
+        # the pit seeds split so that own share - opponent share == difference
+        pit_seeds = board.get_player_seeds('A') + board.get_player_seeds('B')
+        final_score = board.get_store_count(self.side) + (pit_seeds + difference) // 2
+        return 0.5 * final_score
+
+    # reads the board's running totals, so it's O(1) and allocates nothing
     def eval_func_research(self, board: Board):
-        store_count = board.get_store_counts()[self.side]
+        store_count = board.get_store_count(self.side)
         pit_count = board.get_player_seeds(self.side)
         # return 0.75 * store_count + 0.25 * pit_count
         return 0.5 * store_count + 0.5 * pit_count
     
+    # weighted features, from the agent's side (see evaluation.py)
+    def eval_func_features(self, board: Board):
+        return self.features.evaluate(board, self.side)
+
     # From research paper
     # This modified minimaxing function returns the best action to take for the passed-in
     # player given a state (board layout)
     def modified_minimax(self, player, board: Board, alpha, beta, tree_level):
         # stopping conditions
         if not (self.at_terminal_state(board) or self.at_max_depth(tree_level)):
+            # few enough seeds left to play perfectly from the endgame database
+            if self.endgame is not None:
+                action, value = self.endgame.best_action(board, player)
+                if action is not None:
+                    self.stats.source = "endgame"
+                    return action
+
             # get action leading to extra turn, if any
             action = self.last_seed_to_kahala(player, board)
 
-            # extra turn possible; take immediately
-            if action:
+            # extra turn possible; take immediately (pit 0 is a valid action)
+            if action is not None:
+                self.stats.source = "extra_move"
                 return action
             
             # get action leading to capture, if any
             action = self.last_seed_to_target_simple(player, board)
 
             # capture possible; take immediately
-            if action:
+            if action is not None:
+                self.stats.source = "capture"
                 return action
             
             # none of the special cases above have been met; commence standard minimaxing
-            return self.standard_minimax(player, board, alpha, beta, tree_level)["action"]
+            self.stats.source = "search"
+            if self.time_budget_ms is not None:
+                return self.iterative_deepening(player, board, self.time_budget_ms)
+
+            self.depth_reached = self.depth
+            tic = time.perf_counter()
+            self.hit_horizon = False
+            action = self.cached_search_root(player, board)["action"]
+            self.stats.nodes_per_depth[self.depth] = self.nodes
+            self.stats.seconds_per_depth[self.depth] = time.perf_counter() - tic
+            return action
 
         # this shouldn't happen 
         return None
     
+    # Runs standard_minimax at increasing cutoff depths until the time budget is
+    # spent, trying each iteration's best action first in the next one (and,
+    # with aspiration windows, centring its window on the last value).
+    # The first iteration always runs to completion so there is an action to return.
+    def iterative_deepening(self, player, board: Board, time_budget_ms):
+        deadline = time.perf_counter() + time_budget_ms / 1000
+        best_action = None
+        guess = None
+
+        try:
+            for depth in range(1, MAX_SEARCH_DEPTH + 1):
+                self.search_depth = depth
+                self.hit_horizon = False
+                self.ply = 0
+                tic = time.perf_counter()
+                nodes_before = self.nodes
+                try:
+                    result = self.cached_search_root(player, board, best_action, guess)
+                finally:
+                    self.stats.nodes_per_depth[depth] = self.nodes - nodes_before
+                    self.stats.seconds_per_depth[depth] = time.perf_counter() - tic
+                best_action = result["action"]
+                guess = result["value"]
+                self.depth_reached = depth
+
+                # nothing was cut off by the depth limit, so deeper won't change anything
+                if not self.hit_horizon:
+                    break
+
+                if time.perf_counter() >= deadline:
+                    break
+                self.deadline = deadline
+        except SearchTimeout:
+            pass
+        finally:
+            self.search_depth = self.depth
+            self.deadline = None
+
+        return best_action
+
+    # Searches the root position with standard_minimax, splitting the root
+    # actions across the worker pool when parallel search is enabled. guess,
+    # the value expected, centres an aspiration window if they're switched on.
+    def search_root(self, player, board: Board, first_action=None, guess=None):
+        actions = self.root_actions(player, board, first_action)
+        if self.workers and isinstance(board, PackedBoard) and player == self.side:
+            return self.parallel_root_search(player, board, actions)
+        if guess is None or not self.aspiration:
+            return self.standard_minimax(player, board, float('-inf'), float('inf'), 0, actions=actions)
+
+        # a value strictly inside the window is exact, and so is the action:
+        # the first in search order with that value, as with a full window
+        delta = ASPIRATION_WINDOW
+        alpha, beta = guess - delta, guess + delta
+        for retry in range(ASPIRATION_RETRIES + 1):
+            result = self.standard_minimax(player, board, alpha, beta, 0, actions=actions)
+            value = result["value"]
+            if alpha < value < beta:
+                return result
+            self.aspiration_researches += 1
+            delta *= 4
+            if value <= alpha:
+                alpha = value - delta
+            else:
+                beta = value + delta
+        return self.standard_minimax(player, board, float('-inf'), float('inf'), 0, actions=actions)
+
+    # search_root through the persistent cache, if there is one. A hit also
+    # restores hit_horizon, so iterative deepening still knows when to stop.
+    def cached_search_root(self, player, board: Board, first_action=None, guess=None):
+        if self.cache is None:
+            return self.search_root(player, board, first_action, guess)
+
+        # the canonical position, so agents on both seats share entries; a
+        # position hash of 0 would mark an empty slot in the snapshot file
+        position_hash = board.canonical_hash(player) ^ self.cache_salt
+        if player != self.side:
+            position_hash ^= ZOBRIST_OPPONENT_TO_MOVE
+        key = (position_hash or 1, self.search_depth, self.cache_variant)
+        first_pit = board.first_pit(player)
+        cached = self.cache.get(key)
+        if cached is not None:
+            value, action, self.hit_horizon = cached
+            self.stats.extra["cache_hits"] = self.stats.extra.get("cache_hits", 0) + 1
+            return {"value": value, "action": action + first_pit}
+
+        result = self.search_root(player, board, first_action, guess)
+        self.cache.put(key, (result["value"], result["action"] - first_pit, self.hit_horizon))
+        return result
+
+    # Root actions in search order. Unlike inner nodes, the root ignores killers
+    # and history, so which of several equally good actions gets picked doesn't
+    # depend on what earlier searches (or other processes) happened to see.
+    def root_actions(self, player, board: Board, first_action=None):
+        actions = board.get_legal_actions(player)
+        if self.orderer is not None:
+            return self.orderer.order_root(board, player, actions, first_action)
+        if first_action in actions:
+            actions.remove(first_action)
+            actions.insert(0, first_action)
+        return actions
+
+    # Young Brothers Wait: the first root action is searched here with a full
+    # window, then its value becomes alpha for the remaining actions, which are
+    # searched in the worker processes at the same time. The result (value and
+    # action) is the same as standard_minimax at the root: the first action in
+    # search order with the highest value.
+    def parallel_root_search(self, player, board: PackedBoard, actions):
+        self.nodes += 1
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        # (action, position after it, player to move, tree level)
+        children = []
+        for action in actions:
+            undo = board.make_move(action, player)
+            if board.gets_extra_move() == player:
+                children.append((action, board.state, player, 0))
+            else:
+                children.append((action, board.state, self.opponent_side, 1))
+            board.unmake_move(undo)
+
+        # eldest brother
+        action, state, next_player, tree_level = children[0]
+        child = PackedBoard()
+        child.state = state
+        # the root's children are at ply 1, as in the serial search, which
+        # late-move reductions depend on
+        self.ply = 1
+        try:
+            best_value = self.standard_minimax(next_player, child, float('-inf'), float('inf'), tree_level)["value"]
+        finally:
+            self.ply = 0
+        best_action = action
+
+        time_left = None
+        if self.deadline is not None:
+            time_left = self.deadline - time.perf_counter()
+
+        futures = [self.pool.submit(search_subtree, self.worker_config, state, next_player, tree_level,
+                                    best_value, self.search_depth, time_left)
+                   for action, state, next_player, tree_level in children[1:]]
+
+        try:
+            # collect in search order so ties go to the earlier action
+            for (action, *_), future in zip(children[1:], futures):
+                value, nodes, hit_horizon = future.result()
+                self.nodes += nodes
+                self.hit_horizon = self.hit_horizon or hit_horizon
+                if value > best_value:
+                    best_value = value
+                    best_action = action
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return {"value": best_value, "action": best_action}
+
+    # shuts down the parallel search pool, if one was started, closes the stats
+    # log and snapshots the search cache
+    def close(self):
+        if self.cache is not None:
+            self.cache.flush()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        if self.stats_file is not None:
+            self.stats_file.close()
+            self.stats_file = None
+
     # From research paper
     # Returns the first-discovered action leading to a capture for the passed-in player
     def last_seed_to_target_simple(self, player, board: Board):
-        for action in board.get_legal_actions(player):
-            board_copy = copy.deepcopy(board)
-            board_copy.move_seeds(action, player)
-
-            # get resulting capture, if any
-            capture = board_copy.get_capture()
-
-            # capture exists
+        for action in board.legal_actions(player):
+            # captures always go to the player who moved
+            extra_move, capture = board.move_outcome(action, player)
             if capture:
-                capturing_player, capturing_pit, captured_pit = capture
-
-                # extra safety check
-                if capturing_player == player:
-                    return action
+                return action
 
     # From research paper
     # Returns first-discovered action leading to an extra move for the passed-in player
     def last_seed_to_kahala(self, player, board: Board):
-        for action in board.get_legal_actions(player):
-            board_copy = copy.deepcopy(board)
-            board_copy.move_seeds(action, player)
-
-            # extra check to make sure it's the passed-in playe that gets the advantage
-            if board_copy.gets_extra_move() == player:
+        for action in board.legal_actions(player):
+            extra_move, capture = board.move_outcome(action, player)
+            if extra_move:
                 return action
 
     # From research paper
     # This minimaxing function returns a dictionary of the best action to take and its associated value 
     # According to the paper, the optimal depth is 4
-    def standard_minimax(self, player, board: Board, alpha, beta, tree_level):
+    # first_action, if legal, is searched before the others; actions, if given,
+    # is the exact order to search in (see root_actions)
+    def standard_minimax(self, player, board: Board, alpha, beta, tree_level, first_action=None,
+                         actions=None):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % NODES_PER_CLOCK_CHECK == 0:
+            if self.cancelled or time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+
         # print(f'tree level:{tree_level}')
-        if self.at_terminal_state(board) or self.at_max_depth(tree_level):
-            return {"value": self.eval_func_research(board), "action": None}
-        
+        if self.endgame is not None:
+            value = self.endgame_value(player, board)
+            if value is not None:
+                # callers at the root need an action too
+                action = None
+                if tree_level == 0:
+                    action, _ = self.endgame.best_action(board, player)
+                return {"value": value, "action": action}
+
+        if self.ply > self.stats.max_ply:
+            self.stats.max_ply = self.ply
+
+        if self.at_terminal_state(board):
+            self.stats.eval_calls += 1
+            return {"value": self.evaluate(board), "action": None}
+        if self.at_max_depth(tree_level):
+            self.hit_horizon = True
+            self.stats.eval_calls += 1
+            return {"value": self.evaluate(board), "action": None}
+
+        # reuse an earlier result for this position if it was searched at least as deep
+        tt_action = None
+        depth_left = 2 * self.search_depth - tree_level
+        use_tt = self.tt is not None and depth_left >= TT_MIN_DEPTH
+        if use_tt:
+            # keyed by the canonical position and whether the agent is to
+            # move, so the agent on the other seat can use it too
+            agent_to_move = player == self.side
+            zobrist_key = board.canonical_hash(player)
+            if not agent_to_move:
+                zobrist_key ^= ZOBRIST_OPPONENT_TO_MOVE
+            position = board.canonical_key(player)
+            first_pit = board.first_pit(player)
+            entry = self.tt.probe(zobrist_key, position, agent_to_move, self.side)
+            if entry:
+                entry_depth, bound, entry_value, tt_action = entry[2:6]
+                if tt_action is not None:
+                    tt_action += first_pit
+                # only same-depth or fully resolved results are used, so the table
+                # never changes a search's value (parallel and serial search agree)
+                if entry_depth == depth_left or entry_depth == TT_SOLVED_DEPTH:
+                    # the stored search may have stopped at its own depth limit
+                    if entry_depth < TT_SOLVED_DEPTH:
+                        self.hit_horizon = True
+                    if bound == TT_EXACT:
+                        return {"value": entry_value, "action": tt_action}
+                    elif bound == TT_LOWER:
+                        alpha = max(alpha, entry_value)
+                    else:
+                        beta = min(beta, entry_value)
+                    if beta <= alpha:
+                        return {"value": entry_value, "action": tt_action}
+            alpha_searched = alpha
+            beta_searched = beta
+
+        # track whether this subtree reaches the depth limit anywhere
+        outer_hit_horizon = self.hit_horizon
+        self.hit_horizon = False
+
+        # try the remembered best action first
+        if actions is None:
+            actions = board.legal_actions(player)
+            if tt_action is not None:
+                first_action = tt_action
+            if self.orderer is not None and depth_left >= ORDERING_MIN_DEPTH:
+                actions = self.orderer.order(board, player, actions, tree_level, first_action)
+            elif first_action in actions:
+                # the tuple is shared, so reorder a copy
+                actions = [first_action] + [action for action in actions if action != first_action]
+
         best_value = 0
         best_action = None
+        searched = 0
 
         # take maximizing pov
         if player == self.side:
             best_value = float('-inf')
 
             # print(f'Getting legal actions for {self.side}')
-            for action in board.get_legal_actions(self.side):
-                board_copy = copy.deepcopy(board)
-                board_copy.move_seeds(action, self.side)
+            for action in actions:
+                undo = board.make_move(action, self.side)
+                self.ply += 1
 
                 # an extra turn is possible (last seed landed in own store)
-                if board_copy.gets_extra_move() == self.side:
-                    result = self.standard_minimax(self.side, board_copy, alpha, beta, tree_level)
+                if board.gets_extra_move() == self.side:
+                    next_player, next_level = self.side, tree_level
                 else:
-                    result = self.standard_minimax(self.opponent_side, board_copy, alpha, beta, tree_level + 1)
+                    next_player, next_level = self.opponent_side, tree_level + 1
+                if searched and (self.pvs or self.lmr):
+                    value = self.late_action_value(next_player, board, alpha, beta, tree_level, next_level,
+                                                   searched, depth_left, True)
+                else:
+                    value = self.standard_minimax(next_player, board, alpha, beta, next_level)["value"]
+                board.unmake_move(undo)
+                self.ply -= 1
+                searched += 1
                     
-                if result["value"] > best_value:
-                    best_value = result["value"]
+                if value > best_value:
+                    best_value = value
                     best_action = action
 
                 alpha = max(alpha, best_value)
                 if beta <= alpha:
+                    self.stats.cutoffs += 1
+                    if self.orderer is not None:
+                        self.orderer.record_cutoff(player, action, tree_level, depth_left, searched - 1)
                     break
         else: # take opponent's (minimizing) pov 
             best_value = float('inf')
 
-            for action in board.get_legal_actions(self.opponent_side):
-                board_copy = copy.deepcopy(board)
-                board_copy.move_seeds(action, self.opponent_side)
+            for action in actions:
+                undo = board.make_move(action, self.opponent_side)
+                self.ply += 1
 
                 # an extra turn is possible for agent's opponent (last seed landed in opponent's store)
-                if board_copy.gets_extra_move() == self.opponent_side:
-                    result = self.standard_minimax(self.opponent_side, board_copy, alpha, beta, tree_level)
+                if board.gets_extra_move() == self.opponent_side:
+                    next_player, next_level = self.opponent_side, tree_level
+                else:
+                    next_player, next_level = self.side, tree_level + 1
+                if searched and (self.pvs or self.lmr):
+                    value = self.late_action_value(next_player, board, alpha, beta, tree_level, next_level,
+                                                   searched, depth_left, False)
                 else:
-                    result = self.standard_minimax(self.side, board_copy, alpha, beta, tree_level + 1)
+                    value = self.standard_minimax(next_player, board, alpha, beta, next_level)["value"]
+                board.unmake_move(undo)
+                self.ply -= 1
+                searched += 1
 
-                if result["value"] < best_value:    
-                    best_value = result["value"]
+                if value < best_value:    
+                    best_value = value
                     best_action = action
 
                 beta = min(beta, best_value)
-                if beta >= alpha:
+                if beta <= alpha:
+                    self.stats.cutoffs += 1
+                    if self.orderer is not None:
+                        self.orderer.record_cutoff(player, action, tree_level, depth_left, searched - 1)
                     break
-        
+
+        if self.orderer is not None:
+            self.orderer.record_node(searched)
+
+        if use_tt:
+            if best_value <= alpha_searched:
+                bound = TT_UPPER
+            elif best_value >= beta_searched:
+                bound = TT_LOWER
+            else:
+                bound = TT_EXACT
+
+            # a subtree searched to the end of the game holds at any depth
+            stored_depth = depth_left
+            if not self.hit_horizon:
+                stored_depth = TT_SOLVED_DEPTH
+            relative_action = None
+            if best_action is not None:
+                relative_action = best_action - first_pit
+            self.tt.store(zobrist_key, position, agent_to_move, stored_depth, bound, best_value, relative_action,
+                          self.side)
+
+        self.hit_horizon = self.hit_horizon or outer_hit_horizon
+
         return {"value": best_value, "action": best_action}
 
+    # The value for a node's window (alpha, beta) of the position on board,
+    # reached by the node's searched-th action (never its first), via PVS
+    # and/or LMR (see NULL_WINDOW and LMR_MIN_ACTIONS). Both search first
+    # against the one bound the action has to beat, alpha for the maximizer
+    # and beta for the minimizer; only a value that beats it is searched
+    # again, at full depth and then with the full window.
+    def late_action_value(self, player, board: Board, alpha, beta, tree_level, next_level, searched, depth_left,
+                          maximizing):
+        scout_alpha, scout_beta = alpha, beta
+        if self.pvs:
+            if maximizing:
+                scout_beta = alpha + NULL_WINDOW
+            else:
+                scout_alpha = beta - NULL_WINDOW
+
+        # quiet: no extra move (which keeps the tree level) and no capture;
+        # the root's actions are never reduced
+        if (self.lmr and searched >= LMR_MIN_ACTIONS and depth_left >= LMR_MIN_DEPTH and self.ply > 1
+                and next_level != tree_level and not board.get_capture()):
+            self.lmr_reductions += 1
+            value = self.standard_minimax(player, board, scout_alpha, scout_beta,
+                                          next_level + LMR_REDUCTION)["value"]
+            if value <= alpha if maximizing else value >= beta:
+                return value
+            self.lmr_researches += 1
+
+        if self.pvs:
+            value = self.standard_minimax(player, board, scout_alpha, scout_beta, next_level)["value"]
+            if value <= alpha or value >= beta:
+                return value
+            self.pvs_researches += 1
+        return self.standard_minimax(player, board, alpha, beta, next_level)["value"]
+
     
     def value(self, board: Board, tree_level, alpha, beta):
+        self.nodes += 1
         if self.at_terminal_state(board) or self.at_max_depth(tree_level):
             return (self.eval_func(board), None)
         elif self.agent_is_min(tree_level):
@@ -408,14 +1823,14 @@ class Agent:
         next_action = None
 
         # iterate through pits player can select
-        for action in board.get_legal_actions(self.side):
+        for action in board.legal_actions(self.side):
 
-            # consider a possible future without changing the original board
-            board_copy = copy.deepcopy(board)
-            board_copy.move_seeds(action, self.side)
+            # consider a possible future, then restore the original board
+            undo = board.make_move(action, self.side)
 
             # get estimated utility of state after completing action
-            val = self.value(board_copy, tree_level + 1, alpha, beta)[0]
+            val = self.value(board, tree_level + 1, alpha, beta)[0]
+            board.unmake_move(undo)
 
             # value is greater than minimum value (beta)
             # return right away (the maximizer will prefer this node anyway)
@@ -438,14 +1853,14 @@ class Agent:
         next_action = None
 
         # iterate through pits player can select
-        for action in board.get_legal_actions(self.opponent_side):
+        for action in board.legal_actions(self.opponent_side):
 
-            # consider a possible future without changing the original board
-            board_copy = copy.deepcopy(board)
-            board_copy.move_seeds(action, self.opponent_side)
+            # consider a possible future, then restore the original board
+            undo = board.make_move(action, self.opponent_side)
 
             # get estimated utility of state after completing action
-            val = self.value(board_copy, tree_level + 1, alpha, beta)[0]
+            val = self.value(board, tree_level + 1, alpha, beta)[0]
+            board.unmake_move(undo)
 
             # value is less than best value (alpha)
             # return right away (the minimizer will pick this node anyway)
@@ -475,13 +1890,138 @@ class Agent:
     
 
     def at_max_depth(self, tree_level):
-        return tree_level / 2 == self.depth
+        return tree_level / 2 == self.search_depth
+
+
+# per-process agents used by search_subtree, keyed by their configuration, so
+# each worker keeps its transposition table between tasks
+worker_agents = {}
+
+
+# Runs in a worker process during parallel root search: searches one root
+# action's subtree with window (alpha, inf) and returns its value, the nodes
+# visited and whether the depth limit was reached. Raises SearchTimeout if
+# time_left (seconds) runs out.
+def search_subtree(config, state, player, tree_level, alpha, search_depth, time_left):
+    key = tuple(sorted(config.items()))
+    agent = worker_agents.get(key)
+    if agent is None:
+        agent = Agent(**config)
+        worker_agents[key] = agent
+
+    board = PackedBoard()
+    board.state = state
+
+    agent.nodes = 0
+    agent.hit_horizon = False
+    agent.search_depth = search_depth
+    # a child of the root, as in the serial search
+    agent.ply = 1
+    if time_left is not None:
+        agent.deadline = time.perf_counter() + time_left
+    try:
+        result = agent.standard_minimax(player, board, alpha, float('inf'), tree_level)
+    finally:
+        agent.search_depth = agent.depth
+        agent.deadline = None
+        agent.ply = 0
+
+    return result["value"], agent.nodes, agent.hit_horizon
+
+
+# == Terminal rendering ========================================================
+
+# A frame is the board plus the messages that go with it (moves, captures,
+# timings), built as one string and written with a single call. The board is
+# a format string with the colour codes rendered in once per board size, so
+# drawing it is one str.format of the seed counts.
+
+# width of a pit or store cell; counts are padded to it
+CELL_WIDTH = 4
+
+
+# The board as a format string taking A's store, A's pits from right to left,
+# B's store, then B's pits from left to right; A's row is on top
+def frame_template(pits_per_side):
+    cell = "{:<%d}" % CELL_WIDTH
+    pit = {player: colored(cell, "white", background) + " "
+           for player, background in Board.player_to_background.items()}
+    home = {player: colored(cell, "white", background, attrs=['bold']) + " "
+            for player, background in Board.player_to_background.items()}
+    empty_home = {player: colored(" " * CELL_WIDTH, "white", background, attrs=['bold']) + " "
+                  for player, background in Board.player_to_background.items()}
+    return (home['A'] + pit['A'] * pits_per_side + home['B'] + "\n"
+            + empty_home['A'] + pit['B'] * pits_per_side + empty_home['B'] + "\n")
+
+
+class Renderer:
+    # stream: where frames go (default sys.stdout). quiet: draw and print
+    # nothing. max_fps: the most frames written per second; a frame that comes
+    # sooner is held back and dropped if another replaces it, so only the
+    # latest is drawn. flush() writes a held-back frame.
+    def __init__(self, stream=None, quiet=False, max_fps=None):
+        self.stream = stream
+        self.quiet = quiet
+        self.interval = 1 / max_fps if max_fps else 0.0
+        self.templates = {}
+        self.messages = []
+        self.pending = None
+        self.last_write = float('-inf')
+        self.frames = 0
+        self.skipped = 0
+
+    # a line to print with the next frame
+    def message(self, text):
+        if not self.quiet:
+            self.messages.append(text)
+
+    # Queues a frame of board and the messages since the last one, and writes
+    # it unless the previous write was too recent
+    def show(self, board: Board):
+        if self.quiet:
+            return
+        if self.pending is not None:
+            self.skipped += 1
+        self.pending = (list(board.board), board.pits_per_side, self.messages)
+        self.messages = []
+        if time.perf_counter() - self.last_write >= self.interval:
+            self.flush()
+
+    # Writes the held-back frame and any messages since
+    def flush(self):
+        parts = []
+        if self.pending is not None:
+            board_list, pits_per_side, messages = self.pending
+            template = self.templates.get(pits_per_side)
+            if template is None:
+                template = self.templates[pits_per_side] = frame_template(pits_per_side)
+            parts.extend(line + "\n" for line in messages)
+            parts.append(template.format(board_list[-1], *board_list[-2:pits_per_side:-1],
+                                         board_list[pits_per_side], *board_list[:pits_per_side]))
+            parts.append("\n")
+            self.pending = None
+            self.frames += 1
+        parts.extend(line + "\n" for line in self.messages)
+        self.messages = []
+        if not parts:
+            return
+        stream = self.stream or sys.stdout
+        stream.write("".join(parts))
+        stream.flush()
+        self.last_write = time.perf_counter()
 
 
 class Game:
-    def __init__(self):
+    # record_path: a game record archive (see records.py) to append the game
+    # to when it ends. ponder: let the computer search while you think (see
+    # ponder.py). renderer: draws the game (default: every frame to stdout).
+    def __init__(self, record_path=None, ponder=False, renderer=None):
         self.board = Board()
         self.next_player = 'B'
+        self.record_path = record_path
+        self.ponder = ponder
+        self.renderer = renderer or Renderer()
+        self.moves = []
 
     def display_winner(self):
         scores = self.board.tally_up()
@@ -500,86 +2040,122 @@ class Game:
             print('Tie!')
 
     def run_agent_vs_agent(self):
-        north_agent = Agent(4, 'A', 'B') # associated with A
-        south_agent = Agent(4, 'B', 'A') # associated with B
-
-        print("Place your bets... It's the computer against itself!")
-        print("Starting board: ")
+        # the agents have the same settings, so they can share search results
+        tt = TranspositionTable()
+        north_agent = Agent(4, 'A', 'B', tt=tt) # associated with A
+        south_agent = Agent(4, 'B', 'A', tt=tt) # associated with B
+
+        renderer = self.renderer
+        renderer.message("Place your bets... It's the computer against itself!")
+        renderer.message("Starting board: ")
         self.print_mancala_board()
-        print()
 
         while not self.at_terminal_state():
             if self.get_next_player() == 'B':
                 tic = time.perf_counter()
                 pit_choice = south_agent.get_next_action(self.board)
                 toc = time.perf_counter()
-                print(f"Decision took {toc - tic} seconds")
+                renderer.message(f"Decision took {toc - tic} seconds "
+                                 f"(depth {south_agent.depth_reached}, {south_agent.nodes} nodes)")
 
                 # add 1 because 0-indexing is weird to read
-                print(f"B chose pit # {pit_choice + 1}")
+                renderer.message(f"B chose pit # {pit_choice + 1}")
 
                 self.move_seeds(int(pit_choice), 'B') 
             else:
                 tic = time.perf_counter()
                 pit_choice = north_agent.get_next_action(self.board)
                 toc = time.perf_counter()
-                print(f"Decision took {toc - tic} seconds")
+                renderer.message(f"Decision took {toc - tic} seconds "
+                                 f"(depth {north_agent.depth_reached}, {north_agent.nodes} nodes)")
 
-                print(f"A chose pit # {pit_choice}")
+                renderer.message(f"A chose pit # {pit_choice}")
                 self.move_seeds(int(pit_choice), 'A')
 
             self.print_mancala_board()
-            print()
             self.display_capture()
-            print()
 
+        renderer.flush()
         self.display_winner()
+        if not renderer.quiet:
+            stats = tt.stats()
+            print(f"Shared transposition table: {stats['hits']} hits ({stats['shared_hits']} on the other "
+                  f"agent's results) in {stats['hits'] + stats['misses']} probes")
+        self.save_record()
 
     def run_human_vs_agent(self):
         # create computer agent and set its cutoff depth
         computer = Agent(4, 'A', 'B')
-
-        print("Welcome to Mancala! Here is the starting board. ")
-        print("Computer: RED (A)")
-        print("You: BLUE (B)")
-        print("Your pits are numbered from 1-6, left to right.")
+        ponderer = None
+        if self.ponder:
+            from ponder import Ponderer
+            ponderer = Ponderer(computer)
+
+        renderer = self.renderer
+        renderer.message("Welcome to Mancala! Here is the starting board. ")
+        renderer.message("Computer: RED (A)")
+        renderer.message("You: BLUE (B)")
+        renderer.message("Your pits are numbered from 1-6, left to right.")
         self.print_mancala_board()
-        print()
 
         # TESTING
         # print(f"next player: {game.get_next_player()}")
         while not self.at_terminal_state():
             if self.get_next_player() == 'B':
+                if ponderer is not None:
+                    ponderer.start(self.board)
+                # the player has to see the board they're moving on
+                renderer.flush()
                 pit_choice = input("Please enter a pit number to distribute marbles from: ")
 
                 if not pit_choice.isdigit() or not (1 <= int(pit_choice) <= 6):
-                    print("Invalid pit choice (select 1-6)")
+                    renderer.message("Invalid pit choice (select 1-6)")
                     continue
 
-                print(f"You chose: pit # {pit_choice}")
+                renderer.message(f"You chose: pit # {pit_choice}")
 
                 # subtract 1 from pit_choice to get correct index on board
                 self.move_seeds(int(pit_choice) - 1, 'B') 
             else:
                 tic = time.perf_counter()
-                pit_choice = computer.get_next_action(self.board)
+                if ponderer is not None:
+                    pit_choice = ponderer.get_next_action(self.board)
+                else:
+                    pit_choice = computer.get_next_action(self.board)
                 toc = time.perf_counter()
-                print(f"Decision took {toc - tic} seconds")
-                print(f"Computer chose: pit # {pit_choice}")
+                pondered = " (pondered)" if computer.stats.extra.get("pondered") else ""
+                renderer.message(f"Decision took {toc - tic} seconds "
+                                 f"(depth {computer.depth_reached}, {computer.nodes} nodes){pondered}")
+                renderer.message(f"Computer chose: pit # {pit_choice}")
                 self.move_seeds(int(pit_choice), 'A')
             self.print_mancala_board()
-            print()
             self.display_capture()
-            print()
 
+        renderer.flush()
         self.display_winner()
+        if ponderer is not None:
+            ponderer.close()
+            stats = ponderer.stats()
+            print(f"Ponder hits: {stats['hits']} of {stats['hits'] + stats['misses']} decisions")
+        self.save_record()
 
 
     def print_mancala_board(self):
-        self.board.print_board()
+        self.renderer.show(self.board)
+
+
+    def save_record(self):
+        if not self.record_path:
+            return
+        # records.py imports this module, so import it only when needed
+        from records import make_record, open_archive, write_record
+        with open_archive(self.record_path, 'a') as f:
+            write_record(f, make_record(self.board, self.moves, {"date": time.strftime("%Y-%m-%d %H:%M:%S")}))
+        print(f"Game saved to {self.record_path}")
     
 
     def move_seeds(self, pit_num, player):
+        self.moves.append((pit_num, player))
         self.board.move_seeds(pit_num, player)
         if player == 'B':
             self.next_player = 'A'
@@ -594,7 +2170,7 @@ class Game:
     def get_next_player(self):
         extra_turn_player = self.board.gets_extra_move()
         if extra_turn_player:
-            print(f"{extra_turn_player} gets an extra move.")
+            self.renderer.message(f"{extra_turn_player} gets an extra move.")
             return self.board.gets_extra_move()
         return self.next_player
     
@@ -610,14 +2186,21 @@ class Game:
             # account for zero-indexing for B's pits
             if capturing_player == 'A':
                 captured_pit += 1 
-            print(f"{capturing_player} has captured seeds from pit # {captured_pit}!") 
+            self.renderer.message(f"{capturing_player} has captured seeds from pit # {captured_pit}!")
             self.board.perform_capture()
             self.print_mancala_board()
         return 
 
 
-def main():
-    game = Game()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play Mancala against the computer, or watch it play itself.")
+    parser.add_argument("--record", help="game record archive to append the game to (see records.py)")
+    parser.add_argument("--ponder", action="store_true", help="let the computer think during your turn")
+    parser.add_argument("--quiet", action="store_true",
+                        help="when the computer plays itself, print only the result")
+    parser.add_argument("--max-fps", type=float,
+                        help="when the computer plays itself, draw at most this many boards a second")
+    args = parser.parse_args(argv)
 
     valid_option_picked = False
     game_choice = 6 # default option
@@ -633,9 +2216,10 @@ def main():
         valid_option_picked = True
 
     if int(game_choice) == 6:
-        game.run_human_vs_agent()
+        Game(args.record, args.ponder).run_human_vs_agent()
     else:
-        game.run_agent_vs_agent()
+        renderer = Renderer(quiet=args.quiet, max_fps=args.max_fps)
+        Game(args.record, args.ponder, renderer).run_agent_vs_agent()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,340 @@
+import argparse
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from game import (Board, PackedBoard, SearchStats, PIT_OWNERS, STORES, SOW_TABLES, PIT_BITS, PIT_MASK,
+                  B_PITS_MASK, A_PITS_MASK, PIT_TOTAL_SHIFTS, STORE_SHIFTS, apply_move, other_player)
+
+# == Monte Carlo tree search ===================================================
+
+# An alternative to the alpha-beta Agent that needs no evaluation function:
+# UCT grows a tree from the current position, choosing moves by the upper
+# confidence bound and scoring new leaves by playing random moves to the end.
+# Positions are packed board states (see PackedBoard) with captures applied,
+# as in a real game.
+
+# iterations per decision when neither an iteration nor a time budget is given
+DEFAULT_ITERATIONS = 5000
+
+# UCB1 exploration constant
+DEFAULT_EXPLORATION = math.sqrt(2)
+
+# a playout is far slower than an alpha-beta node, so look at the clock often
+PLAYOUTS_PER_CLOCK_CHECK = 16
+
+# levels searched below the old root for the new position when reusing the tree
+REUSE_DEPTH = 6
+
+# other_player and PackedBoard.first_pit as lookups, for the playout loop
+OTHER_PLAYER = {player: other_player(player) for player in ('B', 'A')}
+FIRST_PITS = {player: PackedBoard().first_pit(player) for player in ('B', 'A')}
+
+
+# Plays uniformly random moves from a packed state until the game ends and
+# returns B's result: 1 for a win, 0.5 for a draw, 0 for a loss. Works on the
+# integer directly (same rules as PackedBoard.move_seeds + perform_capture)
+# so a playout allocates no boards, lists or capture tuples. random is a
+# function returning floats in [0, 1), e.g. random.Random(seed).random.
+def random_playout(state, player, random):
+    while state & B_PITS_MASK and state & A_PITS_MASK:
+        # rejection sampling picks uniformly among the non-empty pits
+        first_pit = FIRST_PITS[player]
+        num_seeds = 0
+        while not num_seeds:
+            pit_num = first_pit + int(random() * 6)
+            num_seeds = (state >> (pit_num * PIT_BITS)) & PIT_MASK
+
+        delta, i = SOW_TABLES[player][pit_num][num_seeds]
+        state += delta
+
+        # last seed in own store: extra move
+        if i == STORES[player]:
+            continue
+
+        # last seed alone in an own pit with seeds opposite: capture both
+        if PIT_OWNERS[i] == player and (state >> (i * PIT_BITS)) & PIT_MASK == 1:
+            captured = (state >> ((12 - i) * PIT_BITS)) & PIT_MASK
+            if captured:
+                opponent = OTHER_PLAYER[player]
+                state -= (1 << (i * PIT_BITS)) + (captured << ((12 - i) * PIT_BITS))
+                state -= (1 << PIT_TOTAL_SHIFTS[player]) + (captured << PIT_TOTAL_SHIFTS[opponent])
+                state += (1 + captured) << STORE_SHIFTS[player]
+
+        player = OTHER_PLAYER[player]
+
+    # seeds left in the pits go to their owner's score
+    b_score = ((state >> STORE_SHIFTS['B']) & PIT_MASK) + ((state >> PIT_TOTAL_SHIFTS['B']) & PIT_MASK)
+    a_score = ((state >> STORE_SHIFTS['A']) & PIT_MASK) + ((state >> PIT_TOTAL_SHIFTS['A']) & PIT_MASK)
+    if b_score == a_score:
+        return 0.5
+    return 1.0 if b_score > a_score else 0.0
+
+
+# The position after player plays pit_num, and who moves next (None once the
+# game is over)
+def play(state, pit_num, player):
+    board = PackedBoard()
+    board.state = state
+    board.move_seeds(pit_num, player)
+    if board.get_capture():
+        board.perform_capture()
+    if board.at_terminal_state():
+        return board.state, None
+    if board.gets_extra_move() == player:
+        return board.state, player
+    return board.state, other_player(player)
+
+
+class Node:
+    def __init__(self, state, player, parent=None, action=None):
+        self.state = state
+        # player to move, None at the end of the game
+        self.player = player
+        self.parent = parent
+        # the move that led here, and who made it
+        self.action = action
+        self.mover = parent.player if parent else None
+
+        self.children = {}
+        self.untried = []
+        if player is not None:
+            board = PackedBoard()
+            board.state = state
+            self.untried = board.get_legal_actions(player)
+
+        # playouts through this node, and the mover's total result in them
+        self.visits = 0
+        self.wins = 0.0
+
+    def expand(self, action):
+        self.untried.remove(action)
+        state, player = play(self.state, action, self.player)
+        child = Node(state, player, self, action)
+        self.children[action] = child
+        return child
+
+    # the child with the highest upper confidence bound
+    def select(self, exploration):
+        log_visits = math.log(self.visits)
+        best_score = float('-inf')
+        best_child = None
+        for child in self.children.values():
+            score = child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if score > best_score:
+                best_score = score
+                best_child = child
+        return best_child
+
+    # the node for (state, player) at most max_depth moves below, or None
+    def find(self, state, player, max_depth):
+        level = [self]
+        for _ in range(max_depth + 1):
+            next_level = []
+            for node in level:
+                if node.state == state and node.player == player:
+                    return node
+                next_level.extend(node.children.values())
+            level = next_level
+        return None
+
+
+# Runs iterations of UCT from root, until the iteration count or the deadline
+# (a perf_counter time, or None) is reached. Returns the number of playouts
+# and the deepest level selection reached.
+def run_search(root, iterations, deadline, exploration, random):
+    playouts = 0
+    max_depth = 0
+    while iterations is None or playouts < iterations:
+        if deadline is not None and playouts % PLAYOUTS_PER_CLOCK_CHECK == 0:
+            if time.perf_counter() >= deadline:
+                break
+
+        # selection: descend through fully expanded nodes
+        node = root
+        depth = 0
+        while not node.untried and node.children:
+            node = node.select(exploration)
+            depth += 1
+
+        # expansion: add one untried move, picked at random
+        if node.untried:
+            node = node.expand(node.untried[int(random() * len(node.untried))])
+            depth += 1
+        max_depth = max(max_depth, depth)
+
+        # simulation (a finished game just gets scored) and backpropagation
+        b_result = random_playout(node.state, node.player or 'B', random)
+        while node is not None:
+            node.visits += 1
+            if node.mover == 'B':
+                node.wins += b_result
+            elif node.mover == 'A':
+                node.wins += 1.0 - b_result
+            node = node.parent
+        playouts += 1
+
+    return playouts, max_depth
+
+
+# Runs in a worker process during root-parallel search: builds a fresh tree
+# for the position and returns {action: (visits, wins)} for the root's
+# children, plus the playouts run and the deepest level reached.
+def search_tree(state, player, iterations, time_left, exploration, seed):
+    root = Node(state, player)
+    deadline = None
+    if time_left is not None:
+        deadline = time.perf_counter() + time_left
+    playouts, max_depth = run_search(root, iterations, deadline, exploration, random.Random(seed).random)
+    return {action: (child.visits, child.wins) for action, child in root.children.items()}, playouts, max_depth
+
+
+class MCTSAgent:
+    def __init__(self, side, opponent_side, iterations=None, time_budget_ms=None,
+                 exploration=DEFAULT_EXPLORATION, workers=None, seed=None, reuse_tree=True):
+        self.side = side
+        self.opponent_side = opponent_side
+
+        # per-decision budget: stop after iterations playouts or time_budget_ms,
+        # whichever comes first
+        self.iterations = iterations
+        self.time_budget_ms = time_budget_ms
+        if iterations is None and time_budget_ms is None:
+            self.iterations = DEFAULT_ITERATIONS
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+
+        # total number of trees for root parallelization: one grown here and
+        # workers - 1 in a process pool started on first use (see close())
+        self.workers = workers
+        self.pool = None
+
+        # keep the subtree of the position reached between decisions
+        self.reuse_tree = reuse_tree
+        self.root = None
+
+        # playouts and deepest tree level during the last decision (named like
+        # Agent's so game loops can report either)
+        self.nodes = 0
+        self.depth_reached = 0
+        self.stats = SearchStats(side)
+
+    # Same interface as Agent.get_next_action; time_budget_ms, if given,
+    # overrides the agent's own for this decision
+    def get_next_action(self, board: Board, time_budget_ms=None):
+        self.stats = SearchStats(self.side)
+        if time_budget_ms is None:
+            time_budget_ms = self.time_budget_ms
+
+        tic = time.perf_counter()
+        deadline = None
+        if time_budget_ms is not None:
+            deadline = tic + time_budget_ms / 1000
+
+        state = PackedBoard.from_board(board).state
+        root = None
+        if self.reuse_tree and self.root is not None:
+            root = self.root.find(state, self.side, REUSE_DEPTH)
+        reused_visits = 0
+        if root is None:
+            root = Node(state, self.side)
+        else:
+            root.parent = None
+            reused_visits = root.visits
+
+        # spread the iterations over the trees
+        trees = max(1, self.workers or 1)
+        iterations = self.iterations
+        if iterations is not None:
+            iterations = -(-iterations // trees)
+
+        futures = []
+        if trees > 1:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=trees - 1)
+            time_left = None if deadline is None else deadline - time.perf_counter()
+            futures = [self.pool.submit(search_tree, state, self.side, iterations, time_left,
+                                        self.exploration, self.rng.getrandbits(32))
+                       for _ in range(trees - 1)]
+
+        playouts, max_depth = run_search(root, iterations, deadline, self.exploration, self.rng.random)
+        # with no time or iterations to spare (a zero budget, a deadline
+        # already passed), still give every root move one playout, so there's
+        # a move to pick
+        if not root.children:
+            extra_playouts, max_depth = run_search(root, len(root.untried), None, self.exploration,
+                                                   self.rng.random)
+            playouts += extra_playouts
+
+        # root parallelization: add up the root statistics of every tree
+        totals = {action: [child.visits, child.wins] for action, child in root.children.items()}
+        for future in futures:
+            children, worker_playouts, worker_depth = future.result()
+            playouts += worker_playouts
+            max_depth = max(max_depth, worker_depth)
+            for action, (visits, wins) in children.items():
+                total = totals.setdefault(action, [0, 0.0])
+                total[0] += visits
+                total[1] += wins
+
+        # most visited move; ties go to the lowest pit
+        action = min(totals, key=lambda action: (-totals[action][0], action))
+        toc = time.perf_counter()
+
+        self.root = root.children.get(action)
+        self.nodes = playouts
+        self.depth_reached = max_depth
+
+        stats = self.stats
+        stats.source = "mcts"
+        stats.action = action
+        stats.seconds = toc - tic
+        stats.nodes = playouts
+        stats.depth_reached = max_depth
+        stats.extra["playouts_per_sec"] = playouts / stats.seconds if stats.seconds else 0.0
+        stats.extra["reused_visits"] = reused_visits
+        stats.extra["win_rate"] = totals[action][1] / totals[action][0]
+        return action
+
+    # shuts down the worker pool, if one was started
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run MCTS decisions from the starting position and report speed.")
+    parser.add_argument("--iterations", type=int, help=f"playouts per decision (default {DEFAULT_ITERATIONS})")
+    parser.add_argument("--time-budget-ms", type=float, help="time per decision instead of, or as well as, iterations")
+    parser.add_argument("--workers", type=int, default=1, help=f"trees searched in parallel (up to {os.cpu_count()})")
+    parser.add_argument("--moves", type=int, default=4, help="decisions to make, playing the agent against itself")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    agents = {side: MCTSAgent(side, other_player(side), args.iterations, args.time_budget_ms,
+                              workers=args.workers, seed=args.seed)
+              for side in ('B', 'A')}
+    board = Board()
+    player = 'B'
+    try:
+        for _ in range(args.moves):
+            if board.at_terminal_state():
+                break
+            agent = agents[player]
+            action = agent.get_next_action(board)
+            stats = agent.stats
+            print(f"{player} plays pit {action}: {stats.nodes} playouts in {stats.seconds:.2f} s "
+                  f"({stats.extra['playouts_per_sec']:,.0f}/s, depth {stats.depth_reached}, "
+                  f"{stats.extra['reused_visits']} reused, win rate {stats.extra['win_rate']:.2f})")
+
+            player = apply_move(board, action, player)
+    finally:
+        for agent in agents.values():
+            agent.close()
+
+
+if __name__ == '__main__':
+    main()
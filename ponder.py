@@ -0,0 +1,234 @@
+import argparse
+import random
+import threading
+import time
+
+from game import Agent, Board, SearchTimeout, apply_move
+
+# == Pondering =================================================================
+
+# While the opponent thinks, the agent searches the positions their likely
+# replies lead to, so that when the real reply comes its decision may already
+# be made. Replies are predicted with the agent's own evaluation: the
+# opponent's turn (extra moves included) is played out every way it can go,
+# and the positions the agent likes least are searched first.
+#
+# Ponderer runs the searches in a background thread with the agent itself, so
+# they also warm its transposition table. When the reply arrives, a finished
+# search for that position is a ponder hit and is returned at once; if the
+# search in progress is for that position it is left to finish; otherwise
+# pondering is cancelled and the agent searches as usual, from a warmer table.
+# The server (see server.py) ponders in its worker processes instead.
+
+# most opponent moves played out per turn when predicting replies; extra-move
+# chains can branch a lot
+MAX_REPLY_EXPANSIONS = 200
+
+
+# The positions (board lists) that opponent's turn from board can end in with
+# the agent to move, most likely first: lowest evaluate(board), which scores
+# positions for the agent. Finished games are left out; at most limit are
+# returned.
+def likely_positions(board: Board, opponent, evaluate, limit=None):
+    positions = {}
+    frontier = [list(board.board)]
+    expansions = 0
+    while frontier and expansions < MAX_REPLY_EXPANSIONS:
+        board_list = frontier.pop()
+        scratch = Board(board.pits_per_side, board.seeds_per_pit)
+        scratch.board = board_list
+        for pit_num in scratch.legal_actions(opponent):
+            expansions += 1
+            child = Board(board.pits_per_side, board.seeds_per_pit)
+            child.board = list(board_list)
+            next_player = apply_move(child, pit_num, opponent)
+            if child.at_terminal_state():
+                continue
+            if next_player == opponent:
+                frontier.append(child.board)
+            else:
+                positions.setdefault(tuple(child.board), evaluate(child))
+
+    ordered = sorted(positions, key=positions.get)
+    return [list(key) for key in ordered[:limit]]
+
+
+class Ponderer:
+    # agent: the Agent to ponder with, which must not be used elsewhere while
+    # pondering. time_budget_ms: passed to get_next_action, for pondered and
+    # regular decisions alike. max_positions: most replies pondered per turn.
+    def __init__(self, agent: Agent, time_budget_ms=None, max_positions=None):
+        self.agent = agent
+        self.time_budget_ms = time_budget_ms
+        self.max_positions = max_positions
+
+        # pondered decisions: board tuple -> (action, stats)
+        self.results = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.position = None
+        self.current = None
+        self.stopping = False
+
+        self.hits = 0
+        self.misses = 0
+        self.searches = 0
+        self.cancelled = 0
+
+    # Starts pondering board, a position with the agent's opponent to move.
+    # Does nothing if that position is already being pondered.
+    def start(self, board: Board):
+        position = tuple(board.board)
+        if self.thread is not None and self.position == position:
+            return
+        self.stop()
+        self.position = position
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, args=(list(board.board),), daemon=True)
+        self.thread.start()
+
+    def run(self, board_list):
+        agent = self.agent
+        board = Board()
+        board.board = board_list
+        for position in likely_positions(board, agent.opponent_side, agent.evaluate, self.max_positions):
+            key = tuple(position)
+            with self.lock:
+                if self.stopping:
+                    return
+                if key in self.results:
+                    continue
+                self.current = key
+
+            board.board = position
+            # with a deadline, fixed-depth searches also reach the clock
+            # checks that notice cancellation
+            agent.deadline = float('inf')
+            try:
+                action = agent.get_next_action(board, self.time_budget_ms)
+            except SearchTimeout:
+                return
+            finally:
+                agent.deadline = None
+
+            with self.lock:
+                self.current = None
+                # a time-budgeted search returns its best so far when cancelled
+                if agent.cancelled:
+                    return
+                self.results[key] = (action, agent.stats)
+                self.searches += 1
+
+    # Stops pondering, letting the search of finish_position (a board tuple)
+    # complete if it's the one in progress, and cancelling any other
+    def stop(self, finish_position=None):
+        if self.thread is None:
+            return
+        with self.lock:
+            self.stopping = True
+            if self.current is not None and self.current != finish_position:
+                self.agent.cancelled = True
+                self.cancelled += 1
+        self.thread.join()
+        self.thread = None
+        self.position = None
+        self.current = None
+        self.agent.cancelled = False
+
+    # The agent's action for board, from pondering if it got that far.
+    # Afterwards agent.stats describes the decision either way, with
+    # stats.extra["pondered"] set on a ponder hit.
+    def get_next_action(self, board: Board):
+        key = tuple(board.board)
+        self.stop(key)
+        result = self.results.get(key)
+        # only the next turn's replies are worth keeping
+        self.results = {}
+
+        if result is None:
+            self.misses += 1
+            return self.agent.get_next_action(board, self.time_budget_ms)
+
+        self.hits += 1
+        action, stats = result
+        stats.extra["pondered"] = True
+        self.agent.stats = stats
+        self.agent.nodes = stats.nodes
+        self.agent.depth_reached = stats.depth_reached
+        return action
+
+    def stats(self):
+        decisions = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / decisions if decisions else 0.0,
+            "searches": self.searches,
+            "cancelled": self.cancelled,
+        }
+
+    def close(self):
+        self.stop()
+
+
+# Plays games between the agent (on A, as in Game) and an opponent agent that
+# takes think_ms to answer every move, pondering or not. Returns the agent's
+# decision latencies (seconds from the opponent's move to the agent's) and
+# the Ponderer, if used.
+def simulate(games, depth, opponent_depth, think_ms, ponder, time_budget_ms=None, seed=0):
+    rng = random.Random(seed)
+    agent = Agent(depth, 'A', 'B')
+    opponent = Agent(opponent_depth, 'B', 'A')
+    ponderer = Ponderer(agent, time_budget_ms) if ponder else None
+    latencies = []
+    for game in range(games):
+        board = Board()
+        player = 'B'
+        # a couple of random moves, so the games differ
+        for _ in range(2):
+            player = apply_move(board, rng.choice(board.get_legal_actions(player)), player)
+        while not board.at_terminal_state():
+            if player == 'A':
+                tic = time.perf_counter()
+                if ponderer is not None:
+                    pit_num = ponderer.get_next_action(board)
+                else:
+                    pit_num = agent.get_next_action(board, time_budget_ms)
+                latencies.append(time.perf_counter() - tic)
+            else:
+                if ponderer is not None:
+                    ponderer.start(board)
+                # the opponent "thinks" for think_ms however fast it is
+                tic = time.perf_counter()
+                pit_num = opponent.get_next_action(board)
+                time.sleep(max(0.0, think_ms / 1000 - (time.perf_counter() - tic)))
+            player = apply_move(board, pit_num, player)
+        if ponderer is not None:
+            ponderer.stop()
+    return latencies, ponderer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the agent's decision latency with and without pondering.")
+    parser.add_argument("--games", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=5, help="agent search depth")
+    parser.add_argument("--opponent-depth", type=int, default=3, help="search depth of the simulated opponent")
+    parser.add_argument("--think-ms", type=float, default=500, help="how long the opponent takes per move")
+    parser.add_argument("--time-budget-ms", type=float, help="give the agent a time budget instead")
+    args = parser.parse_args(argv)
+
+    for ponder in (False, True):
+        latencies, ponderer = simulate(args.games, args.depth, args.opponent_depth, args.think_ms, ponder,
+                                       args.time_budget_ms)
+        latencies.sort()
+        line = (f"{'ponder' if ponder else 'plain':6} {len(latencies)} decisions: "
+                f"mean {sum(latencies) / len(latencies) * 1000:8.1f} ms, "
+                f"p50 {latencies[len(latencies) // 2] * 1000:8.1f} ms, max {latencies[-1] * 1000:8.1f} ms")
+        if ponderer is not None:
+            stats = ponderer.stats()
+            line += f"; ponder hits {stats['hits']}/{stats['hits'] + stats['misses']} ({stats['hit_rate']:.0%})"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from game import Agent, Board, TranspositionTable, apply_move, other_player
+
+# == Game records ==============================================================
+
+# One game per JSON line:
+#
+#   {"version": 1, "pits_per_side": 6, "seeds_per_pit": 4, "moves": "3162...",
+#    "scores": {"B": 27, "A": 21}, "winner": "B", "metadata": {...}}
+#
+# moves holds one character per move: the pit played, numbered 1 to
+# pits_per_side from the mover's left as in Game. Who moves is not stored;
+# replaying the rules (extra moves included) tells. metadata is free-form:
+# players, date, opening length and so on. Files ending in .gz are read and
+# written compressed.
+#
+# Archives are read one line at a time, and everything built on them (replay,
+# statistics, re-analysis) streams, so memory stays flat however many games
+# an archive holds.
+
+RECORD_VERSION = 1
+
+# games longer than this still count, but only their first plies get
+# per-ply statistics
+MAX_TRACKED_PLY = 200
+
+# positions sent to a worker at once, and batches in flight at most
+ANALYSIS_BATCH = 32
+MAX_PENDING_BATCHES = 8
+
+
+def open_archive(path, mode='r'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+# Builds a record for a finished game on board. moves are (pit_num, player)
+# pairs with board indices, as passed to Board.move_seeds.
+def make_record(board: Board, moves, metadata=None):
+    if board.pits_per_side > 9:
+        raise ValueError("Records hold boards of up to 9 pits a side")
+    pits = []
+    for pit_num, player in moves:
+        pits.append(str(pit_num - board.first_pit(player) + 1))
+
+    scores = board.tally_up()
+    winner = None
+    if scores['A'] != scores['B']:
+        winner = 'A' if scores['A'] > scores['B'] else 'B'
+    return {
+        "version": RECORD_VERSION,
+        "pits_per_side": board.pits_per_side,
+        "seeds_per_pit": board.seeds_per_pit,
+        "moves": "".join(pits),
+        "scores": scores,
+        "winner": winner,
+        "metadata": metadata or {},
+    }
+
+
+def write_record(f, record):
+    f.write(json.dumps(record, separators=(',', ':')) + "\n")
+
+
+# the record on one archive line; raises ValueError if it isn't one
+def parse_record(line):
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"not a game record ({e})")
+    if not isinstance(record, dict):
+        raise ValueError("not a game record")
+    if record.get("version") != RECORD_VERSION:
+        raise ValueError(f"unsupported record version {record.get('version')}")
+    return record
+
+
+# Yields the records in an archive one at a time. A line that isn't a record
+# (say, the truncated last line of a killed writer) raises ValueError, or,
+# given a skipped list, is described there and passed over.
+def read_records(path, skipped=None):
+    def bad_line(message):
+        if skipped is None:
+            raise ValueError(message)
+        skipped.append(message)
+
+    with open_archive(path) as f:
+        line_number = 0
+        try:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = parse_record(line)
+                except ValueError as e:
+                    bad_line(f"{path}:{line_number}: {e}")
+                    continue
+                yield record
+        except EOFError:
+            bad_line(f"{path}: the archive ends after line {line_number}")
+
+
+# Replays a record with the real rules (Board.move_seeds, then
+# perform_capture). Yields (ply, player, pit_num, board) before each move,
+# where pit_num is the board index about to be played. board is the live
+# board, changed by the next move, so copy board.board to keep a position.
+# Raises ValueError if the moves are missing or illegal, or the record's scores
+# don't match.
+def replay(record):
+    moves = record.get("moves")
+    if not isinstance(moves, str):
+        raise ValueError("The record has no moves")
+    n = record.get("pits_per_side", 6)
+    seeds_per_pit = record.get("seeds_per_pit", 4)
+    if not (isinstance(n, int) and 1 <= n <= 9 and isinstance(seeds_per_pit, int) and seeds_per_pit >= 1):
+        raise ValueError(f"The record's board size is not valid: {n} pits of {seeds_per_pit}")
+    board = Board(n, seeds_per_pit)
+    player = 'B'
+    for ply, pit in enumerate(moves):
+        if board.at_terminal_state():
+            raise ValueError(f"Move {ply + 1} comes after the game ended")
+        if not pit.isdigit() or not 1 <= int(pit) <= n:
+            raise ValueError(f"Move {ply + 1} is not a pit 1-{n}: {pit!r}")
+        pit_num = int(pit) - 1 + board.first_pit(player)
+        if board.get_pit_seeds(pit_num) == 0:
+            raise ValueError(f"Move {ply + 1} plays the empty pit {pit}")
+
+        yield ply, player, pit_num, board
+
+        player = apply_move(board, pit_num, player)
+
+    if not board.at_terminal_state():
+        raise ValueError(f"The game is unfinished after {len(moves)} moves")
+    if "scores" in record and board.tally_up() != record["scores"]:
+        raise ValueError(f"Replay ends {board.tally_up()}, but the record says {record['scores']}")
+
+
+# == Statistics ================================================================
+
+# Running totals over the games added so far; memory depends only on the board
+# size and MAX_TRACKED_PLY, not on how many games there are.
+class GameStats:
+    def __init__(self):
+        self.games = 0
+        self.plies = 0
+        self.shortest = None
+        self.longest = 0
+        self.results = {'B': 0, 'A': 0, 'draw': 0}
+        self.extra_moves = 0
+        self.captures = 0
+        self.captured_seeds = 0
+        self.invalid = 0
+
+        # first pit played -> [games, B's total score from them]
+        self.first_moves = {}
+
+        # per ply: positions seen, and totals of the store difference (B - A)
+        # and of the mover's legal actions
+        self.ply_positions = [0] * MAX_TRACKED_PLY
+        self.ply_store_diff = [0] * MAX_TRACKED_PLY
+        self.ply_mobility = [0] * MAX_TRACKED_PLY
+
+    # replays record into the totals; a record that doesn't replay is
+    # counted as invalid and otherwise ignored. The result comes from the
+    # replay, so a record without a winner still counts.
+    def add(self, record):
+        plies = 0
+        extra_moves = 0
+        captures = 0
+        captured_seeds = 0
+        per_ply = []
+        try:
+            for ply, player, pit_num, board in replay(record):
+                plies += 1
+                if ply < MAX_TRACKED_PLY:
+                    per_ply.append((board.get_store_count('B') - board.get_store_count('A'),
+                                    len(board.legal_actions(player))))
+
+                # look one move ahead without changing the board
+                undo = board.make_move(pit_num, player)
+                if board.gets_extra_move() == player:
+                    extra_moves += 1
+                capture = board.get_capture()
+                if capture:
+                    captures += 1
+                    captured_seeds += 1 + board.get_pit_seeds(capture[2])
+                board.unmake_move(undo)
+        except ValueError:
+            self.invalid += 1
+            return
+
+        scores = board.tally_up()
+        winner = None
+        if scores['A'] != scores['B']:
+            winner = 'A' if scores['A'] > scores['B'] else 'B'
+
+        self.games += 1
+        self.plies += plies
+        self.shortest = plies if self.shortest is None else min(self.shortest, plies)
+        self.longest = max(self.longest, plies)
+        self.results[winner or 'draw'] += 1
+        self.extra_moves += extra_moves
+        self.captures += captures
+        self.captured_seeds += captured_seeds
+
+        first = self.first_moves.setdefault(record["moves"][:1], [0, 0.0])
+        first[0] += 1
+        first[1] += {'B': 1.0, 'A': 0.0, None: 0.5}[winner]
+
+        for ply, (store_diff, mobility) in enumerate(per_ply):
+            self.ply_positions[ply] += 1
+            self.ply_store_diff[ply] += store_diff
+            self.ply_mobility[ply] += mobility
+
+    def to_dict(self):
+        games = max(self.games, 1)
+        plies = max(self.plies, 1)
+        tracked = [ply for ply in range(MAX_TRACKED_PLY) if self.ply_positions[ply]]
+        return {
+            "games": self.games,
+            "invalid": self.invalid,
+            "mean_plies": self.plies / games,
+            "shortest": self.shortest,
+            "longest": self.longest,
+            "b_win_rate": self.results['B'] / games,
+            "a_win_rate": self.results['A'] / games,
+            "draw_rate": self.results['draw'] / games,
+            "extra_move_rate": self.extra_moves / plies,
+            "capture_rate": self.captures / plies,
+            "mean_captured_seeds": self.captured_seeds / max(self.captures, 1),
+            "b_score_by_first_move": {pit: total / count
+                                      for pit, (count, total) in sorted(self.first_moves.items())},
+            "mean_store_diff_by_ply": [self.ply_store_diff[ply] / self.ply_positions[ply] for ply in tracked],
+            "mean_mobility_by_ply": [self.ply_mobility[ply] / self.ply_positions[ply] for ply in tracked],
+        }
+
+
+# == Re-analysis ===============================================================
+
+# one agent per (depth, side, evaluation) in each worker process, kept across
+# batches so its transposition table stays warm; both sides' agents share one
+# table per (depth, evaluation)
+worker_agents = {}
+worker_tables = {}
+
+
+# Runs in a worker process: searches each position of batch, a list of
+# (game, ply, player, board list, played pit_num). Returns one result dict
+# per position.
+def analyze_batch(depth, evaluation, batch):
+    results = []
+    for game, ply, player, board_list, played in batch:
+        agent = worker_agents.get((depth, player, evaluation))
+        if agent is None:
+            tt = worker_tables.setdefault((depth, evaluation), TranspositionTable())
+            agent = Agent(depth, player, other_player(player), evaluation=evaluation, tt=tt)
+            worker_agents[(depth, player, evaluation)] = agent
+
+        board = Board()
+        board.board = board_list
+        best = agent.get_next_action(board)
+        first_pit = board.first_pit(player)
+        results.append({"game": game, "ply": ply, "player": player,
+                        "played": played - first_pit + 1, "best": best - first_pit + 1,
+                        "agrees": best == played, "nodes": agent.nodes})
+    return results
+
+
+# (game, ply, player, board list, played pit_num) for every position of the
+# records, in batches. A record that doesn't replay, or isn't Kalah(6, 4),
+# raises ValueError, or, given a skipped list, is described there and left out.
+def position_batches(records, batch_size=ANALYSIS_BATCH, skipped=None):
+    batch = []
+    for game, record in enumerate(records):
+        try:
+            if record.get("pits_per_side", 6) != 6 or record.get("seeds_per_pit", 4) != 4:
+                raise ValueError("the agent only analyzes Kalah(6, 4)")
+            # replayed in full first, so a bad record adds no positions
+            positions = [(game, ply, player, list(board.board), pit_num)
+                         for ply, player, pit_num, board in replay(record)]
+        except ValueError as e:
+            if skipped is None:
+                raise ValueError(f"Game {game}: {e}")
+            skipped.append(f"Game {game}: {e}")
+            continue
+
+        for position in positions:
+            batch.append(position)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def report_skipped(skipped):
+    if skipped:
+        print(f"skipped {len(skipped)} invalid lines or records; the first: {skipped[0]}", file=sys.stderr)
+
+
+# Searches every position of records at depth in a process pool and yields
+# the results in archive order. Only max_pending batches are in flight at a
+# time, so records are read no faster than the workers keep up. skipped is as
+# for position_batches.
+def analyze(records, depth, evaluation='research', workers=None, max_pending=MAX_PENDING_BATCHES, skipped=None):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in position_batches(records, skipped=skipped):
+            pending.append(pool.submit(analyze_batch, depth, evaluation, batch))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Statistics and re-analysis for game record archives.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = subparsers.add_parser("stats", help="replay every game and print aggregate statistics")
+    stats_parser.add_argument("paths", nargs="+", help="record archives (.jsonl or .jsonl.gz)")
+
+    analyze_parser = subparsers.add_parser("analyze", help="search every position and compare with the moves played")
+    analyze_parser.add_argument("paths", nargs="+", help="record archives (.jsonl or .jsonl.gz)")
+    analyze_parser.add_argument("--depth", type=int, default=4, help="agent search depth")
+    analyze_parser.add_argument("--evaluation", default="research", help="agent evaluation")
+    analyze_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    analyze_parser.add_argument("--output", help="JSON lines file for per-position results")
+    args = parser.parse_args(argv)
+
+    # bad lines and records are counted and reported, not fatal
+    skipped = []
+
+    def all_records():
+        for path in args.paths:
+            yield from read_records(path, skipped)
+
+    if args.command == "stats":
+        stats = GameStats()
+        for record in all_records():
+            stats.add(record)
+        stats.invalid += len(skipped)
+        print(json.dumps(stats.to_dict(), indent=2))
+        report_skipped(skipped)
+        return
+
+    output = open_archive(args.output, 'w') if args.output else None
+    tic = time.perf_counter()
+    positions = 0
+    agreements = 0
+    try:
+        for result in analyze(all_records(), args.depth, args.evaluation, args.workers, skipped=skipped):
+            positions += 1
+            agreements += result["agrees"]
+            if output is not None:
+                output.write(json.dumps(result) + "\n")
+    finally:
+        if output is not None:
+            output.close()
+    seconds = time.perf_counter() - tic
+    print(f"{positions} positions in {seconds:.1f} s ({positions / seconds if seconds else 0.0:.1f}/s); "
+          f"the moves played match the depth-{args.depth} agent in {agreements / max(positions, 1):.1%}",
+          file=sys.stderr)
+    report_skipped(skipped)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from game import Agent, Board, other_player
+from ponder import likely_positions
+
+# == Game server ===============================================================
+
+# Hosts many human-vs-agent games at once over TCP. Each line a client sends
+# is a command; each command gets exactly one JSON line back:
+#
+#   new [side=B|A] [depth=N] [time_budget_ms=N]   start a game (the agent moves first if you're A)
+#   move GAME PIT                                   play your pit 1-6 (left to right, as in Game)
+#   state GAME                                      current board and whose turn it is
+#   quit GAME                                       forget a game
+#   metrics                                         server load and latency
+#
+# The agent's searches run in a process pool, so the event loop keeps
+# serving other games while they think. With pondering on, idle workers also
+# search the positions the human's likeliest replies lead to while the human
+# thinks (see ponder.py); if the reply is one of them, that search is the
+# decision. The others are cancelled, or left to run out their time budget
+# if they've already started, and their results dropped.
+
+DEFAULT_DEPTH = 4
+DEFAULT_TIME_BUDGET_MS = 1000
+LATENCY_SAMPLES = 1000
+
+# one agent per (depth, side) in each worker process, kept across games so its
+# transposition table stays warm
+worker_agents = {}
+
+
+# Runs in a worker process: the agent's action for board_list, the seconds the
+# search took, the nodes it visited and the depth it reached
+def agent_move(depth, side, board_list, time_budget_ms):
+    agent = worker_agents.get((depth, side))
+    if agent is None:
+        agent = Agent(depth, side, other_player(side))
+        worker_agents[(depth, side)] = agent
+
+    board = Board()
+    board.board = board_list
+    tic = time.perf_counter()
+    action = agent.get_next_action(board, time_budget_ms)
+    return action, time.perf_counter() - tic, agent.nodes, agent.depth_reached
+
+
+# nearest-rank percentile of a non-empty sequence
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# One game in memory. Moves follow the same rules as Game: Game.move_seeds,
+# then the capture from Game.display_capture, then Game.get_next_player.
+class GameSession:
+    def __init__(self, game_id, human_side, depth, time_budget_ms):
+        self.game_id = game_id
+        self.board = Board()
+        self.next_player = 'B'
+        self.human_side = human_side
+        self.agent_side = other_player(human_side)
+        self.depth = depth
+        self.time_budget_ms = time_budget_ms
+
+        # moves from different connections to the same game take turns
+        self.lock = asyncio.Lock()
+
+        # pondered decisions in the pool: board tuple -> pool future of
+        # agent_move
+        self.pondered = {}
+
+    # Only searches still waiting for a worker can be cancelled; running ones
+    # finish and are thrown away
+    def cancel_pondering(self):
+        for future in self.pondered.values():
+            future.cancel()
+        self.pondered = {}
+
+    # Plays pit_num (a board index) for player. Returns a description of the move.
+    def play(self, pit_num, player):
+        self.board.move_seeds(pit_num, player)
+        self.next_player = other_player(player)
+
+        capture = self.board.get_capture()
+        if capture:
+            self.board.perform_capture()
+
+        extra_move = self.board.gets_extra_move() == player
+        if extra_move:
+            self.next_player = player
+
+        return {"player": player, "pit": pit_num - self.board.first_pit(player) + 1,
+                "extra_move": extra_move, "capture": capture is not None}
+
+    def finished(self):
+        return self.board.at_terminal_state()
+
+    def to_dict(self):
+        state = {"game": self.game_id, "board": self.board.board, "you": self.human_side}
+        if self.finished():
+            scores = self.board.tally_up()
+            state["scores"] = scores
+            state["winner"] = None
+            if scores['A'] != scores['B']:
+                state["winner"] = 'A' if scores['A'] > scores['B'] else 'B'
+        else:
+            state["next"] = self.next_player
+        return state
+
+
+class GameServer:
+    # ponder: how many of the human's likely replies to search ahead per turn,
+    # on workers that are idle at the time (0 turns pondering off)
+    def __init__(self, workers=None, time_budget_ms=DEFAULT_TIME_BUDGET_MS, max_depth=8, max_games=10000,
+                 ponder=0):
+        self.workers = workers or os.cpu_count()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.time_budget_ms = time_budget_ms
+        self.max_depth = max_depth
+        self.max_games = max_games
+        self.ponder = ponder
+
+        # agents that only predict the human's replies, by (depth, side)
+        self.predictors = {}
+
+        self.sessions = {}
+        self.game_ids = itertools.count(1)
+
+        # agent decisions submitted to the pool and not yet finished, and
+        # the pool futures of pondered ones, kept until they leave the pool
+        # (cancelled searches that already started still hold a worker)
+        self.pending = 0
+        self.ponder_jobs = set()
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+
+        self.connections = 0
+        self.requests = 0
+        self.decisions = 0
+        self.started = time.monotonic()
+        # seconds from submitting a decision to getting it back (queueing
+        # included), seconds spent searching, and seconds per request
+        self.decision_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.search_seconds = deque(maxlen=LATENCY_SAMPLES)
+        self.request_latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    async def handle_client(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode(errors='replace').strip()
+                if not line:
+                    continue
+                response = await self.handle(line)
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    # the JSON-serializable response to one command line
+    async def handle(self, line):
+        tic = time.perf_counter()
+        self.requests += 1
+        command, *args = line.split()
+        try:
+            if command == "new":
+                response = await self.new_game(args)
+            elif command == "move":
+                response = await self.human_move(args)
+            elif command == "state":
+                response = self.get_session(args).to_dict()
+            elif command == "quit":
+                session = self.get_session(args)
+                session.cancel_pondering()
+                del self.sessions[session.game_id]
+                response = {"game": session.game_id, "closed": True}
+            elif command == "metrics":
+                response = self.metrics()
+            else:
+                raise ValueError(f"Unknown command: {command}")
+        except ValueError as e:
+            response = {"error": str(e)}
+        self.request_latencies.append(time.perf_counter() - tic)
+        return response
+
+    def get_session(self, args):
+        if not args or not args[0].isdigit():
+            raise ValueError("Expected a game number")
+        session = self.sessions.get(int(args[0]))
+        if session is None:
+            raise ValueError(f"No game {args[0]}")
+        return session
+
+    async def new_game(self, args):
+        if len(self.sessions) >= self.max_games:
+            raise ValueError("Too many games in progress")
+
+        options = {"side": "B", "depth": str(DEFAULT_DEPTH), "time_budget_ms": str(self.time_budget_ms)}
+        for arg in args:
+            key, _, value = arg.partition("=")
+            if key not in options:
+                raise ValueError(f"Unknown option: {key}")
+            options[key] = value
+        if options["side"] not in ('A', 'B'):
+            raise ValueError("side must be A or B")
+        if not options["depth"].isdigit() or not 1 <= int(options["depth"]) <= self.max_depth:
+            raise ValueError(f"depth must be 1-{self.max_depth}")
+        try:
+            time_budget_ms = float(options["time_budget_ms"])
+        except ValueError:
+            time_budget_ms = math.nan
+        # nan and inf would let one game hold a worker for good
+        if not (math.isfinite(time_budget_ms) and time_budget_ms > 0):
+            raise ValueError("time_budget_ms must be a positive number")
+        # the server's budget is also the most a game may ask for
+        time_budget_ms = min(time_budget_ms, self.time_budget_ms)
+
+        session = GameSession(next(self.game_ids), options["side"], int(options["depth"]), time_budget_ms)
+        self.sessions[session.game_id] = session
+        async with session.lock:
+            moves = await self.agent_turns(session)
+            self.start_pondering(session)
+        return dict(session.to_dict(), moves=moves)
+
+    async def human_move(self, args):
+        session = self.get_session(args)
+        if len(args) < 2 or not args[1].isdigit() or not 1 <= int(args[1]) <= 6:
+            raise ValueError("Invalid pit choice (select 1-6)")
+
+        async with session.lock:
+            if session.finished():
+                raise ValueError("The game is over")
+            if session.next_player != session.human_side:
+                raise ValueError("It's not your turn")
+
+            pit_num = int(args[1]) - 1
+            if session.human_side == 'A':
+                pit_num += 7
+            if session.board.get_pit_seeds(pit_num) == 0:
+                raise ValueError("That pit is empty")
+
+            moves = [session.play(pit_num, session.human_side)]
+            moves += await self.agent_turns(session)
+            self.start_pondering(session)
+        return dict(session.to_dict(), moves=moves)
+
+    # plays the agent's moves until it's the human's turn or the game is over
+    async def agent_turns(self, session):
+        moves = []
+        while not session.finished() and session.next_player == session.agent_side:
+            action, seconds, nodes, depth = await self.decide(session)
+            move = session.play(action, session.agent_side)
+            move.update(seconds=seconds, nodes=nodes, depth=depth)
+            moves.append(move)
+        return moves
+
+    # Submits searches of the likeliest positions the human's turn can end in,
+    # up to self.ponder of them and no more than there are idle workers
+    def start_pondering(self, session):
+        if not self.ponder or session.finished() or session.next_player != session.human_side:
+            return
+        idle = self.workers - self.pending - len(self.ponder_jobs)
+        if idle <= 0:
+            return
+
+        predictor = self.predictors.get((session.depth, session.agent_side))
+        if predictor is None:
+            predictor = Agent(session.depth, session.agent_side, session.human_side, tt_size_mb=0)
+            self.predictors[(session.depth, session.agent_side)] = predictor
+
+        loop = asyncio.get_running_loop()
+        for board_list in likely_positions(session.board, session.human_side, predictor.evaluate,
+                                           min(self.ponder, idle)):
+            key = tuple(board_list)
+            if key in session.pondered:
+                continue
+            # submitted to the pool directly: cancelling an asyncio wrapper
+            # would report the worker free while the search still runs
+            future = self.pool.submit(agent_move, session.depth, session.agent_side,
+                                      board_list, session.time_budget_ms)
+            self.ponder_jobs.add(future)
+            future.add_done_callback(functools.partial(self.ponder_done, loop))
+            session.pondered[key] = future
+
+    # runs in the pool's thread, not the event loop's
+    def ponder_done(self, loop, future):
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self.ponder_jobs.discard, future)
+
+    async def decide(self, session):
+        loop = asyncio.get_running_loop()
+        tic = time.perf_counter()
+
+        # the position may have been searched while the human thought
+        future = session.pondered.pop(tuple(session.board.board), None)
+        session.cancel_pondering()
+        if future is not None and not future.cancelled():
+            self.ponder_hits += 1
+            # from here on it's counted as a pending decision
+            self.ponder_jobs.discard(future)
+            future = asyncio.wrap_future(future)
+        else:
+            if self.ponder:
+                self.ponder_misses += 1
+            future = loop.run_in_executor(self.pool, agent_move, session.depth, session.agent_side,
+                                          list(session.board.board), session.time_budget_ms)
+
+        self.pending += 1
+        try:
+            result = await future
+        finally:
+            self.pending -= 1
+        self.decisions += 1
+        self.decision_latencies.append(time.perf_counter() - tic)
+        self.search_seconds.append(result[1])
+        return result
+
+    def metrics(self):
+        metrics = {
+            "games": len(self.sessions),
+            "connections": self.connections,
+            "requests": self.requests,
+            "decisions": self.decisions,
+            "workers": self.workers,
+            # searches, pondered ones included, waiting for a free worker
+            "queue_depth": max(0, self.pending + len(self.ponder_jobs) - self.workers),
+            "in_flight": min(self.pending + len(self.ponder_jobs), self.workers),
+            "pondering": len(self.ponder_jobs),
+            "uptime_seconds": time.monotonic() - self.started,
+        }
+        if self.ponder:
+            metrics["ponder_hits"] = self.ponder_hits
+            metrics["ponder_misses"] = self.ponder_misses
+            pondered = self.ponder_hits + self.ponder_misses
+            metrics["ponder_hit_rate"] = self.ponder_hits / pondered if pondered else 0.0
+        for name, samples in (("decision_latency", self.decision_latencies),
+                              ("search_time", self.search_seconds),
+                              ("request_latency", self.request_latencies)):
+            if samples:
+                metrics[f"{name}_p50_ms"] = percentile(samples, 0.50) * 1000
+                metrics[f"{name}_p99_ms"] = percentile(samples, 0.99) * 1000
+        return metrics
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def serve(host, port, workers, time_budget_ms, ponder=0):
+    game_server = GameServer(workers, time_budget_ms, ponder=ponder)
+    server = await asyncio.start_server(game_server.handle_client, host, port)
+    print(f"serving on {host}:{port} with {game_server.workers} agent workers")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        game_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many mancala games against the agent over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes running agent searches")
+    parser.add_argument("--time-budget-ms", type=float, default=DEFAULT_TIME_BUDGET_MS,
+                        help="longest an agent may think per move")
+    parser.add_argument("--ponder", type=int, default=0,
+                        help="search this many of the human's likely replies ahead on idle workers")
+    args = parser.parse_args(argv)
+    if not (math.isfinite(args.time_budget_ms) and args.time_budget_ms > 0):
+        parser.error("--time-budget-ms must be a positive number")
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.time_budget_ms, args.ponder))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+import argparse
+import os
+import pickle
+import sys
+import time
+
+from endgame import EndgameDatabase, PositionIndex, generate, play_relative, relative_pits
+from game import Board
+
+# == Solver ====================================================================
+
+# Proves the exact value of Kalah(pits_per_side, seeds_per_pit) under perfect
+# play: the final store difference (first player minus second) and the
+# opening moves that achieve it. Positions are relative to the player to move
+# (see endgame.py); stores don't affect the rest of the game, so a position's
+# value is just what its pits are still worth, mover minus opponent.
+#
+# MTD(f) narrows in on the value with null-window alpha-beta searches that
+# share a transposition table of proven bounds; positions with few seeds left
+# are read from an endgame table instead of searched.
+#
+# Long solves write a checkpoint (the transposition table and the bounds
+# proven so far) every few minutes. A solve started with the same checkpoint
+# path picks up from there; only the null-window search in progress is redone,
+# mostly from table hits.
+
+CHECKPOINT_VERSION = 1
+NODES_PER_CLOCK_CHECK = 4096
+
+
+class SolveInterrupted(Exception):
+    pass
+
+
+# Endgame values generated in memory, looked up like EndgameDatabase.lookup
+class EndgameTable:
+    def __init__(self, max_seeds, pits_per_side):
+        self.max_seeds = max_seeds
+        self.index = PositionIndex(max_seeds, 2 * pits_per_side)
+        self.values = generate(max_seeds, pits_per_side=pits_per_side)
+
+    def lookup(self, pits):
+        total = sum(pits)
+        if total > self.max_seeds:
+            return None
+        value = self.values[self.index.rank(pits, total)]
+        return value - 256 if value > 127 else value
+
+
+class Solver:
+    def __init__(self, pits_per_side=6, seeds_per_pit=4, endgame_seeds=None, endgame_path=None,
+                 tt_entries=20_000_000, checkpoint_path=None, checkpoint_interval=300.0,
+                 time_limit=None, progress=None):
+        self.pits_per_side = pits_per_side
+        self.seeds_per_pit = seeds_per_pit
+        self.root = tuple(relative_pits(Board(pits_per_side, seeds_per_pit).board, 'B'))
+        self.total = sum(self.root)
+
+        # endgame values from a database file, or generated here
+        self.endgame = None
+        if endgame_path:
+            self.endgame = EndgameDatabase(endgame_path)
+            if self.endgame.pits_per_side != pits_per_side:
+                raise ValueError(f"{endgame_path} is for {self.endgame.pits_per_side} pits a side, "
+                                 f"not {pits_per_side}")
+        elif endgame_seeds:
+            self.endgame = EndgameTable(min(endgame_seeds, self.total), pits_per_side)
+
+        # position -> [lower bound, upper bound, best pit]. When the table
+        # reaches tt_entries it is emptied and refilled; that costs time but
+        # never correctness.
+        self.tt = {}
+        self.tt_entries = tt_entries
+
+        # what MTD(f) has proven about the root so far
+        self.lower = -self.total
+        self.upper = self.total
+        self.guess = 0
+
+        self.nodes = 0
+        self.tt_hits = 0
+        self.endgame_hits = 0
+        self.elapsed = 0.0
+
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.time_limit = time_limit
+        self.progress = progress
+
+    # the position's value with a window of (alpha, beta): exact inside it,
+    # otherwise a bound on the side it fell (fail-soft)
+    def search(self, pits, alpha, beta):
+        self.nodes += 1
+        if self.nodes % NODES_PER_CLOCK_CHECK == 0:
+            self.check_clock()
+
+        n = self.pits_per_side
+        own = sum(pits[0:n])
+        total = own + sum(pits[n:])
+        if own == 0 or own == total:
+            # game over: everyone keeps the seeds on their side
+            return 2 * own - total
+
+        if self.endgame is not None and total <= self.endgame.max_seeds:
+            self.endgame_hits += 1
+            return self.endgame.lookup(pits)
+
+        entry = self.tt.get(pits)
+        best_pit = None
+        if entry is not None:
+            lower, upper, best_pit = entry
+            if lower >= beta:
+                self.tt_hits += 1
+                return lower
+            if upper <= alpha:
+                self.tt_hits += 1
+                return upper
+            alpha = max(alpha, lower)
+            beta = min(beta, upper)
+        original_alpha = alpha
+        original_beta = beta
+
+        best_value = -total - 1
+        for pit_num, gain, next_pits, extra_move in self.children(pits, best_pit):
+            # the mover keeps moving after an extra move; otherwise the
+            # opponent's value counts against them
+            if extra_move:
+                value = gain + self.search(next_pits, alpha - gain, beta - gain)
+            else:
+                value = gain - self.search(next_pits, gain - beta, gain - alpha)
+            if value > best_value:
+                best_value = value
+                best_pit = pit_num
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if len(self.tt) >= self.tt_entries:
+            self.tt.clear()
+        lower, upper = -total, total
+        if entry is not None:
+            lower, upper = entry[0], entry[1]
+        if best_value <= original_alpha:
+            upper = min(upper, best_value)
+        elif best_value >= original_beta:
+            lower = max(lower, best_value)
+        else:
+            lower = upper = best_value
+        self.tt[pits] = [lower, upper, best_pit]
+        return best_value
+
+    # Moves in search order: the table's best move, then extra moves, then
+    # captures by size, then the rest from the pit nearest the store
+    def children(self, pits, best_pit):
+        children = []
+        for pit_num in range(self.pits_per_side):
+            if pits[pit_num]:
+                children.append((pit_num,) + play_relative(pits, pit_num))
+
+        def order(child):
+            pit_num, gain, next_pits, extra_move = child
+            return (pit_num != best_pit, not extra_move, -gain, -pit_num)
+
+        children.sort(key=order)
+        return children
+
+    # Narrows the root's bounds with null-window searches until they meet.
+    # Returns the exact value.
+    def mtdf(self):
+        while self.lower < self.upper:
+            beta = max(self.guess, self.lower + 1)
+            value = self.search(self.root, beta - 1, beta)
+            if value < beta:
+                self.upper = value
+            else:
+                self.lower = value
+            self.guess = value
+            if self.progress:
+                self.progress(self)
+        return self.lower
+
+    # every opening move (pit 1 to pits per side) that achieves value
+    def best_moves(self, value):
+        moves = []
+        for pit_num, gain, next_pits, extra_move in self.children(self.root, None):
+            if extra_move:
+                move_value = gain + self.search(next_pits, value - 1 - gain, value - gain)
+            else:
+                move_value = gain - self.search(next_pits, gain - value, gain - value + 1)
+            if move_value >= value:
+                moves.append(pit_num + 1)
+        return sorted(moves)
+
+    # Solves the game, resuming from the checkpoint if there is one. Returns
+    # (value, best opening moves), or raises SolveInterrupted when the time
+    # limit is reached (after writing a checkpoint).
+    def solve(self):
+        self.load_checkpoint()
+        self.started = time.monotonic()
+        self.last_checkpoint = self.started
+        self.deadline = None
+        if self.time_limit is not None:
+            self.deadline = self.started + self.time_limit
+        try:
+            value = self.mtdf()
+            moves = self.best_moves(value)
+        except (SolveInterrupted, KeyboardInterrupt):
+            self.save_checkpoint()
+            raise
+        finally:
+            self.update_elapsed()
+        self.save_checkpoint()
+        return value, moves
+
+    def update_elapsed(self):
+        now = time.monotonic()
+        self.elapsed += now - self.started
+        self.started = now
+
+    def check_clock(self):
+        now = time.monotonic()
+        if self.checkpoint_path and now - self.last_checkpoint >= self.checkpoint_interval:
+            self.save_checkpoint()
+        if self.deadline is not None and now >= self.deadline:
+            raise SolveInterrupted()
+
+    def save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        self.update_elapsed()
+        self.last_checkpoint = self.started
+
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "variant": (self.pits_per_side, self.seeds_per_pit),
+            "tt": self.tt,
+            "bounds": (self.lower, self.upper, self.guess),
+            "counters": (self.nodes, self.tt_hits, self.endgame_hits, self.elapsed),
+        }
+        # write to the side and swap it in, so a crash never leaves half a checkpoint
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"{self.checkpoint_path} is not a solver checkpoint this version can read")
+        if state["variant"] != (self.pits_per_side, self.seeds_per_pit):
+            raise ValueError(f"{self.checkpoint_path} is for Kalah{state['variant']}")
+        self.tt = state["tt"]
+        self.lower, self.upper, self.guess = state["bounds"]
+        self.nodes, self.tt_hits, self.endgame_hits, self.elapsed = state["counters"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve a small Kalah variant exactly.")
+    parser.add_argument("--pits", type=int, default=4, help="pits per side")
+    parser.add_argument("--seeds", type=int, default=3, help="seeds per pit at the start")
+    parser.add_argument("--endgame-seeds", type=int, default=8,
+                        help="generate an endgame table for up to this many seeds in the pits")
+    parser.add_argument("--endgame-path", help="use this endgame database instead (see endgame.py --pits)")
+    parser.add_argument("--tt-entries", type=int, default=20_000_000, help="transposition table size cap")
+    parser.add_argument("--checkpoint", help="checkpoint file to resume from and save to")
+    parser.add_argument("--checkpoint-interval", type=float, default=300.0, help="seconds between checkpoints")
+    parser.add_argument("--time-limit", type=float, help="stop (with a checkpoint) after this many seconds")
+    args = parser.parse_args(argv)
+
+    def progress(solver):
+        seconds = solver.elapsed + time.monotonic() - solver.started
+        print(f"value in [{solver.lower}, {solver.upper}] after {solver.nodes:,} nodes "
+              f"({seconds:.1f} s, {len(solver.tt):,} table entries)")
+
+    solver = Solver(args.pits, args.seeds, args.endgame_seeds, args.endgame_path, args.tt_entries,
+                    args.checkpoint, args.checkpoint_interval, args.time_limit, progress)
+    try:
+        value, moves = solver.solve()
+    except SolveInterrupted:
+        print(f"stopped at the time limit with the value in [{solver.lower}, {solver.upper}]"
+              + (f"; resume with --checkpoint {args.checkpoint}" if args.checkpoint else ""))
+        sys.exit(1)
+
+    result = "a draw" if value == 0 else f"a win for the {'first' if value > 0 else 'second'} player by {abs(value)}"
+    print(f"Kalah({args.pits}, {args.seeds}) is {result}; best opening moves: "
+          f"{', '.join(f'pit {pit}' for pit in moves)}")
+    print(f"{solver.nodes:,} nodes, {solver.tt_hits:,} table hits, {solver.endgame_hits:,} endgame hits, "
+          f"{solver.elapsed:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
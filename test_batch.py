@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from batch import PLAYER_NAMES, BatchBoards, verify_against_board
+from game import Board, apply_move
+
+
+# boards from random points of random games, with the player to move
+def random_positions(rng, count):
+    positions = []
+    while len(positions) < count:
+        board = Board()
+        player = 'B'
+        for _ in range(rng.randrange(0, 40)):
+            if board.at_terminal_state():
+                break
+            player = apply_move(board, rng.choice(board.get_legal_actions(player)), player)
+        if not board.at_terminal_state():
+            positions.append((list(board.board), player))
+    return positions
+
+
+# Every legal move of random positions, played on all boards at once, leaves
+# the same boards, extra moves, captures and terminal flags as Board
+def test_batch_moves_match_board():
+    rng = random.Random(0)
+    moves = []
+    for board_list, player in random_positions(rng, 200):
+        board = Board()
+        board.board = board_list
+        moves += [(board_list, player, pit_num) for pit_num in board.get_legal_actions(player)]
+
+    batch = BatchBoards(len(moves))
+    batch.boards[:] = [board_list for board_list, _, _ in moves]
+    pits = [pit_num for _, _, pit_num in moves]
+    players = [PLAYER_NAMES.index(player) for _, player, _ in moves]
+    extra_move, capture, terminal = batch.move_seeds(pits, players)
+
+    for j, (board_list, player, pit_num) in enumerate(moves):
+        board = Board()
+        board.board = list(board_list)
+        board.move_seeds(pit_num, player)
+        captured = board.get_capture() is not None
+        if captured:
+            board.perform_capture()
+        assert batch.boards[j].tolist() == board.board
+        assert extra_move[j] == (board.gets_extra_move() == player)
+        assert capture[j] == captured
+        assert terminal[j] == board.at_terminal_state()
+
+
+# Random games played to the end on both engines give the same final scores
+def test_batch_terminal_scores_match_board():
+    rng = random.Random(1)
+    games = []
+    for _ in range(100):
+        board = Board()
+        player = 'B'
+        while not board.at_terminal_state():
+            player = apply_move(board, rng.choice(board.get_legal_actions(player)), player)
+        games.append(board)
+
+    batch = BatchBoards(len(games))
+    batch.boards[:] = [board.board for board in games]
+    for board, (b_score, a_score), done in zip(games, batch.tally_up(), batch.players_done()):
+        assert {'B': b_score, 'A': a_score} == board.tally_up()
+        assert tuple(done) == board.players_done()
+
+
+def test_verify_against_board():
+    assert verify_against_board(100, seed=2) > 0
@@ -0,0 +1,36 @@
+from benchmark import CORPUS, parse_depths
+from game import Agent, Board, other_player
+
+
+def make_board(board_list):
+    board = Board()
+    board.board = list(board_list)
+    return board
+
+
+def threats(board, player):
+    outcomes = [board.move_outcome(action, player) for action in board.legal_actions(player)]
+    return any(extra_move for extra_move, _ in outcomes), any(capture for _, capture in outcomes)
+
+
+def test_corpus_positions_are_searched():
+    for name, _, board_list, player in CORPUS:
+        board = make_board(board_list)
+        assert sum(board.board) == 48, name
+        assert not board.at_terminal_state(), name
+        assert threats(board, player) == (False, False), name
+
+        agent = Agent(1, player, other_player(player))
+        agent.get_next_action(board)
+        assert agent.stats.source == "search", name
+
+
+def test_tactical_positions_threaten_both():
+    for name, category, board_list, player in CORPUS:
+        if category == "tactical":
+            assert threats(make_board(board_list), other_player(player)) == (True, True), name
+
+
+def test_parse_depths():
+    assert parse_depths("2-8") == [2, 3, 4, 5, 6, 7, 8]
+    assert parse_depths("2,4-5") == [2, 4, 5]
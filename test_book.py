@@ -0,0 +1,41 @@
+from book import canonical_key, opening_positions
+from game import Board, apply_move
+
+PLIES = 4
+
+
+# Every (board, player to move) reachable from the start by legal moves in at
+# most plies moves, finished games included
+def reachable_positions(plies):
+    reachable = set()
+    frontier = {(tuple(Board().board), 'B')}
+    for _ in range(plies + 1):
+        reachable |= frontier
+        next_frontier = set()
+        for board_tuple, player in frontier:
+            board = Board()
+            board.board = list(board_tuple)
+            if board.at_terminal_state():
+                continue
+            for pit_num in board.get_legal_actions(player):
+                board.board = list(board_tuple)
+                next_player = apply_move(board, pit_num, player)
+                next_frontier.add((tuple(board.board), next_player))
+        frontier = next_frontier - reachable
+    return reachable
+
+
+# The book holds exactly the unfinished positions legal play reaches
+def test_opening_positions_are_reachable():
+    reachable = reachable_positions(PLIES)
+    positions = opening_positions(PLIES)
+    for board_list, player in positions.values():
+        assert (tuple(board_list), player) in reachable
+
+    expected = set()
+    for board_tuple, player in reachable:
+        board = Board()
+        board.board = list(board_tuple)
+        if not board.at_terminal_state():
+            expected.add(canonical_key(board, player))
+    assert set(positions) == expected
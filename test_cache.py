@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from cache import SearchCache
+from game import Agent, Board, apply_move, other_player
+
+
+def key(n):
+    return (n, 4, 1)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = SearchCache()
+    cache.max_entries = 3
+    for n in (1, 2, 3):
+        cache.put(key(n), (float(n), n, False))
+    # reading an entry makes it the most recently used
+    assert cache.get(key(1)) == (1.0, 1, False)
+    cache.put(key(4), (4.0, 4, False))
+
+    assert cache.get(key(2)) is None
+    assert [cache.get(key(n))[1] for n in (1, 3, 4)] == [1, 3, 4]
+    assert cache.evictions == 1
+    assert (cache.hits, cache.misses) == (4, 1)
+
+
+# a new cache on the same path reads the snapshot, flags and all
+def test_snapshot_reload(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    cache = SearchCache(path, snapshot_interval=None)
+    results = {key(n): (n * 0.25 - 3.0, n % 6, n % 2 == 0) for n in range(1, 200)}
+    for entry_key, result in results.items():
+        cache.put(entry_key, result)
+    cache.close()
+
+    reloaded = SearchCache(path)
+    assert reloaded.get((1, 5, 1)) is None
+    assert reloaded.get((1, 4, 2)) is None
+    for entry_key, result in results.items():
+        assert reloaded.get(entry_key) == result
+    assert reloaded.file_hits == len(results)
+    reloaded.close()
+
+
+# a snapshot keeps what another process wrote to the file in the meantime
+def test_snapshot_merges_other_writers(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    first = SearchCache(path, snapshot_interval=None)
+    second = SearchCache(path, snapshot_interval=None)
+    first.put(key(1), (1.0, 1, False))
+    first.close()
+    second.put(key(2), (2.0, 2, True))
+    second.close()
+
+    merged = SearchCache(path)
+    assert merged.get(key(1)) == (1.0, 1, False)
+    assert merged.get(key(2)) == (2.0, 2, True)
+    merged.close()
+
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / "cache.bin"
+    path.write_bytes(b"not a cache file at all")
+    with pytest.raises(ValueError):
+        SearchCache(str(path))
+
+
+# An agent reading another process's cache file makes the same decisions
+# without searching them again
+def test_agent_decisions_survive_reload(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    rng = random.Random(4)
+    positions = []
+    board = Board()
+    player = 'B'
+    while len(positions) < 6 and not board.at_terminal_state():
+        positions.append((list(board.board), player))
+        player = apply_move(board, rng.choice(board.get_legal_actions(player)), player)
+
+    def decide():
+        actions = []
+        nodes = 0
+        for board_list, player in positions:
+            board = Board()
+            board.board = list(board_list)
+            agent = Agent(3, player, other_player(player), cache_path=path)
+            actions.append(agent.get_next_action(board))
+            nodes += agent.nodes
+            agent.close()
+            agent.cache.close()
+        return actions, nodes
+
+    actions, nodes = decide()
+    assert nodes > 0
+    assert decide() == (actions, 0)
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from endgame import EndgameDatabase, PositionIndex, compositions, generate, write_database
+from game import Agent, Board, apply_move, other_player
+
+
+def write_test_database(path, max_seeds, pits_per_side):
+    write_database(str(path), max_seeds, generate(max_seeds, pits_per_side=pits_per_side), pits_per_side)
+    return EndgameDatabase(str(path))
+
+
+# Perfect-play final store difference (player minus opponent) of board, by
+# plain minimax over the game's own rules
+def minimax(board: Board, player):
+    if board.at_terminal_state():
+        scores = board.tally_up()
+        return scores[player] - scores[other_player(player)]
+    best = None
+    for pit_num in board.get_legal_actions(player):
+        child = Board(board.pits_per_side)
+        child.board = list(board.board)
+        next_player = apply_move(child, pit_num, player)
+        value = minimax(child, next_player)
+        if next_player != player:
+            value = -value
+        best = value if best is None else max(best, value)
+    return best
+
+
+# Ranks number the positions of each seed total 0, 1, 2, ... in composition
+# order, with no gaps between totals
+@pytest.mark.parametrize("num_pits", [4, 6, 12])
+def test_rank_is_a_perfect_index(num_pits):
+    index = PositionIndex(5, num_pits)
+    ranks = [index.rank(pits, total) for total in range(6) for pits in compositions(total, num_pits)]
+    assert ranks == list(range(index.size))
+
+
+# Probes of random positions (stores empty, as the database assumes) agree
+# with minimax, for both players and from a file
+def test_probe_values_match_minimax(tmp_path):
+    database = write_test_database(tmp_path / "endgame.db", 6, 3)
+    try:
+        rng = random.Random(0)
+        for _ in range(150):
+            total = rng.randrange(1, 7)
+            pits = [0] * 6
+            for _ in range(total):
+                pits[rng.randrange(6)] += 1
+            board = Board(3)
+            board.board = pits[0:3] + [0] + pits[3:6] + [0]
+            for player in ('B', 'A'):
+                assert database.value(board, player) == minimax(board, player)
+                if not board.at_terminal_state():
+                    action, value = database.best_action(board, player)
+                    # the best action's child is worth the position's value
+                    child = Board(3)
+                    child.board = list(board.board)
+                    next_player = apply_move(child, action, player)
+                    after = minimax(child, next_player)
+                    assert value == (after if next_player == player else -after) == minimax(board, player)
+    finally:
+        database.close()
+
+
+def test_database_round_trip(tmp_path):
+    database = write_test_database(tmp_path / "endgame.db", 4, 2)
+    try:
+        assert (database.max_seeds, database.pits_per_side) == (4, 2)
+        assert database.lookup((0, 0, 5, 0)) is None
+        assert database.lookup((0, 0, 0, 4)) == -4
+        assert database.lookup((1, 0, 0, 0)) == 1
+    finally:
+        database.close()
+
+
+def test_truncated_database_is_refused(tmp_path):
+    path = tmp_path / "endgame.db"
+    write_test_database(path, 4, 2).close()
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        EndgameDatabase(str(path))
+
+
+# the agent plays six pits a side, so another size's values would be wrong
+def test_agent_refuses_database_for_other_board_size(tmp_path):
+    write_test_database(tmp_path / "endgame.db", 4, 3).close()
+    with pytest.raises(ValueError):
+        Agent(2, 'B', 'A', endgame_path=str(tmp_path / "endgame.db"))
@@ -0,0 +1,174 @@
+import random
+from copy import deepcopy
+
+import pytest
+
+import game
+from game import Agent, Board, PackedBoard, apply_move, other_player, search_subtree
+
+BOARD_CLASSES = (Board, PackedBoard)
+
+
+def assert_same_position(board, expected):
+    assert board.board == expected.board
+    assert board.gets_extra_move() == expected.gets_extra_move()
+    assert board.get_capture() == expected.get_capture()
+
+
+# make_move then unmake_move, with and without the capture applied, gives back
+# exactly the board it started from, at every position of random games;
+# several moves made in a row unmake in reverse order too
+@pytest.mark.parametrize("board_class", BOARD_CLASSES)
+def test_make_unmake_round_trip(board_class):
+    rng = random.Random(0)
+    for _ in range(30):
+        board = board_class()
+        player = 'B'
+        while not board.at_terminal_state():
+            before = deepcopy(board)
+            for action in board.get_legal_actions(player):
+                for apply_capture in (False, True):
+                    undo = board.make_move(action, player, apply_capture)
+                    board.check_invariants()
+                    board.unmake_move(undo)
+                    board.check_invariants()
+                    assert_same_position(board, before)
+
+            undos = []
+            mover = player
+            for _ in range(rng.randrange(1, 6)):
+                if board.at_terminal_state():
+                    break
+                action = rng.choice(board.get_legal_actions(mover))
+                undos.append(board.make_move(action, mover, apply_capture=True))
+                board.check_invariants()
+                if board.gets_extra_move() != mover:
+                    mover = other_player(mover)
+            for undo in reversed(undos):
+                board.unmake_move(undo)
+            board.check_invariants()
+            assert_same_position(board, before)
+
+            player = apply_move(board, rng.choice(board.get_legal_actions(player)), player)
+            board.check_invariants()
+
+
+def random_position(rng, board_class=PackedBoard):
+    board = board_class()
+    player = 'B'
+    for _ in range(rng.randrange(2, 30)):
+        if board.at_terminal_state():
+            break
+        player = apply_move(board, rng.choice(board.get_legal_actions(player)), player)
+    return board, player
+
+
+# The parallel root search gives the same value and action as the serial
+# one, late-move reductions included
+@pytest.mark.parametrize("options", [{}, {"lmr": True}, {"lmr": True, "pvs": True}])
+def test_parallel_search_matches_serial(options):
+    rng = random.Random(1)
+    for _ in range(8):
+        board, player = random_position(rng)
+        if board.at_terminal_state():
+            continue
+        results = []
+        for workers in (None, 2):
+            agent = Agent(4, player, other_player(player), workers=workers, **options)
+            agent.search_depth = agent.depth
+            try:
+                result = agent.search_root(player, board)
+            finally:
+                agent.close()
+            results.append((result["value"], result["action"]))
+        assert results[0] == results[1]
+
+
+# A worker searches a root child just as the serial search does at ply 1:
+# same value and same late-move reductions
+def test_worker_subtree_matches_serial():
+    rng = random.Random(2)
+    for _ in range(6):
+        board, player = random_position(rng)
+        if board.at_terminal_state():
+            continue
+        opponent = other_player(player)
+        config = Agent(4, player, opponent, lmr=True, workers=2).worker_config
+        for action in board.get_legal_actions(player):
+            undo = board.make_move(action, player)
+            next_player, tree_level = (player, 0) if board.gets_extra_move() == player else (opponent, 1)
+
+            serial = Agent(4, player, opponent, lmr=True)
+            serial.ply = 1
+            expected = serial.standard_minimax(next_player, board, -10.0, float('inf'), tree_level)["value"]
+            game.worker_agents.clear()
+            value = search_subtree(config, board.state, next_player, tree_level, -10.0, 4, None)[0]
+            (worker,) = game.worker_agents.values()
+            board.unmake_move(undo)
+
+            assert value == expected
+            assert worker.lmr_reductions == serial.lmr_reductions
+
+
+def test_tt_depth_policy_keeps_deeper_results():
+    table = game.TranspositionTable(size_mb=0, policy='depth')
+    assert len(table.slots) == 1
+    table.store(1, "deep", True, 5, game.TT_EXACT, 10, 0)
+    table.store(2, "shallow", True, 3, game.TT_EXACT, 20, 1)
+    assert table.probe(1, "deep", True)[4] == 10
+    assert table.probe(2, "shallow", True) is None
+    assert table.collisions == 1
+
+    # the same position is always overwritten, even by a shallower result
+    table.store(1, "deep", True, 2, game.TT_LOWER, 30, 2)
+    assert table.probe(1, "deep", True)[2:5] == (2, game.TT_LOWER, 30)
+    # and any position by one at least as deep
+    table.store(2, "shallow", True, 2, game.TT_EXACT, 40, 3)
+    assert table.probe(2, "shallow", True)[4] == 40
+    assert table.probe(1, "deep", True) is None
+
+
+def test_tt_two_tier_policy_always_stores():
+    table = game.TranspositionTable(size_mb=0, policy='two-tier')
+    assert len(table.slots) == 2
+    table.store(0, "deep", True, 5, game.TT_EXACT, 10, 0)
+    table.store(0, "first", True, 3, game.TT_EXACT, 20, 0)
+    table.store(0, "second", False, 1, game.TT_EXACT, 30, 0)
+    assert table.probe(0, "deep", True)[4] == 10
+    assert table.probe(0, "first", True) is None
+    assert table.probe(0, "second", False)[4] == 30
+    # the position and the player to move both have to match
+    assert table.probe(0, "second", True) is None
+
+    with pytest.raises(ValueError):
+        game.TranspositionTable(policy='random')
+
+
+# The table only returns same-depth or solved results, so searching with it,
+# or with a table filled by deeper and shallower searches, never changes a
+# search's value or action
+def test_tt_never_changes_search_results():
+    rng = random.Random(3)
+    for _ in range(8):
+        board, player = random_position(rng)
+        if board.at_terminal_state():
+            continue
+        table = game.TranspositionTable(1)
+        for depth in (4, 2, 3):
+            results = []
+            for options in ({"tt_size_mb": 0}, {"tt": table}):
+                agent = Agent(depth, player, other_player(player), **options)
+                agent.search_depth = agent.depth
+                result = agent.search_root(player, board)
+                results.append((result["value"], result["action"]))
+            assert results[0] == results[1]
+        assert table.hits > 0
+
+
+# a quiet self-play game prints the result and nothing else
+def test_quiet_agent_vs_agent_prints_only_the_result(capsys):
+    game.Game(renderer=game.Renderer(quiet=True)).run_agent_vs_agent()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "Scores"
+    assert lines[-1] in ("Red won!", "Blue won!", "Tie!")
+    assert len(lines) == 4
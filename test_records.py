@@ -0,0 +1,88 @@
+import gzip
+import json
+import random
+
+import pytest
+
+from game import Board, apply_move
+from records import GameStats, main, make_record, position_batches, read_records, write_record
+
+
+def random_record(rng, pits_per_side=6):
+    board = Board(pits_per_side)
+    moves = []
+    player = 'B'
+    while not board.at_terminal_state():
+        pit_num = rng.choice(board.get_legal_actions(player))
+        moves.append((pit_num, player))
+        player = apply_move(board, pit_num, player)
+    return make_record(board, moves)
+
+
+# two good records around lines that aren't records, ending in a truncated one
+def write_archive(path):
+    rng = random.Random(0)
+    with open(path, "w") as f:
+        write_record(f, random_record(rng))
+        f.write("[1, 2, 3]\n")
+        f.write(json.dumps(dict(random_record(rng), version=99)) + "\n")
+        write_record(f, random_record(rng))
+        f.write(json.dumps(random_record(rng))[:40])
+
+
+def test_read_records_skips_bad_lines(tmp_path):
+    path = str(tmp_path / "games.jsonl")
+    write_archive(path)
+    with pytest.raises(ValueError):
+        list(read_records(path))
+
+    skipped = []
+    assert len(list(read_records(path, skipped))) == 2
+    assert [message.split(":")[1] for message in skipped] == ["2", "3", "5"]
+
+
+def test_read_records_skips_truncated_gzip(tmp_path):
+    path = str(tmp_path / "games.jsonl.gz")
+    with gzip.open(path, "wt") as f:
+        for _ in range(20):
+            write_record(f, random_record(random.Random(0)))
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:len(data) // 2])
+
+    skipped = []
+    list(read_records(path, skipped))
+    assert len(skipped) == 1
+
+
+def test_stats_counts_bad_lines_as_invalid(tmp_path, capsys):
+    path = str(tmp_path / "games.jsonl")
+    write_archive(path)
+    main(["stats", path])
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["games"] == 2
+    assert stats["invalid"] == 3
+
+
+# records that don't replay, or aren't Kalah(6, 4), add no positions
+def test_position_batches_skips_bad_records():
+    rng = random.Random(1)
+    good = random_record(rng)
+    illegal = dict(good, moves=good["moves"] + good["moves"])
+    records = [good, illegal, random_record(rng, pits_per_side=4), {"version": 1}, good]
+    with pytest.raises(ValueError):
+        list(position_batches(records))
+
+    skipped = []
+    positions = [position for batch in position_batches(records, skipped=skipped) for position in batch]
+    assert len(skipped) == 3
+    assert len(positions) == 2 * len(good["moves"])
+    assert {position[0] for position in positions} == {0, 4}
+
+
+def test_game_stats_counts_invalid_records():
+    stats = GameStats()
+    stats.add(random_record(random.Random(2)))
+    stats.add({"version": 1, "moves": "9"})
+    assert (stats.games, stats.invalid) == (1, 1)
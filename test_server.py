@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from server import GameServer
+
+
+def run_command(line):
+    game_server = GameServer(workers=1, time_budget_ms=100)
+    try:
+        return asyncio.run(game_server.handle(line))
+    finally:
+        game_server.close()
+
+
+# A game can't ask for an unbounded (or no) search
+@pytest.mark.parametrize("budget", ["nan", "inf", "-inf", "0", "-5", "fast", ""])
+def test_new_game_rejects_bad_time_budget(budget):
+    response = run_command(f"new side=A time_budget_ms={budget}")
+    assert response == {"error": "time_budget_ms must be a positive number"}
+
+
+# A game may ask for less than the server's budget, but not more
+def test_new_game_caps_time_budget():
+    game_server = GameServer(workers=1, time_budget_ms=100)
+    try:
+        for budget, expected in (("50", 50.0), ("1e9", 100.0)):
+            response = asyncio.run(game_server.handle(f"new time_budget_ms={budget}"))
+            assert game_server.sessions[response["game"]].time_budget_ms == expected
+    finally:
+        game_server.close()
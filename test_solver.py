@@ -0,0 +1,67 @@
+import pytest
+
+from game import Board, apply_move
+from solver import Solver
+
+VARIANTS = [(2, 2), (3, 2), (2, 3), (3, 3)]
+
+
+# Final store difference (B minus A) of board under perfect play, by plain
+# minimax over the game's own rules (memoized, as the variants are tiny)
+def minimax(board: Board, player, memo):
+    key = (tuple(board.board), player)
+    if key in memo:
+        return memo[key]
+    if board.at_terminal_state():
+        scores = board.tally_up()
+        value = scores['B'] - scores['A']
+    else:
+        values = []
+        for pit_num in board.get_legal_actions(player):
+            child = Board(board.pits_per_side, board.seeds_per_pit)
+            child.board = list(board.board)
+            values.append(minimax(child, apply_move(child, pit_num, player), memo))
+        value = max(values) if player == 'B' else min(values)
+    memo[key] = value
+    return value
+
+
+# the value of the start position and the opening pits (1-based) achieving it
+def solve_by_minimax(pits_per_side, seeds_per_pit):
+    memo = {}
+    start = Board(pits_per_side, seeds_per_pit)
+    value = minimax(start, 'B', memo)
+    moves = []
+    for pit_num in start.get_legal_actions('B'):
+        child = Board(pits_per_side, seeds_per_pit)
+        child.board = list(start.board)
+        if minimax(child, apply_move(child, pit_num, 'B'), memo) == value:
+            moves.append(pit_num + 1)
+    return value, moves
+
+
+@pytest.mark.parametrize("pits_per_side, seeds_per_pit", VARIANTS)
+def test_mtdf_matches_minimax(pits_per_side, seeds_per_pit):
+    assert Solver(pits_per_side, seeds_per_pit).solve() == solve_by_minimax(pits_per_side, seeds_per_pit)
+
+
+# endgame values and a table too small to keep give the same answer
+@pytest.mark.parametrize("pits_per_side, seeds_per_pit", VARIANTS)
+def test_mtdf_with_endgame_and_small_table(pits_per_side, seeds_per_pit):
+    solver = Solver(pits_per_side, seeds_per_pit, endgame_seeds=4, tt_entries=16)
+    assert solver.solve() == solve_by_minimax(pits_per_side, seeds_per_pit)
+    assert solver.endgame_hits > 0
+
+
+# a solve started from a finished solve's checkpoint needs no new MTD(f) passes
+def test_checkpoint_resume(tmp_path):
+    path = str(tmp_path / "solve.ckpt")
+    first = Solver(3, 3, checkpoint_path=path).solve()
+    resumed = Solver(3, 3, checkpoint_path=path)
+    passes = []
+    resumed.progress = passes.append
+    assert resumed.solve() == first
+    assert passes == []
+
+    with pytest.raises(ValueError):
+        Solver(3, 2, checkpoint_path=path).solve()
@@ -0,0 +1,247 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from game import Agent, Board, apply_move, other_player
+from mcts import MCTSAgent
+from records import make_record, open_archive, write_record
+
+# == Headless self-play =======================================================
+
+# settings used for any key an agent spec leaves out; "agent" picks the
+# alpha-beta Agent or the MCTSAgent (which uses iterations instead of depth)
+DEFAULT_AGENT = {"agent": "alphabeta", "depth": 4, "evaluation": "research", "time_budget_ms": None,
+                 "tt_size_mb": 16, "endgame_path": None, "book_path": None, "cache_path": None,
+                 "iterations": None, "weights_path": None, "pvs": 0, "aspiration": 0, "lmr": 0}
+AGENT_TYPES = ("alphabeta", "mcts")
+
+
+# Parses an agent spec like "depth=6,evaluation=basic,time_budget_ms=200"
+# or "agent=mcts,iterations=5000"
+def parse_agent_spec(spec):
+    config = dict(DEFAULT_AGENT)
+    if not spec:
+        return config
+
+    for item in spec.split(","):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key not in DEFAULT_AGENT:
+            raise ValueError(f"Unknown agent setting: {key}")
+        if key == "agent":
+            if value.strip() not in AGENT_TYPES:
+                raise ValueError(f"Unknown agent type: {value.strip()}")
+            config[key] = value.strip()
+        elif key in ("evaluation", "endgame_path", "book_path", "cache_path", "weights_path"):
+            config[key] = value.strip() or None
+        elif value.strip().lower() in ("", "none"):
+            config[key] = None
+        else:
+            config[key] = float(value) if key == "time_budget_ms" else int(value)
+    # Agent refuses this too, but only once a worker builds it
+    if config["endgame_path"] and config["evaluation"] != "research":
+        raise ValueError(f"endgame_path only works with evaluation=research, not {config['evaluation']}")
+    return config
+
+
+def make_agent(config, side, seed):
+    if config["agent"] == "mcts":
+        return MCTSAgent(side, other_player(side), config["iterations"], config["time_budget_ms"], seed=seed)
+    return Agent(config["depth"], side, other_player(side),
+                 tt_size_mb=config["tt_size_mb"], evaluation=config["evaluation"],
+                 endgame_path=config["endgame_path"], book_path=config["book_path"],
+                 cache_path=config["cache_path"], weights=config["weights_path"],
+                 pvs=bool(config["pvs"]), aspiration=bool(config["aspiration"]), lmr=bool(config["lmr"]))
+
+
+# Plays random legal moves from the starting position. Returns the moves made
+# (board indices) and the player to move next, or None if the game ended
+# during the opening.
+def random_opening(board: Board, plies, rng, players=None):
+    moves = []
+    player = 'B'
+    for _ in range(plies):
+        if board.at_terminal_state():
+            return None
+        pit_num = rng.choice(board.get_legal_actions(player))
+        moves.append(pit_num)
+        if players is not None:
+            players.append(player)
+        player = apply_move(board, pit_num, player)
+    if board.at_terminal_state():
+        return None
+    return moves, player
+
+
+# Plays one game without printing, with agent1 on agent1_side ('B' moves
+# first) and agent2 on the other side. Returns a JSON-serializable result;
+# with record set, it includes the whole game as a game record (see
+# records.py) under "record".
+def play_game(game_id, agent1, agent2, agent1_side, opening_plies, opening_seed, record=False):
+    rng = random.Random(opening_seed)
+    board = Board()
+    opening_players = []
+    opening = random_opening(board, opening_plies, rng, opening_players)
+    while opening is None:
+        board = Board()
+        opening_players = []
+        opening = random_opening(board, opening_plies, rng, opening_players)
+    opening_moves, player = opening
+    moves = list(zip(opening_moves, opening_players))
+
+    seats = {'B': agent1, 'A': agent2}
+    if agent1_side != 'B':
+        seats = {'B': agent2, 'A': agent1}
+    agents = {side: make_agent(config, side, opening_seed) for side, config in seats.items()}
+    labels = {agent1_side: "agent1", other_player(agent1_side): "agent2"}
+
+    tic = time.perf_counter()
+    num_moves = 0
+    nodes = {"agent1": 0, "agent2": 0}
+    while not board.at_terminal_state():
+        agent = agents[player]
+        pit_num = agent.get_next_action(board, seats[player]["time_budget_ms"])
+        nodes[labels[player]] += agent.nodes
+        moves.append((pit_num, player))
+        player = apply_move(board, pit_num, player)
+        num_moves += 1
+    toc = time.perf_counter()
+
+    for agent in agents.values():
+        agent.close()
+
+    scores = board.tally_up()
+    winner = None
+    if scores['A'] != scores['B']:
+        winner = labels['A'] if scores['A'] > scores['B'] else labels['B']
+
+    result = {
+        "game": game_id,
+        "agent1_side": agent1_side,
+        "opening": opening_moves,
+        "scores": {labels['B']: scores['B'], labels['A']: scores['A']},
+        "winner": winner,
+        "moves": num_moves,
+        "nodes": nodes,
+        "seconds": toc - tic,
+    }
+    if record:
+        result["record"] = make_record(board, moves, {
+            "game": game_id, "players": {'B': seats['B'], 'A': seats['A']},
+            "opening_plies": opening_plies, "opening_seed": opening_seed,
+        })
+    return result
+
+
+# 95% Wilson score interval for a proportion
+def wilson_interval(successes, n, z=1.96):
+    if n == 0:
+        return (0.0, 0.0)
+    p = successes / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return (centre - half, centre + half)
+
+
+# Win/draw/loss rates from agent1's point of view, with confidence intervals
+def summarize(results):
+    n = len(results)
+    wins = sum(1 for result in results if result["winner"] == "agent1")
+    losses = sum(1 for result in results if result["winner"] == "agent2")
+    draws = n - wins - losses
+
+    # score: 1 per win, 0.5 per draw; normal-approximation interval
+    score = (wins + 0.5 * draws) / n if n else 0.0
+    variance = ((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2
+                 + losses * score ** 2) / n) if n else 0.0
+    half = 1.96 * math.sqrt(variance / n) if n else 0.0
+
+    summary = {"games": n, "score": score, "score_ci": (score - half, score + half)}
+    for name, count in (("win", wins), ("draw", draws), ("loss", losses)):
+        summary[name] = count
+        summary[f"{name}_rate"] = count / n if n else 0.0
+        summary[f"{name}_ci"] = wilson_interval(count, n)
+    return summary
+
+
+# play_game arguments for every game of a match. Each random opening is
+# played twice, with the agents swapping sides.
+def game_specs(agent1, agent2, games, opening_plies=4, seed=0, record=False):
+    specs = []
+    for game_id in range(games):
+        agent1_side = 'B' if game_id % 2 == 0 else 'A'
+        specs.append((game_id, agent1, agent2, agent1_side, opening_plies, seed * 1000003 + game_id // 2, record))
+    return specs
+
+
+# Plays games between agent1 and agent2 across worker processes (see
+# game_specs). Results are written to output (a file object) as JSON lines as
+# soon as each game finishes, and game records to records (another file
+# object), if given.
+def run_tournament(agent1, agent2, games, workers=None, opening_plies=4, seed=0, output=None, records=None):
+    specs = game_specs(agent1, agent2, games, opening_plies, seed, records is not None)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(play_game, *spec) for spec in specs]
+        for future in as_completed(futures):
+            result = future.result()
+            if records is not None:
+                write_record(records, result.pop("record"))
+            results.append(result)
+            if output is not None:
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+
+    return summarize(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play agent-vs-agent mancala games without a display.")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--agent1", default="", help='e.g. "depth=4,evaluation=research,time_budget_ms=100"')
+    parser.add_argument("--agent2", default="", help='same format as --agent1, or e.g. "agent=mcts,iterations=5000"')
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--opening-plies", type=int, default=4, help="random moves before the agents take over")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random openings")
+    parser.add_argument("--output", help="JSON lines file for per-game results (default: stdout)")
+    parser.add_argument("--record", help="game record archive to write every game to (see records.py)")
+    args = parser.parse_args(argv)
+
+    agent1 = parse_agent_spec(args.agent1)
+    agent2 = parse_agent_spec(args.agent2)
+
+    output = sys.stdout
+    if args.output:
+        output = open(args.output, "w")
+    records = None
+    if args.record:
+        records = open_archive(args.record, "w")
+    try:
+        summary = run_tournament(agent1, agent2, args.games, args.workers,
+                                 args.opening_plies, args.seed, output, records)
+    finally:
+        if args.output:
+            output.close()
+        if records is not None:
+            records.close()
+
+    print(f"agent1: {agent1}", file=sys.stderr)
+    print(f"agent2: {agent2}", file=sys.stderr)
+    print(f"games: {summary['games']}", file=sys.stderr)
+    for name in ("win", "draw", "loss"):
+        low, high = summary[f"{name}_ci"]
+        print(f"agent1 {name}: {summary[name]} ({summary[f'{name}_rate']:.3f}, 95% CI {low:.3f}-{high:.3f})",
+              file=sys.stderr)
+    low, high = summary["score_ci"]
+    print(f"agent1 score: {summary['score']:.3f} (95% CI {low:.3f}-{high:.3f})", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from evaluation import DEFAULT_WEIGHTS, save_weights
+from game import Agent, Board, FEATURE_NAMES, TranspositionTable, apply_move, other_player
+from tournament import random_opening
+
+# == Weight tuning =============================================================
+
+# Fits the weights of the 'features' evaluation (see evaluation.py) Texel-style:
+# play self-play games, label every position with the game's result for B
+# (1 win, 0.5 draw, 0 loss), and fit a logistic regression from B's feature
+# values to those results. The fitted evaluation is then the log-odds of B's
+# expected score, and the search simply maximizes it.
+#
+# The games are played in worker processes. The regression uses Newton's
+# method, with each iteration's gradient and Hessian summed over shards of the
+# positions in the same workers. There are only a handful of weights, so it
+# converges in a few iterations with no learning rate to tune.
+
+NEWTON_TOLERANCE = 1e-7
+MAX_NEWTON_ITERATIONS = 50
+
+
+# Plays one self-play game between depth-limited agents from a random
+# opening. Every move after the opening is random with probability
+# random_move_rate, so the positions don't all follow the agents' favourite
+# lines. Returns [(B's feature values, B's result)] for every position after
+# the opening.
+def self_play(seed, depth, opening_plies, random_move_rate, evaluation):
+    rng = random.Random(seed)
+    board = Board()
+    opening = random_opening(board, opening_plies, rng)
+    while opening is None:
+        board = Board()
+        opening = random_opening(board, opening_plies, rng)
+    _, player = opening
+
+    # the two seats have the same settings, so they share a transposition table
+    tt = TranspositionTable()
+    agents = {side: Agent(depth, side, other_player(side), evaluation=evaluation, tt=tt) for side in ('B', 'A')}
+    features = []
+    while not board.at_terminal_state():
+        features.append(board.feature_values('B'))
+        if rng.random() < random_move_rate:
+            pit_num = rng.choice(board.get_legal_actions(player))
+        else:
+            pit_num = agents[player].get_next_action(board)
+        player = apply_move(board, pit_num, player)
+    features.append(board.feature_values('B'))
+
+    scores = board.tally_up()
+    result = 0.5
+    if scores['B'] != scores['A']:
+        result = 1.0 if scores['B'] > scores['A'] else 0.0
+    return [(values, result) for values in features]
+
+
+def sigmoid(x):
+    if x >= 0:
+        return 1.0 / (1.0 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1.0 + z)
+
+
+# (log loss, gradient, Hessian) of the logistic regression over samples
+def newton_terms(samples, weights):
+    n = len(weights)
+    loss = 0.0
+    gradient = [0.0] * n
+    hessian = [[0.0] * n for _ in range(n)]
+    for values, result in samples:
+        p = sigmoid(sum(w * v for w, v in zip(weights, values)))
+        # clamp so a confident, wrong prediction doesn't take log(0)
+        p_clamped = min(max(p, 1e-12), 1 - 1e-12)
+        loss -= result * math.log(p_clamped) + (1 - result) * math.log(1 - p_clamped)
+        error = p - result
+        curvature = p * (1 - p)
+        for i in range(n):
+            gradient[i] += error * values[i]
+            scaled = curvature * values[i]
+            row = hessian[i]
+            for j in range(i + 1):
+                row[j] += scaled * values[j]
+    for i in range(n):
+        for j in range(i):
+            hessian[j][i] = hessian[i][j]
+    return loss, gradient, hessian
+
+
+# solves matrix * x = vector by Gaussian elimination with partial pivoting
+def solve(matrix, vector):
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            raise ValueError("Features are linearly dependent; add regularization")
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(col + 1, n):
+            factor = rows[r][col] / rows[col][col]
+            for c in range(col, n + 1):
+                rows[r][c] -= factor * rows[col][c]
+    x = [0.0] * n
+    for r in reversed(range(n)):
+        x[r] = (rows[r][n] - sum(rows[r][c] * x[c] for c in range(r + 1, n))) / rows[r][r]
+    return x
+
+
+# Newton's method on the L2-regularized log loss, each iteration's sums split
+# over the shards in pool. Returns the weights as a list in FEATURE_NAMES order.
+def fit(shards, pool, l2=1.0, progress=None):
+    n = len(FEATURE_NAMES)
+    weights = [0.0] * n
+    for iteration in range(MAX_NEWTON_ITERATIONS):
+        loss = 0.0
+        gradient = [l2 * w for w in weights]
+        hessian = [[l2 if i == j else 0.0 for j in range(n)] for i in range(n)]
+        for shard_loss, shard_gradient, shard_hessian in pool.map(newton_terms, shards, [weights] * len(shards)):
+            loss += shard_loss
+            for i in range(n):
+                gradient[i] += shard_gradient[i]
+                for j in range(n):
+                    hessian[i][j] += shard_hessian[i][j]
+
+        step = solve(hessian, gradient)
+        weights = [w - s for w, s in zip(weights, step)]
+        if progress:
+            progress(iteration, loss)
+        if max(abs(s) for s in step) < NEWTON_TOLERANCE:
+            break
+    return weights
+
+
+# (mean log loss, share of decisive positions whose winner the evaluation's
+# sign gets right) of weights over samples
+def score(samples, weights):
+    loss = 0.0
+    correct = 0
+    decisive = 0
+    for values, result in samples:
+        value = sum(w * v for w, v in zip(weights, values))
+        p = min(max(sigmoid(value), 1e-12), 1 - 1e-12)
+        loss -= result * math.log(p) + (1 - result) * math.log(1 - p)
+        if result != 0.5:
+            decisive += 1
+            correct += (value > 0) == (result == 1.0)
+    return loss / len(samples), correct / decisive if decisive else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit evaluation feature weights to self-play results.")
+    parser.add_argument("--games", type=int, default=2000, help="self-play games to learn from")
+    parser.add_argument("--depth", type=int, default=3, help="search depth of the self-play agents")
+    parser.add_argument("--evaluation", default="research", help="evaluation the self-play agents use")
+    parser.add_argument("--opening-plies", type=int, default=4, help="random moves at the start of each game")
+    parser.add_argument("--random-move-rate", type=float, default=0.05,
+                        help="chance of a random move later in the game")
+    parser.add_argument("--validation", type=float, default=0.2, help="share of games held out for scoring")
+    parser.add_argument("--l2", type=float, default=1.0, help="L2 regularization strength")
+    parser.add_argument("--workers", type=int, help="processes (default: all CPUs)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="weights.json", help="where to write the fitted weights")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or os.cpu_count()
+    tic = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        seeds = [args.seed * 1000003 + game for game in range(args.games)]
+        games = list(pool.map(self_play, seeds, [args.depth] * args.games, [args.opening_plies] * args.games,
+                              [args.random_move_rate] * args.games, [args.evaluation] * args.games,
+                              chunksize=max(1, args.games // 64)))
+
+        # hold out whole games, so validation positions aren't near-copies of
+        # training ones
+        num_validation = int(args.games * args.validation)
+        training = [sample for game in games[num_validation:] for sample in game]
+        validation = [sample for game in games[:num_validation] for sample in game]
+        print(f"{len(training):,} training and {len(validation):,} validation positions from "
+              f"{args.games} games ({time.perf_counter() - tic:.1f} s)")
+
+        num_shards = 4 * workers
+        shards = [training[i::num_shards] for i in range(num_shards)]
+
+        def progress(iteration, loss):
+            print(f"iteration {iteration}: mean log loss {loss / len(training):.5f}")
+
+        weights = fit(shards, pool, args.l2, progress)
+
+    fitted = dict(zip(FEATURE_NAMES, weights))
+    for name, weight in fitted.items():
+        print(f"{name:16} {weight:9.5f}")
+    for name, candidate in (("default", [DEFAULT_WEIGHTS.get(name, 0.0) for name in FEATURE_NAMES]),
+                            ("fitted", weights)):
+        if validation:
+            loss, accuracy = score(validation, candidate)
+            print(f"{name:8} validation log loss {loss:.5f}, winner predicted {accuracy:.1%}")
+
+    save_weights(args.output, {name: round(weight, 5) for name, weight in fitted.items()})
+    print(f"wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()